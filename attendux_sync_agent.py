@@ -6,23 +6,52 @@ Desktop application for syncing ZKTeco devices with Attendux cloud
 Multi-tenant support - each company syncs only their own devices
 """
 
+import time
+_PROCESS_STARTED = time.perf_counter()  # Cold-start reference, taken before the heavy imports
+
 import sys
 import json
 import os
+import queue
+import socket
+import threading
+import math
+import uuid
+import hashlib
+import hmac
+import gzip
+import zlib
+import base64
+import tempfile
+import struct
+import mmap
+import re
+import tracemalloc
 import requests
 import platform
-from datetime import datetime
+import argparse
+import importlib.util
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtNetwork import *
 
-# Try to import QWebEngineView, but make it optional for Windows
+# QtWebEngine is only imported by the dashboard process (see run_dashboard_process);
+# the agent itself just checks that it is installed
 try:
-    from PyQt5.QtWebEngineWidgets import QWebEngineView
-    WEBENGINE_AVAILABLE = True
-except ImportError:
+    WEBENGINE_AVAILABLE = importlib.util.find_spec('PyQt5.QtWebEngineWidgets') is not None
+except (ImportError, ValueError):
     WEBENGINE_AVAILABLE = False
+if not WEBENGINE_AVAILABLE:
     print("Warning: QtWebEngine not available. Dashboard will open in external browser.")
 
 # Platform-specific startup imports
@@ -40,9 +69,18 @@ else:
 # macOS uses plist files for login items
 MACOS_STARTUP_AVAILABLE = (PLATFORM == 'Darwin')
 
+# MessagePack upload encoding; a pure-Python encoder is used without it
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
 # Try to import ZK library, but make it optional for building
 try:
     from zk import ZK
+    from zk import const as zk_const
+    from zk.exception import ZKErrorResponse
     ZK_AVAILABLE = True
 except ImportError:
     ZK_AVAILABLE = False
@@ -61,10 +99,135 @@ BRAND_GRAY_800 = "#1f2937"
 
 # API Configuration
 API_BASE_URL = "https://app.attendux.com/api/sync"
+DASHBOARD_URL = "https://app.attendux.com"
+DASHBOARD_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Persistent disk cache for dashboard assets
+DASHBOARD_PREWARM_DELAY_MS = 15000  # Idle time after connect before preloading the dashboard
 LOGO_URL = "https://app.attendux.com/public/storage/logo.png"
 
+# Sync pacing
+# Each agent syncs at a fixed, license-derived phase inside the interval so a fleet
+# that boots together (power outage, office opening) spreads its load evenly.
+STARTUP_SYNC_SPREAD_SECONDS = 120  # First sync after restart lands in this window
+SERVER_HINT_SPREAD_SECONDS = 30    # Extra spread after a server-imposed wait
+MIN_SYNC_GAP_SECONDS = 60          # Never schedule two auto-syncs closer than this
+
+# LAN peers: agents of the same license split the devices between them
+PEER_GROUP_ADDRESS = "239.255.77.31"   # Site-local multicast, TTL 1
+PEER_PORT = 45731
+PEER_HEARTBEAT_SECONDS = 10
+PEER_TIMEOUT_SECONDS = 35              # A silent peer's devices move to the others after this
+PEER_MESSAGE_MAX_AGE_SECONDS = 60      # Older (or future-dated) messages are dropped as replays
+PEER_DROP_AFTER_FAILURES = 3           # Failed reads in a row before a device is left to the peers
+PEER_DROP_SECONDS = 1800               # How long they poll it before this agent tries again
+STARTUP_FIRST_SYNC_BUDGET_SECONDS = 150  # Process start to first completed auto-sync
+
+# Tray idle mode (window hidden)
+IDLE_LOG_BUFFER_LINES = 500        # Log lines kept for the next time the window is shown
+IDLE_SAMPLE_MS = 60 * 60 * 1000    # Wakeup/RSS sample interval while hidden
+IDLE_SAMPLES_KEPT = 48             # Hourly samples kept for diagnostics
+
+# Sync pipeline
+PIPELINE_QUEUE_DEPTH = 4   # Fetched batches allowed to wait for the uploader
+STREAM_BATCH_SIZE = 1000   # Records decoded per batch while streaming a device log
+UPLOAD_CHUNK_SIZE = 500   # Records per POST /attendance; progress is checkpointed per chunk
+UPLOAD_FLUSH_SECONDS = 2.0  # Longest a partial batch waits for other devices' records
+CANCEL_POLL_SECONDS = 0.05
+SYNC_STOP_DEADLINE_MS = 500  # How long stop/quit waits for the worker to wind down
+
+# Sync watchdog: deadline budgets for device sessions and whole cycles
+DEVICE_DEADLINE_BASE_SECONDS = 120        # Connect + read budget per device...
+DEVICE_DEADLINE_PER_1000_RECORDS = 3      # ...plus this per 1000 records the clock last reported
+CYCLE_DEADLINE_SECONDS = 30 * 60          # No new devices are started after this
+CYCLE_ABANDON_GRACE_SECONDS = 30          # Then a read that ignores the abort is left behind
+WATCHDOG_POLL_SECONDS = 1.0
+WORKER_ABANDON_SECONDS = CYCLE_DEADLINE_SECONDS + 5 * 60  # A worker still running after this is replaced
+QUARANTINE_AFTER_STALLS = 3               # Consecutive stalls before a device is skipped
+QUARANTINE_BASE_SECONDS = 60 * 60         # First quarantine; doubles on each repeat
+QUARANTINE_MAX_SECONDS = 24 * 60 * 60
+
+# Shared background task pool (license checks, device list, logo)
+TASK_POOL_WORKERS = 4
+EVENT_BUS_INTERVAL_MS = 100      # Sync events reach the UI at most this often
+EVENT_BUS_MAX_LOG_LINES = 50     # Log lines per UI snapshot; the rest are counted as dropped
+
 # Settings file
-SETTINGS_FILE = os.path.join(os.path.expanduser("~"), ".attendux_sync", "settings.json")
+APP_DIR = os.path.join(os.path.expanduser("~"), ".attendux_sync")
+SETTINGS_FILE = os.path.join(APP_DIR, "settings.json")
+CHECKPOINT_FILE = os.path.join(APP_DIR, "sync_checkpoint.json")
+DEVICE_PROFILES_FILE = os.path.join(APP_DIR, "device_profiles.json")
+DEVICE_CONNECT_TIMEOUT = 5          # Seconds per device connect attempt
+DEVICE_LOG_FULL_WARNING = 0.9       # Warn when a clock's attendance log is this full
+DEVICE_HEALTH_FILE = os.path.join(APP_DIR, "device_health.json")
+DIAGNOSTICS_FILE = os.path.join(APP_DIR, "diagnostics.json")
+HISTORY_FILE = os.path.join(APP_DIR, "sync_history.jsonl")
+HISTORY_RETENTION_DAYS = 90               # Runs older than this are dropped on compaction
+HISTORY_COMPACT_BYTES = 5 * 1024 * 1024   # Compact once the history file grows past this
+
+# Per-cycle device order; 'priority' and 'freshness_minutes' can be set per device by the
+# cloud or locally in settings 'device_priority' / 'device_freshness_minutes' (by device id)
+SCHEDULE_RATE_DAYS = 7           # History window for each device's punch rate
+DEVICE_FRESHNESS_MINUTES = 30    # Default freshness target: longest a device should go unsynced
+DEVICE_PRIORITY_DEFAULT = 1
+DEVICE_FRESHNESS_MIN_SECONDS = 60
+
+# Opt-in sync profiling: ATTENDUX_PROFILE=1, --profile, or settings 'profile_syncs'
+PROFILE_DIR = os.path.join(APP_DIR, "profiles")
+PROFILE_ENV_VAR = "ATTENDUX_PROFILE"
+PROFILE_SAMPLE_SECONDS = 0.01      # CPU sampling interval
+PROFILE_MAX_STACK_DEPTH = 64       # Frames kept per sampled stack
+PROFILE_MAX_SAMPLES = 100000       # Per run; sampling stops after this
+PROFILE_TOP_ALLOCATIONS = 25       # Allocation sites in the allocation report
+PROFILE_KEEP_RUNS = 10             # Profiled runs kept on disk (oldest deleted)
+
+# Chrome trace timelines, one file per sync run / connect
+TRACE_DIR = os.path.join(APP_DIR, "traces")
+TRACE_KEEP_FILES = 20
+
+CAPTURE_FORMAT_VERSION = 1   # --capture / --replay file layout
+
+# Attendance upload wire formats; the server lists what it accepts in /verify 'upload_formats'
+WIRE_FORMAT_JSON = 'json'
+WIRE_FORMAT_MSGPACK = 'msgpack'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+
+# Local punch archive: ARCHIVE_DIR/<device key>/<YYYY-MM-DD>.dat (+ .idx)
+ARCHIVE_DIR = os.path.join(APP_DIR, "archive")
+ARCHIVE_STATE_FILE = os.path.join(ARCHIVE_DIR, "archive_state.json")
+ARCHIVE_EPOCH = datetime(2000, 1, 1)                   # Timestamps are stored as seconds since this
+ARCHIVE_RECORD = struct.Struct('<24sIBB2x')            # employee, seconds, status, punch (32 bytes)
+ARCHIVE_INDEX_HEADER = struct.Struct('<4sII')          # magic, .dat records covered, entries
+ARCHIVE_INDEX_ENTRY = struct.Struct('<24sII')          # employee, seconds, record number
+ARCHIVE_INDEX_MAGIC = b'AXI1'
+ARCHIVE_MAX_SECONDS = 0xFFFFFFFF                        # Last storable timestamp (2136)
+ARCHIVE_EMPLOYEE_BYTES = 24
+
+# Backfill lane: a device far behind uploads recent punches in the sync cycle and
+# the rest from the archive, throttled, while no sync cycle is running
+BACKFILL_FILE = os.path.join(APP_DIR, "backfill.json")
+BACKFILL_AFTER_HOURS = 24                 # Punches older than this go to backfill when a device is behind
+BACKFILL_MAX_BYTES_PER_SECOND = 64 * 1024  # Settings 'backfill_kbps' overrides
+BACKFILL_MAX_REQUESTS_PER_MINUTE = 30     # Settings 'backfill_requests_per_minute' overrides
+BACKFILL_POLL_SECONDS = 0.5               # Pause check while a sync cycle runs
+BACKFILL_RETRY_SECONDS = (15, 60, 300)    # Back-off before each retry of a failed chunk; then the lane stops
+
+# Site roles (settings 'role'): 'standalone' (default), 'aggregator' or 'edge'.
+# Edge agents post attendance to settings 'uplink_url' (an aggregator's
+# http://host:port/api/sync) instead of API_BASE_URL.
+ROLE_STANDALONE = 'standalone'
+ROLE_AGGREGATOR = 'aggregator'
+ROLE_EDGE = 'edge'
+AGGREGATOR_PORT = 45780
+SPOOL_DIR = os.path.join(APP_DIR, "spool")
+SPOOL_SEGMENT_BYTES = 8 * 1024 * 1024       # Spool file size before starting a new one
+SPOOL_MAX_BYTES = 1024 * 1024 * 1024        # Edges are asked to retry later beyond this
+INGEST_MAX_BODY_BYTES = 8 * 1024 * 1024     # Larger edge requests, sent or decompressed, get 413
+AGGREGATOR_BATCH_RECORDS = 5000             # Records per gzip upload to the cloud
+AGGREGATOR_FLUSH_SECONDS = 30               # Longest spooled records wait for a full batch
+AGGREGATOR_RETRY_SECONDS = (15, 30, 60, 120, 300)  # Back-off after failed uploads
+DEAD_LETTER_FILE = os.path.join(APP_DIR, "spool_dead_letter.jsonl")  # Records the cloud rejected for good
+
+# USB attlog imports
+ATTLOG_PROGRESS_SECONDS = 5   # Progress line interval during an import
 
 # Translations
 TRANSLATIONS = {
@@ -90,6 +253,7 @@ TRANSLATIONS = {
         'auto_sync': 'مزامنة تلقائية',
         'startup': 'بدء مع النظام',
         'notifications': 'إشعارات',
+        'prewarm_dashboard': 'تجهيز لوحة التحكم مسبقاً',
         'logs': 'السجلات',
         'clear_logs': 'مسح السجلات',
         'status_connected': 'متصل',
@@ -112,6 +276,7 @@ TRANSLATIONS = {
         'devices_cloud': 'الأجهزة (محملة من السحابة)',
         'refresh_from_cloud': '↻ تحديث من السحابة',
         'sync_now': '▶ مزامنة الآن',
+        'import_usb': '📥 استيراد ملف USB',
         'start_auto_sync': '⏱ بدء المزامنة التلقائية',
         'stop_auto_sync': '⏹ إيقاف المزامنة التلقائية',
         'activity_logs': 'سجل النشاط',
@@ -121,7 +286,24 @@ TRANSLATIONS = {
         'minutes': 'دقائق',
         'company_label': 'الشركة',
         'plan_label': 'الخطة',
-        'license_expires': 'انتهاء الترخيص'
+        'license_expires': 'انتهاء الترخيص',
+        'filter_devices': 'بحث في الأجهزة...',
+        'col_name': 'الاسم',
+        'col_address': 'العنوان',
+        'col_id': 'المعرف',
+        'col_status': 'الحالة',
+        'col_last_sync': 'آخر مزامنة',
+        'col_records': 'السجلات',
+        'col_latency': 'زمن الاستجابة',
+        'col_backfill': 'رفع السجلات القديمة',
+        'status_ok': 'تمت المزامنة',
+        'status_syncing': 'جاري المزامنة',
+        'status_connecting': 'جاري الاتصال',
+        'status_error': 'خطأ',
+        'status_unreachable': 'غير متاح',
+        'status_stalled': 'توقف أثناء القراءة',
+        'status_quarantined': 'معزول مؤقتاً',
+        'status_peer': 'يزامنه جهاز آخر'
     },
     'en': {
         'app_title': 'Attendux',
@@ -145,6 +327,7 @@ TRANSLATIONS = {
         'auto_sync': 'Auto Sync',
         'startup': 'Start with System',
         'notifications': 'Notifications',
+        'prewarm_dashboard': 'Preload Dashboard',
         'logs': 'Logs',
         'clear_logs': 'Clear Logs',
         'status_connected': 'Connected',
@@ -167,6 +350,7 @@ TRANSLATIONS = {
         'devices_cloud': 'Devices (Loaded from Cloud)',
         'refresh_from_cloud': '↻ Refresh from Cloud',
         'sync_now': '▶ Sync Now',
+        'import_usb': '📥 Import USB Log',
         'start_auto_sync': '⏱ Start Auto-Sync',
         'stop_auto_sync': '⏹ Stop Auto-Sync',
         'activity_logs': 'Activity Logs',
@@ -176,7 +360,24 @@ TRANSLATIONS = {
         'minutes': 'minutes',
         'company_label': 'Company',
         'plan_label': 'Plan',
-        'license_expires': 'License Expires'
+        'license_expires': 'License Expires',
+        'filter_devices': 'Filter devices...',
+        'col_name': 'Name',
+        'col_address': 'Address',
+        'col_id': 'ID',
+        'col_status': 'Status',
+        'col_last_sync': 'Last Sync',
+        'col_records': 'Records',
+        'col_latency': 'Latency',
+        'col_backfill': 'Backfill',
+        'status_ok': 'Synced',
+        'status_syncing': 'Syncing',
+        'status_connecting': 'Connecting',
+        'status_error': 'Error',
+        'status_unreachable': 'Unreachable',
+        'status_stalled': 'Stalled',
+        'status_quarantined': 'Quarantined',
+        'status_peer': 'Synced by another PC'
     }
 }
 
@@ -203,169 +404,4105 @@ class SettingsManager:
             'language': 'ar'  # Arabic as default
         }
     
-    @staticmethod
-    def save(settings):
-        """Save settings to file"""
-        os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
-        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(settings, f, indent=2, ensure_ascii=False)
-
-
-class AttenduxAPI:
-    """Handle API communication with Attendux cloud"""
+    @staticmethod
+    def save(settings):
+        """Save settings to file"""
+        os.makedirs(os.path.dirname(SETTINGS_FILE), exist_ok=True)
+        with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(settings, f, indent=2, ensure_ascii=False)
+
+
+class StartupTimer:
+    """Startup phase timings in ms since process start"""
+    
+    def __init__(self):
+        self.marks = {}  # phase -> ms, in the order phases were reached
+    
+    def mark(self, phase):
+        """Record a phase once; later calls keep the first time"""
+        if phase not in self.marks:
+            self.marks[phase] = int((time.perf_counter() - _PROCESS_STARTED) * 1000)
+        return self.marks[phase]
+    
+    def summary(self):
+        """'phase +delta ms' for each phase reached so far"""
+        parts = []
+        previous = 0
+        for phase, ms in self.marks.items():
+            parts.append(f"{phase} +{ms - previous} ms")
+            previous = ms
+        return ", ".join(parts)
+
+
+STARTUP = StartupTimer()
+
+
+def process_memory_mb(pid=None):
+    """Resident memory of a process in MB (this process by default), 0 if unknown"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except Exception:
+        pass
+    try:
+        with open(f"/proc/{pid or 'self'}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        pass
+    return 0.0
+
+
+def process_context_switches():
+    """Context switches of this process so far (a proxy for CPU wakeups), None if unknown"""
+    try:
+        import psutil
+        switches = psutil.Process().num_ctx_switches()
+        return switches.voluntary + switches.involuntary
+    except Exception:
+        pass
+    try:
+        total = 0
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(('voluntary_ctxt_switches:', 'nonvoluntary_ctxt_switches:')):
+                    total += int(line.split()[1])
+        return total
+    except Exception:
+        return None
+
+
+class IdleMonitor:
+    """CPU wakeups per minute and RSS drift while the window is hidden"""
+    
+    def __init__(self):
+        self.started = None
+        self.switches_start = None
+        self.rss_start = 0.0
+        self.samples = []  # Periodic measure() results, newest last
+    
+    def start(self):
+        self.started = time.time()
+        self.switches_start = process_context_switches()
+        self.rss_start = process_memory_mb()
+        self.samples = []
+    
+    def measure(self):
+        """Wakeups/min and RSS drift since start(), None when not idle"""
+        if self.started is None:
+            return None
+        minutes = max((time.time() - self.started) / 60, 1e-6)
+        switches = process_context_switches()
+        wakeups = None
+        if switches is not None and self.switches_start is not None:
+            wakeups = round((switches - self.switches_start) / minutes, 1)
+        rss = process_memory_mb()
+        return {
+            'idle_hours': round(minutes / 60, 2),
+            'wakeups_per_min': wakeups,
+            'rss_mb': round(rss, 1),
+            'rss_drift_mb': round(rss - self.rss_start, 1)
+        }
+    
+    def sample(self):
+        measurement = self.measure()
+        if measurement:
+            self.samples = (self.samples + [measurement])[-IDLE_SAMPLES_KEPT:]
+        return measurement
+    
+    def stop(self):
+        measurement = self.measure()
+        self.started = None
+        return measurement
+
+
+def device_key(device):
+    """Stable key for a device, matching the device_id sent with its records"""
+    return str(device.get('id', device['name']))
+
+
+def load_json_state(path, field, default):
+    """A field of a JSON state file (the whole object if field is None)
+    
+    Returns default when the file is missing, unreadable or holds something
+    of another type, so a damaged state file starts over instead of failing.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return default
+    value = state if field is None else state.get(field) if isinstance(state, dict) else None
+    return value if isinstance(value, type(default)) else default
+
+
+def atomic_write_json(path, data):
+    """Write a JSON state file through a unique temp file, so readers never see it half-written"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def punch_fingerprint(punch):
+    """Identity of one log record, used to check a checkpoint still matches the log"""
+    return f"{punch.user_id}|{punch.timestamp.isoformat()}"
+
+
+class SyncCheckpoint:
+    """Per-device upload progress, so an interrupted sync resumes where it stopped
+    
+    Progress is a position in the device's append-only attendance log: the
+    number of log records uploaded and a fingerprint of the last one, which
+    tells a grown log from one that was cleared and refilled. Punches are
+    never skipped for their timestamp, so back-dated ones (clock corrected
+    backwards, DST fall-back) are still sent.
+    """
+    
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.devices = load_json_state(path, 'devices', {})
+    
+    def position(self, device):
+        """(log records uploaded, fingerprint of the last one) for this device"""
+        entry = self.devices.get(device_key(device)) or {}
+        try:
+            return max(0, int(entry.get('log_count') or 0)), entry.get('last_record')
+        except (TypeError, ValueError):
+            return 0, None
+    
+    def advance(self, device, log_count, last_record, uploaded_through=None):
+        """Record that the device's first log_count log records are uploaded, and persist it"""
+        key = device_key(device)
+        with self._lock:
+            entry = self.devices.setdefault(key, {})
+            if log_count <= (entry.get('log_count') or 0):
+                return
+            entry['log_count'] = log_count
+            entry['last_record'] = last_record
+            current = entry.get('uploaded_through')
+            if uploaded_through and (not current or uploaded_through > current):
+                entry['uploaded_through'] = uploaded_through
+            entry['updated'] = datetime.now().isoformat()
+            self._save()
+    
+    def reset(self, device):
+        """The device log was cleared or rewritten: send it again from the start"""
+        key = device_key(device)
+        with self._lock:
+            entry = self.devices.setdefault(key, {})
+            entry['log_count'] = 0
+            entry.pop('last_record', None)
+            self._save()
+    
+    def _save(self):
+        """Atomically write the checkpoint file"""
+        atomic_write_json(self.path, {'devices': self.devices})
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, None if empty"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class SyncHistory:
+    """Append-only record of every sync run and its per-device outcome
+    
+    One JSON line per run in HISTORY_FILE. Runs older than retention_days
+    are dropped when the file is compacted, which happens once it grows
+    past HISTORY_COMPACT_BYTES (or on demand).
+    """
+    
+    def __init__(self, path=HISTORY_FILE, retention_days=HISTORY_RETENTION_DAYS):
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def run_record(result):
+        """Flatten a SyncWorker result into a history line"""
+        pipeline = result.get('pipeline', {})
+        return {
+            'timestamp': result['timestamp'],
+            'wall_seconds': pipeline.get('wall_seconds'),
+            'fetch_seconds': pipeline.get('fetch_seconds'),
+            'upload_seconds': pipeline.get('upload_seconds'),
+            'records': result.get('total_records', 0),
+            'synced': result.get('total_synced', 0),
+            'bytes': result.get('bytes_uploaded', 0),
+            'upload_requests': result.get('upload_requests', 0),
+            'cancelled': result.get('cancelled', False),
+            'stalls': result.get('stalls', []),
+            'quarantined': result.get('quarantined', []),
+            'cycle_expired': result.get('cycle_expired', False),
+            'errors': result.get('errors', []),
+            'devices': result.get('device_results', [])
+        }
+    
+    def append(self, result):
+        """Persist one run"""
+        line = json.dumps(self.run_record(result), ensure_ascii=False)
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            oversized = os.path.getsize(self.path) > HISTORY_COMPACT_BYTES
+        if oversized:
+            self.compact()
+    
+    def runs(self, days=None):
+        """Recorded runs, oldest first, optionally only the last `days` days"""
+        since = None
+        if days is not None:
+            since = datetime.fromtimestamp(time.time() - days * 86400).isoformat()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    continue  # Torn write from a crash; skip it
+                if since is None or run.get('timestamp', '') >= since:
+                    yield run
+    
+    def compact(self):
+        """Rewrite the file without runs older than the retention period"""
+        if not os.path.exists(self.path):
+            return 0
+        with self._lock:
+            kept = list(self.runs(self.retention_days))
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for run in kept:
+                    f.write(json.dumps(run, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+        return len(kept)
+    
+    def slowest_devices(self, days=7, limit=5):
+        """Devices with the highest p95 connect+read time"""
+        durations = {}
+        for run in self.runs(days):
+            for device in run.get('devices', []):
+                if device.get('fetch_seconds') is None:
+                    continue
+                durations.setdefault(device['name'], []).append(device['fetch_seconds'])
+        slowest = [
+            {
+                'name': name,
+                'runs': len(values),
+                'p95_seconds': percentile(values, 95),
+                'mean_seconds': round(sum(values) / len(values), 3)
+            }
+            for name, values in durations.items()
+        ]
+        slowest.sort(key=lambda entry: entry['p95_seconds'], reverse=True)
+        return slowest[:limit]
+    
+    def cycle_time(self, days=7, pct=95):
+        """Percentile of full sync cycle wall time, in seconds"""
+        return percentile(
+            [run['wall_seconds'] for run in self.runs(days) if run.get('wall_seconds') is not None],
+            pct
+        )
+    
+    def error_trend(self, days=7):
+        """Per day: runs, runs with errors, and the devices that failed most"""
+        trend = {}
+        for run in self.runs(days):
+            day = trend.setdefault(
+                run['timestamp'][:10], {'runs': 0, 'failed_runs': 0, 'errors': 0, 'stalls': 0, 'devices': {}}
+            )
+            day['runs'] += 1
+            day['stalls'] += len(run.get('stalls', []))
+            if run.get('errors'):
+                day['failed_runs'] += 1
+                day['errors'] += len(run['errors'])
+            for device in run.get('devices', []):
+                if device.get('error'):
+                    day['devices'][device['name']] = day['devices'].get(device['name'], 0) + 1
+        return [dict(day=day, **counts) for day, counts in sorted(trend.items())]
+    
+    def report(self, days=7):
+        """Summary used by --history and diagnostics.json"""
+        return {
+            'days': days,
+            'runs': sum(1 for _ in self.runs(days)),
+            'p95_cycle_seconds': self.cycle_time(days, 95),
+            'slowest_devices': self.slowest_devices(days),
+            'error_trend': self.error_trend(days)
+        }
+
+
+class SyncScheduler:
+    """Orders each cycle's devices so the busiest and most overdue go first
+    
+    Every device has a deadline: its last clean read plus its freshness
+    target. Devices whose deadline falls before the projected end of the
+    cycle are at risk and run earliest-deadline-first (backlog score breaks
+    ties). The rest follow by expected backlog: punches per hour from
+    SyncHistory times hours since the last read, weighted by priority.
+    """
+    
+    def __init__(self, settings=None):
+        self.settings = settings or {}
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.devices = {}  # device key (or name, for old history) -> stats
+    
+    def load(self, history, days=SCHEDULE_RATE_DAYS):
+        """Build per-device stats from recorded runs (runs in the task pool at startup)"""
+        devices = {}
+        for run in history.runs(days):
+            self._add_run(devices, run.get('timestamp'), run.get('devices', []))
+        with self._lock:
+            for key, stats in self.devices.items():
+                devices.setdefault(key, stats)  # Runs recorded while loading
+            self.devices = devices
+            self.loaded = True
+        return len(devices)
+    
+    def record(self, result):
+        """Fold a finished run into the stats"""
+        with self._lock:
+            self._add_run(self.devices, result.get('timestamp'), result.get('device_results', []))
+    
+    @staticmethod
+    def _add_run(devices, timestamp, results):
+        try:
+            at = datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError):
+            return
+        for entry in results:
+            stats = devices.setdefault(entry.get('key') or entry['name'], {
+                'first_seen': at, 'last_ok': None, 'records': 0, 'fetch_seconds': None
+            })
+            stats['first_seen'] = min(stats['first_seen'], at)
+            stats['records'] += entry.get('records', 0)
+            if not entry.get('error'):
+                stats['last_ok'] = max(stats['last_ok'] or 0, at)
+            if entry.get('fetch_seconds') is not None:
+                previous = stats['fetch_seconds']
+                stats['fetch_seconds'] = entry['fetch_seconds'] if previous is None \
+                    else 0.7 * previous + 0.3 * entry['fetch_seconds']
+    
+    def _setting(self, name, device, default):
+        key = device_key(device)
+        overrides = self.settings.get(name) or {}
+        if key in overrides:
+            return overrides[key]
+        value = device.get(name.replace('device_', '', 1))
+        return default if value is None else value
+    
+    def _number(self, name, device, default, minimum):
+        """Numeric setting; values that are not finite numbers fall back to the default"""
+        try:
+            value = float(self._setting(name, device, default))
+        except (TypeError, ValueError):
+            value = float(default)
+        if not math.isfinite(value):
+            value = float(default)
+        return max(minimum, value)
+    
+    def plan(self, devices, now=None):
+        """[(device, info)] in processing order; info explains the choice"""
+        now = now or time.time()
+        with self._lock:
+            stats = {
+                device_key(device): dict(self.devices.get(device_key(device)) or self.devices.get(device['name']) or {})
+                for device in devices
+            }
+        
+        planned = []
+        for position, device in enumerate(devices):
+            entry = stats[device_key(device)]
+            priority = self._number('device_priority', device, DEVICE_PRIORITY_DEFAULT, 0.0)
+            target = self._number(
+                'device_freshness_minutes', device, DEVICE_FRESHNESS_MINUTES, DEVICE_FRESHNESS_MIN_SECONDS / 60
+            ) * 60
+            last_ok = entry.get('last_ok')
+            
+            if last_ok:
+                span_hours = max(1.0, (now - entry['first_seen']) / 3600)
+                rate = entry['records'] / span_hours
+                age = now - last_ok
+                expected = int(rate * age / 3600)
+                deadline = last_ok + target
+            else:
+                # Never read cleanly: due now
+                rate, age, expected, deadline = None, None, None, now
+            planned.append({
+                'device': device,
+                'position': position,
+                'priority': priority,
+                'deadline': deadline,
+                'expected_records': expected,
+                'age_seconds': age,
+                'estimate_seconds': entry.get('fetch_seconds') or 0.0,
+                'score': priority * ((expected or 0) + 1) * (1 + (age or 0) / target)
+            })
+        
+        # A device is at risk if it would miss its deadline when run last
+        cycle_end = now + sum(item['estimate_seconds'] for item in planned)
+        at_risk = [item for item in planned if item['deadline'] <= cycle_end]
+        rest = [item for item in planned if item['deadline'] > cycle_end]
+        at_risk.sort(key=lambda item: (item['deadline'], -item['score'], item['position']))
+        rest.sort(key=lambda item: (-item['score'], item['position']))
+        
+        ordered = []
+        for item in at_risk + rest:
+            info = {key: value for key, value in item.items() if key not in ('device', 'position')}
+            info['at_risk'] = item['deadline'] <= cycle_end
+            ordered.append((item['device'], info))
+        return ordered
+    
+    def order(self, devices, now=None):
+        return [device for device, _ in self.plan(devices, now)]
+    
+    @staticmethod
+    def describe(plan, limit=5):
+        """One-line summary of the first devices in a plan, for the log"""
+        parts = []
+        for device, info in plan[:limit]:
+            if info['age_seconds'] is None:
+                reason = "first sync"
+            elif info['at_risk']:
+                reason = f"due, {int(info['age_seconds'] // 60)} min since last sync"
+            else:
+                reason = f"~{info['expected_records']} new"
+            parts.append(f"{device['name']} ({reason})")
+        if len(plan) > limit:
+            parts.append(f"+{len(plan) - limit} more")
+        return ", ".join(parts)
+
+
+class SyncProfiler:
+    """Sampling CPU profile and allocation sites for one sync run
+    
+    A background thread samples every thread's stack each
+    PROFILE_SAMPLE_SECONDS via sys._current_frames() (works in the frozen
+    build, no tracing hooks), and tracemalloc records allocations with a
+    single frame. stop() writes a speedscope JSON and a top-N allocation
+    report to PROFILE_DIR, keeping the last PROFILE_KEEP_RUNS runs.
+    """
+    
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._stop = threading.Event()
+        self._thread = None
+        self._frames = []        # speedscope shared frames
+        self._frame_index = {}   # (name, file, line) -> index into _frames
+        self._stacks = {}        # thread ident -> ([stack], [weight])
+        self._thread_names = {}
+        self._owns_tracemalloc = False
+        self.samples = 0
+    
+    @staticmethod
+    def enabled(settings=None):
+        """Whether sync runs should be profiled"""
+        if os.environ.get(PROFILE_ENV_VAR, '').strip() not in ('', '0'):
+            return True
+        if '--profile' in sys.argv:
+            return True
+        return bool(settings and settings.get('profile_syncs'))
+    
+    def start(self):
+        self.started = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            self._owns_tracemalloc = True
+        self._thread = threading.Thread(target=self._sample_loop, name="SyncProfiler", daemon=True)
+        self._thread.start()
+    
+    def _frame_id(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self._frames)
+            self._frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+        return index
+    
+    def _sample_loop(self):
+        me = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(PROFILE_SAMPLE_SECONDS) and self.samples < PROFILE_MAX_SAMPLES:
+            now = time.perf_counter()
+            weight = now - last
+            last = now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_STACK_DEPTH:
+                    stack.append(self._frame_id(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()  # speedscope wants root first
+                stacks, weights = self._stacks.setdefault(ident, ([], []))
+                stacks.append(stack)
+                weights.append(weight)
+            self.samples += 1
+            if self.samples % 100 == 1:
+                self._thread_names.update((t.ident, t.name) for t in threading.enumerate())
+    
+    def stop(self, label="sync"):
+        """Stop profiling and write the artefacts; returns their paths"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        duration = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+        
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{label}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]}")
+        
+        profiles = []
+        for ident, (stacks, weights) in self._stacks.items():
+            profiles.append({
+                'type': 'sampled',
+                'name': self._thread_names.get(ident, f"thread-{ident}"),
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': round(sum(weights), 6),
+                'samples': stacks,
+                'weights': [round(weight, 6) for weight in weights]
+            })
+        cpu_path = base + ".speedscope.json"
+        with open(cpu_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                '$schema': 'https://www.speedscope.app/file-format-schema.json',
+                'name': os.path.basename(base),
+                'exporter': 'attendux-sync-agent',
+                'shared': {'frames': self._frames},
+                'profiles': profiles
+            }, f)
+        
+        alloc_path = base + ".allocations.txt"
+        with open(alloc_path, 'w', encoding='utf-8') as f:
+            f.write(f"Run {duration:.1f}s, {self.samples} CPU samples, "
+                    f"traced memory {current / 1024:.0f} KiB (peak {peak / 1024:.0f} KiB)\n")
+            f.write(f"Top {PROFILE_TOP_ALLOCATIONS} allocation sites still held at the end of the run:\n")
+            for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+        
+        self._rotate()
+        return [cpu_path, alloc_path]
+    
+    def _rotate(self):
+        """Delete artefacts of all but the newest PROFILE_KEEP_RUNS runs"""
+        try:
+            runs = sorted({
+                name.split('.', 1)[0] for name in os.listdir(self.directory)
+                if name.endswith(('.speedscope.json', '.allocations.txt'))
+            })
+            for stale in runs[:-PROFILE_KEEP_RUNS]:
+                for suffix in ('.speedscope.json', '.allocations.txt'):
+                    path = os.path.join(self.directory, stale + suffix)
+                    if os.path.exists(path):
+                        os.remove(path)
+        except OSError as e:
+            print(f"Failed to rotate profiles: {e}")
+
+
+class SpanTracer:
+    """Timeline spans in Chrome trace format (chrome://tracing, Perfetto, speedscope)
+    
+    Each span is a complete ('X') event with the thread it ran on, so the
+    viewer shows which device blocked which and what overlapped what.
+    """
+    
+    def __init__(self, name="sync"):
+        self.name = name
+        self.run_id = uuid.uuid4().hex[:8]
+        self.origin = time.perf_counter()
+        self.started_at = datetime.now()
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+    
+    @contextmanager
+    def span(self, name, **args):
+        """Record the enclosed block as one span; args show in the viewer"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, started, time.perf_counter(), **args)
+    
+    def add(self, name, started, ended, **args):
+        thread = threading.current_thread()
+        args['run'] = self.run_id
+        event = {
+            'name': name,
+            'cat': self.name,
+            'ph': 'X',
+            'ts': int((started - self.origin) * 1e6),
+            'dur': int((ended - started) * 1e6),
+            'pid': os.getpid(),
+            'tid': thread.ident,
+            'args': args
+        }
+        with self._lock:
+            self._events.append(event)
+            self._threads[thread.ident] = thread.name
+    
+    def export(self, directory=TRACE_DIR):
+        """Write the trace as <name>-<timestamp>.trace.json; returns the path"""
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        events += [
+            {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': ident, 'args': {'name': name}}
+            for ident, name in threads.items()
+        ]
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(
+            directory, f"{self.name}-{self.started_at.strftime('%Y%m%d-%H%M%S')}-{self.run_id}.trace.json"
+        )
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'run': self.run_id, 'started': self.started_at.isoformat()}
+            }, f)
+        
+        # Keep the newest TRACE_KEEP_FILES traces
+        traces = sorted(
+            (os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.trace.json')),
+            key=os.path.getmtime
+        )
+        for stale in traces[:-TRACE_KEEP_FILES]:
+            os.remove(stale)
+        return path
+
+
+def _b64(data):
+    return base64.b64encode(data or b'').decode('ascii')
+
+
+class _RecordingSocket:
+    """Socket proxy that appends every exchange to a device's op list"""
+    
+    def __init__(self, sock, ops):
+        self._sock = sock
+        self._ops = ops
+    
+    def send(self, data):
+        self._ops.append({'op': 'send', 'data': _b64(data)})
+        return self._sock.send(data)
+    
+    def sendto(self, data, address):
+        self._ops.append({'op': 'send', 'data': _b64(data)})
+        return self._sock.sendto(data, address)
+    
+    def recv(self, size):
+        started = time.perf_counter()
+        try:
+            data = self._sock.recv(size)
+        except Exception as e:
+            self._ops.append({'op': 'recv', 'error': str(e), 'wait': round(time.perf_counter() - started, 6)})
+            raise
+        self._ops.append({'op': 'recv', 'data': _b64(data), 'wait': round(time.perf_counter() - started, 6)})
+        return data
+    
+    def connect_ex(self, address):
+        result = self._sock.connect_ex(address)
+        self._ops.append({'op': 'connect', 'result': result})
+        return result
+    
+    def __getattr__(self, name):
+        return getattr(self._sock, name)  # settimeout, close, shutdown, ...
+
+
+class _RecordingHelper:
+    """ZK_helper proxy recording the reachability checks done before connect"""
+    
+    def __init__(self, helper, ops):
+        self._helper = helper
+        self._ops = ops
+    
+    def test_ping(self):
+        result = self._helper.test_ping()
+        self._ops.append({'op': 'ping', 'result': result})
+        return result
+    
+    def test_tcp(self):
+        result = self._helper.test_tcp()
+        self._ops.append({'op': 'tcp', 'result': result})
+        return result
+
+
+class _RecordingAdapter(HTTPAdapter):
+    """Transport adapter that records request/response pairs with timing"""
+    
+    def __init__(self, capture):
+        super().__init__()
+        self.capture = capture
+    
+    def send(self, request, **kwargs):
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        exchange = {
+            'method': request.method,
+            'path': urlsplit(request.url).path,
+            'request_bytes': len(body),
+            'request_sha256': hashlib.sha256(body).hexdigest()
+        }
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except Exception as e:
+            exchange.update(error=str(e), elapsed=round(time.perf_counter() - started, 6))
+            self.capture.record_http(exchange)
+            raise
+        exchange.update(
+            status=response.status_code,
+            headers=dict(response.headers),
+            content=_b64(response.content),
+            elapsed=round(time.perf_counter() - started, 6)
+        )
+        self.capture.record_http(exchange)
+        return response
+
+
+class TrafficCapture:
+    """Records one real sync run (device protocol and cloud API traffic) for replay
+    
+    Enabled with --capture FILE. Device sessions are recorded below pyzk by
+    swapping the socket it creates; API calls through a transport adapter on
+    the AttenduxAPI session. The run's checkpoint is saved too, so a replay
+    filters records exactly as the original run did.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.active = True
+        self.devices = []
+        self.checkpoint = {}
+        self.profiles = {}
+        self.streams = {}  # "ip:port" -> ops
+        self.http = []
+        self._lock = threading.Lock()
+    
+    def attach_api(self, api):
+        adapter = _RecordingAdapter(self)
+        api.session.mount('https://', adapter)
+        api.session.mount('http://', adapter)
+    
+    def record_http(self, exchange):
+        if self.active:
+            with self._lock:
+                self.http.append(exchange)
+    
+    def begin_run(self, devices, checkpoint, profiles=None):
+        self.devices = devices
+        self.checkpoint = json.loads(json.dumps(checkpoint.devices))
+        self.profiles = json.loads(json.dumps(profiles.devices)) if profiles else {}
+    
+    def zk_factory(self, ip, port=4370, timeout=60, **options):
+        """ZK whose socket and reachability checks are recorded"""
+        zk = ZK(ip, port=port, timeout=timeout, **options)
+        ops = self.streams.setdefault(f"{ip}:{port}", [])
+        create_socket = zk._ZK__create_socket
+        
+        def create_recording_socket():
+            create_socket()
+            zk._ZK__sock = _RecordingSocket(zk._ZK__sock, ops)
+        
+        zk._ZK__create_socket = create_recording_socket
+        zk.helper = _RecordingHelper(zk.helper, ops)
+        return zk
+    
+    def save(self):
+        """Write the capture and stop recording"""
+        self.active = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': CAPTURE_FORMAT_VERSION,
+                'captured_at': datetime.now().isoformat(),
+                'devices': self.devices,
+                'checkpoint': self.checkpoint,
+                'profiles': self.profiles,
+                'streams': self.streams,
+                'http': self.http
+            }, f, ensure_ascii=False)
+        return self.path
+
+
+class ReplayDiverged(Exception):
+    """The replayed run asked for traffic that is not in the recording"""
+
+
+class _ReplaySocket:
+    """Plays a device's recorded exchanges back to pyzk"""
+    
+    def __init__(self, replay, ops):
+        self._replay = replay
+        self._ops = ops
+        self._pending = b''
+    
+    def send(self, data):
+        self._replay.next_op(self._ops, 'send')
+        return len(data)
+    
+    def sendto(self, data, address):
+        return self.send(data)
+    
+    def recv(self, size):
+        if not self._pending:
+            op = self._replay.next_op(self._ops, 'recv')
+            self._replay.wait(op.get('wait', 0))
+            if 'error' in op:
+                raise socket.timeout(op['error'])
+            self._pending = base64.b64decode(op['data'])
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+    
+    def connect_ex(self, address):
+        return self._replay.next_op(self._ops, 'connect')['result']
+    
+    def settimeout(self, timeout):
+        pass
+    
+    def shutdown(self, how):
+        pass
+    
+    def close(self):
+        pass
+
+
+class _ReplayHelper:
+    def __init__(self, replay, ops):
+        self._replay = replay
+        self._ops = ops
+    
+    def test_ping(self):
+        return self._replay.next_op(self._ops, 'ping')['result']
+    
+    def test_tcp(self):
+        return self._replay.next_op(self._ops, 'tcp')['result']
+
+
+class _ReplayAdapter(BaseAdapter):
+    """Answers API requests from the recording, in order per method and path
+    
+    Once a path's recorded responses run out the last one is repeated, so a
+    build that batches differently still gets plausible answers.
+    """
+    
+    def __init__(self, replay):
+        super().__init__()
+        self.replay = replay
+        self.queues = {}
+        self.last = {}
+        for exchange in replay.data.get('http', []):
+            self.queues.setdefault((exchange['method'], exchange['path']), deque()).append(exchange)
+    
+    def send(self, request, **kwargs):
+        key = (request.method, urlsplit(request.url).path)
+        queue_ = self.queues.get(key)
+        exchange = queue_.popleft() if queue_ else self.last.get(key)
+        if exchange is None:
+            raise requests.ConnectionError(f"{key[0]} {key[1]} is not in the recording")
+        self.last[key] = exchange
+        self.replay.wait(exchange.get('elapsed', 0))
+        if 'error' in exchange:
+            raise requests.ConnectionError(exchange['error'])
+        
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.headers = CaseInsensitiveDict(exchange.get('headers', {}))
+        response._content = base64.b64decode(exchange.get('content', ''))
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+    
+    def close(self):
+        pass
+
+
+class TrafficReplay:
+    """Drives SyncWorker from a TrafficCapture file with no network
+    
+    speed scales the recorded device and server latencies: 1.0 replays the
+    original timing, 0 runs as fast as the agent's own code allows.
+    """
+    
+    def __init__(self, path, speed=1.0):
+        with open(path, 'r', encoding='utf-8') as f:
+            self.data = json.load(f)
+        if self.data.get('version') != CAPTURE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported capture version: {self.data.get('version')}")
+        self.speed = speed
+        self.devices = self.data['devices']
+        self.streams = {key: deque(ops) for key, ops in self.data.get('streams', {}).items()}
+    
+    def wait(self, seconds):
+        if self.speed > 0 and seconds > 0:
+            time.sleep(seconds * self.speed)
+    
+    def next_op(self, ops, kind):
+        if not ops or ops[0]['op'] != kind:
+            found = ops[0]['op'] if ops else 'end of recording'
+            raise ReplayDiverged(f"expected {kind}, recording has {found}")
+        return ops.popleft()
+    
+    def api(self):
+        api = AttenduxAPI('replay')
+        adapter = _ReplayAdapter(self)
+        api.session.mount('https://', adapter)
+        api.session.mount('http://', adapter)
+        return api
+    
+    def checkpoint(self, directory):
+        """Checkpoint as it was when the run was captured, stored in directory"""
+        checkpoint = SyncCheckpoint(os.path.join(directory, 'sync_checkpoint.json'))
+        checkpoint.devices = json.loads(json.dumps(self.data.get('checkpoint', {})))
+        return checkpoint
+    
+    def profiles(self, directory):
+        """Device profiles as they were when the run was captured"""
+        profiles = DeviceProfiles(os.path.join(directory, 'device_profiles.json'))
+        profiles.devices = json.loads(json.dumps(self.data.get('profiles', {})))
+        return profiles
+    
+    def zk_factory(self, ip, port=4370, timeout=60, **options):
+        zk = ZK(ip, port=port, timeout=timeout, **options)
+        ops = self.streams.get(f"{ip}:{port}", deque())
+        
+        def create_replay_socket():
+            zk._ZK__sock = _ReplaySocket(self, ops)
+        
+        zk._ZK__create_socket = create_replay_socket
+        zk.helper = _ReplayHelper(self, ops)
+        return zk
+
+
+class PunchArchive:
+    """Append-only local copy of every punch read from the clocks
+    
+    Punches are stored as fixed-width ARCHIVE_RECORD rows in one file per
+    device and day. Each day file has a sorted (employee, timestamp) index
+    that is memory-mapped for queries and rebuilt when the day file has grown
+    since (in practice only today's). Duplicates (re-reads after a crash or
+    after the log was rewritten) are dropped when the index is built.
+    Like SyncCheckpoint, each device keeps the position in its log archived
+    so far (record count plus a fingerprint of the last one), so a punch is
+    archived once even though the whole device log is read every cycle,
+    and back-dated punches are archived like any other. Punches that do
+    not fit a row (timestamp before 2000, e.g. an unset clock, or an
+    employee id over 24 bytes) are not archived and are counted in rejected.
+    """
+    
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.state_path = os.path.join(directory, os.path.basename(ARCHIVE_STATE_FILE))
+        self.state = load_json_state(self.state_path, None, {})
+        self.rejected = {}  # device key -> punches not archived this run
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _employee(employee_id):
+        return str(employee_id).encode('utf-8')[:ARCHIVE_EMPLOYEE_BYTES].ljust(ARCHIVE_EMPLOYEE_BYTES, b'\0')
+    
+    @staticmethod
+    def fits(punch):
+        """Whether a punch can be stored as an ARCHIVE_RECORD row unchanged"""
+        return (
+            ARCHIVE_EPOCH <= punch.timestamp
+            and (punch.timestamp - ARCHIVE_EPOCH).total_seconds() <= ARCHIVE_MAX_SECONDS
+            and len(str(punch.user_id).encode('utf-8')) <= ARCHIVE_EMPLOYEE_BYTES
+        )
+    
+    @staticmethod
+    def _seconds(timestamp):
+        return int((timestamp - ARCHIVE_EPOCH).total_seconds())
+    
+    def _day_path(self, key, day, suffix='.dat'):
+        return os.path.join(self.directory, key, day + suffix)
+    
+    def append(self, device, punches, start, read, log_records=None):
+        """Archive the punches at log positions start.. not archived yet; returns those written
+        
+        read is the caller's dict for one pass over the device log (start
+        with {}), passed with every batch and then to commit(). log_records
+        is the size of the log being read, if known.
+        """
+        key = device_key(device)
+        with self._lock:
+            entry = self.state.setdefault(key, {})
+            entry['device_id'] = device.get('id', device['name'])
+            entry['name'] = device['name']
+            if 'through' not in read:
+                read.update(through=self._archived(entry), cleared=False, restart=False)
+            through = read['through']
+            if through and log_records is not None and log_records < through:
+                # The log was cleared: archive all of it
+                through = read['through'] = 0
+                read['cleared'] = True
+                read['restart'] = start > 0
+            end = start + len(punches)
+            if through and start < through <= end \
+                    and punch_fingerprint(punches[through - 1 - start]) != entry.get('last_record'):
+                # Rewritten: archive the rest of this pass, and all of it next time
+                through = read['through'] = start
+                read['restart'] = True
+            read['count'] = end
+            if punches:
+                read['last_record'] = punch_fingerprint(punches[-1])
+            
+            by_day = {}
+            written = []
+            for punch in punches[max(through - start, 0):]:
+                if not self.fits(punch):
+                    self.rejected[key] = self.rejected.get(key, 0) + 1
+                    continue
+                written.append(punch)
+                by_day.setdefault(punch.timestamp.date().isoformat(), []).append(ARCHIVE_RECORD.pack(
+                    self._employee(punch.user_id), self._seconds(punch.timestamp),
+                    int(punch.status or 0) & 0xFF, int(punch.punch or 0) & 0xFF
+                ))
+            
+            if by_day:
+                os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+                for day, rows in by_day.items():
+                    with open(self._day_path(key, day), 'ab') as f:
+                        f.write(b''.join(rows))
+            return written
+    
+    @staticmethod
+    def _archived(entry):
+        try:
+            return max(0, int(entry.get('log_count') or 0))
+        except (TypeError, ValueError):
+            return 0
+    
+    def commit(self, device, read):
+        """The device log was read to the end: persist the position archived"""
+        with self._lock:
+            entry = self.state.get(device_key(device))
+            if not entry or 'count' not in read:
+                return
+            if read['restart']:
+                entry['log_count'] = 0
+                entry.pop('last_record', None)
+            elif read['cleared'] or read['count'] > self._archived(entry):
+                entry['log_count'] = read['count']
+                entry['last_record'] = read.get('last_record')
+            else:
+                return  # A shorter log (an old export) that did not move the position
+            atomic_write_json(self.state_path, self.state)
+    
+    def _index(self, key, day):
+        """Path of the day's index, rebuilding it if the day file grew"""
+        data_path = self._day_path(key, day)
+        index_path = self._day_path(key, day, '.idx')
+        count = os.path.getsize(data_path) // ARCHIVE_RECORD.size
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                magic, covered, _entries = ARCHIVE_INDEX_HEADER.unpack(f.read(ARCHIVE_INDEX_HEADER.size))
+            if magic == ARCHIVE_INDEX_MAGIC and covered == count:
+                return index_path
+        
+        with open(data_path, 'rb') as f:
+            data = f.read(count * ARCHIVE_RECORD.size)
+        rows = {}
+        for number, (employee, seconds, status, punch) in enumerate(ARCHIVE_RECORD.iter_unpack(data)):
+            rows.setdefault((employee, seconds, status, punch), number)
+        entries = sorted((employee, seconds, number) for (employee, seconds, _s, _p), number in rows.items())
+        
+        # Sync, backfill, imports and CLI queries may rebuild the same day at once
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix='.idx.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(ARCHIVE_INDEX_HEADER.pack(ARCHIVE_INDEX_MAGIC, count, len(entries)))
+                f.write(b''.join(ARCHIVE_INDEX_ENTRY.pack(*entry) for entry in entries))
+            os.replace(tmp_path, index_path)
+        except OSError:
+            # Windows refuses to replace an index another reader has mapped: use it stale
+            if not os.path.exists(index_path):
+                raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return index_path
+    
+    def _partitions(self, start, end, device_keys=None):
+        """(key, day) of every day file overlapping [start, end)"""
+        first, last = start.date().isoformat(), end.date().isoformat()
+        if not os.path.isdir(self.directory):
+            return
+        for key in sorted(os.listdir(self.directory)):
+            folder = os.path.join(self.directory, key)
+            if not os.path.isdir(folder) or (device_keys and key not in device_keys):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if name.endswith('.dat') and first <= name[:-4] <= last:
+                    yield key, name[:-4]
+    
+    @staticmethod
+    def _lower_bound(index, entries, target):
+        """First index entry >= target, by binary search over the mapped file"""
+        low, high = 0, entries
+        while low < high:
+            middle = (low + high) // 2
+            offset = ARCHIVE_INDEX_HEADER.size + middle * ARCHIVE_INDEX_ENTRY.size
+            if ARCHIVE_INDEX_ENTRY.unpack_from(index, offset)[:2] < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    
+    def query(self, start, end, employee_id=None, device_keys=None):
+        """Archived punches in [start, end) as (device key, Punch), by device, day, employee, time
+        
+        With employee_id only that employee's index range is read.
+        """
+        low_seconds, high_seconds = self._seconds(start), self._seconds(end)
+        for key, day in self._partitions(start, end, device_keys):
+            index_path = self._index(key, day)
+            with open(index_path, 'rb') as index_file, open(self._day_path(key, day), 'rb') as data_file:
+                index_size = os.path.getsize(index_path)
+                if index_size <= ARCHIVE_INDEX_HEADER.size:
+                    continue
+                with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index, \
+                        mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    entries = ARCHIVE_INDEX_HEADER.unpack_from(index, 0)[2]
+                    if employee_id is not None:
+                        employee = self._employee(employee_id)
+                        position = self._lower_bound(index, entries, (employee, low_seconds))
+                    else:
+                        employee = None
+                        position = 0
+                    while position < entries:
+                        entry_employee, seconds, number = ARCHIVE_INDEX_ENTRY.unpack_from(
+                            index, ARCHIVE_INDEX_HEADER.size + position * ARCHIVE_INDEX_ENTRY.size
+                        )
+                        position += 1
+                        if employee is not None and (entry_employee != employee or seconds >= high_seconds):
+                            break
+                        if not low_seconds <= seconds < high_seconds:
+                            continue
+                        _employee, _seconds, status, punch = ARCHIVE_RECORD.unpack_from(
+                            data, number * ARCHIVE_RECORD.size
+                        )
+                        yield key, Punch(
+                            entry_employee.rstrip(b'\0').decode('utf-8', errors='ignore'),
+                            ARCHIVE_EPOCH + timedelta(seconds=seconds), status, punch
+                        )
+    
+    def days(self, start, end, device_keys=None):
+        """[(device key, 'YYYY-MM-DD')] of archived days overlapping [start, end)"""
+        return list(self._partitions(start, end, device_keys))
+    
+    def count(self, start, end, device_keys=None):
+        """Approximate punches in [start, end): whole-day index sizes, from headers only"""
+        total = 0
+        for key, day in self._partitions(start, end, device_keys):
+            with open(self._index(key, day), 'rb') as f:
+                total += ARCHIVE_INDEX_HEADER.unpack(f.read(ARCHIVE_INDEX_HEADER.size))[2]
+        return total
+    
+    def records(self, start, end, employee_id=None, device_keys=None):
+        """query() as upload records, ready for AttenduxAPI.send_attendance"""
+        for key, punch in self.query(start, end, employee_id, device_keys):
+            yield {
+                'employee_id': punch.user_id,
+                'timestamp': punch.timestamp.isoformat(),
+                'device_id': self.state.get(key, {}).get('device_id', key),
+                'type': 'auto',
+                'status': punch.status
+            }
+
+
+def reupload_archive(api, archive, start, end, device_keys=None, log=print):
+    """Send an archived window to the cloud again, in UPLOAD_CHUNK_SIZE requests
+    
+    Returns (records sent, records the server synced).
+    """
+    sent = synced = 0
+    chunk = []
+    
+    def send(chunk):
+        wait = api.seconds_until_allowed()
+        if wait > 0:
+            log(f"⏳ Server asked to wait {int(wait)}s")
+            time.sleep(wait)
+        result = api.send_attendance(chunk)
+        if not result or not result.get('success'):
+            raise RuntimeError(f"Upload failed after {sent} records")
+        return result.get('synced', len(chunk))
+    
+    for record in archive.records(start, end, device_keys=device_keys):
+        chunk.append(record)
+        if len(chunk) >= UPLOAD_CHUNK_SIZE:
+            synced += send(chunk)
+            sent += len(chunk)
+            chunk = []
+    if chunk:
+        synced += send(chunk)
+        sent += len(chunk)
+    return sent, synced
+
+
+def iter_attlog_batches(path, batch_size=STREAM_BATCH_SIZE, stats=None):
+    """Stream punches from a ZKTeco USB export (attlog.dat or text) in batches
+    
+    Rows are "user_id<TAB>YYYY-MM-DD HH:MM:SS<TAB>verify<TAB>in/out<TAB>...";
+    comma-separated and space-padded variants are accepted too. The file is
+    read line by line, so memory stays constant whatever its size. Rows
+    that do not parse are counted in stats['skipped'].
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault('lines', 0)
+    stats.setdefault('skipped', 0)
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    encoding = 'utf-16' if head[:2] in (b'\xff\xfe', b'\xfe\xff') else 'utf-8-sig'
+    
+    batch = []
+    with open(path, 'r', encoding=encoding, errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            stats['lines'] += 1
+            if '\t' in line or ',' in line:
+                fields = [field.strip() for field in re.split(r'[\t,]', line)]
+            else:
+                fields = line.split()
+                fields[1:3] = [' '.join(fields[1:3])]  # Date and time were split apart
+            try:
+                batch.append(Punch(
+                    fields[0],
+                    datetime.fromisoformat(fields[1].replace('/', '-')),
+                    int(fields[2]) if len(fields) > 2 and fields[2] else 0,
+                    int(fields[3]) if len(fields) > 3 and fields[3] else 0
+                ))
+            except (IndexError, ValueError):
+                stats['skipped'] += 1  # Header line or damaged row
+                continue
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def import_attlog(api, path, device, checkpoint=None, archive=None, log=print):
+    """Upload a USB export for one device through the chunked upload path
+    
+    Rows past the device's checkpoint position are sent in UploadAggregator
+    batches, advancing the checkpoint per batch, and copied to the archive
+    if given. An export that does not continue the synced log is sent in
+    full without touching the checkpoint. Returns counts and records/sec.
+    """
+    checkpoint = checkpoint or SyncCheckpoint()
+    base, last_record = checkpoint.position(device)
+    tracking = True
+    if base and attlog_fingerprint(path, base) != last_record:
+        log(f"⚠️ {os.path.basename(path)} does not continue the log already synced from "
+            f"{device['name']}; sending all of it")
+        base, tracking = 0, False
+    positions = UploadPositions()
+    device_id = device.get('id', device['name'])
+    stats = {'lines': 0, 'skipped': 0, 'parsed': 0, 'already_synced': 0, 'uploaded': 0, 'synced': 0}
+    
+    def send(records):
+        wait = api.seconds_until_allowed()
+        if wait > 0:
+            log(f"⏳ Server asked to wait {int(wait)}s")
+            time.sleep(wait)
+        return api.send_attendance(records)
+    
+    def on_segment(_device, records, synced, ok):
+        if not ok:
+            raise RuntimeError(f"Upload failed after {stats['uploaded']} records; run the import again to resume")
+        stats['uploaded'] += len(records)
+        stats['synced'] += synced
+        reached = positions.uploaded(device, len(records))
+        if reached:
+            checkpoint.advance(device, *reached, uploaded_through=records[-1]['timestamp'])
+    
+    aggregator = UploadAggregator(send, on_segment)
+    started = time.perf_counter()
+    next_progress = started + ATTLOG_PROGRESS_SECONDS
+    index = 0
+    archive_read = {}
+    for punches in iter_attlog_batches(path, stats=stats):
+        stats['parsed'] += len(punches)
+        start, index = index, index + len(punches)
+        if archive:
+            archive.append(device, punches, start, archive_read)
+        records = [
+            {
+                'employee_id': str(punch.user_id),
+                'timestamp': punch.timestamp.isoformat(),
+                'device_id': device_id,
+                'type': 'auto',
+                'status': punch.status
+            }
+            for punch in punches[max(base - start, 0):]
+        ]
+        stats['already_synced'] += len(punches) - len(records)
+        # Exports are chronological; sorting each batch covers small reorderings
+        records.sort(key=lambda r: r['timestamp'])
+        if records:
+            positions.add(device, len(records), (index, punch_fingerprint(punches[-1])) if tracking else None)
+            aggregator.add(device, records)
+        
+        now = time.perf_counter()
+        if now >= next_progress:
+            log(f"   📥 {stats['parsed']} punches read, {stats['uploaded']} uploaded "
+                f"({stats['parsed'] / (now - started):.0f} records/sec)")
+            next_progress = now + ATTLOG_PROGRESS_SECONDS
+    aggregator.flush()
+    if archive:
+        archive.commit(device, archive_read)
+        stats['not_archived'] = archive.rejected.pop(device_key(device), 0)
+    
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['records_per_second'] = int(stats['parsed'] / stats['seconds']) if stats['seconds'] else stats['parsed']
+    stats['requests'] = aggregator.requests
+    return stats
+
+
+def attlog_fingerprint(path, count):
+    """Fingerprint of the export's row number count (1-based), None if it is shorter"""
+    index = 0
+    for punches in iter_attlog_batches(path):
+        if index + len(punches) >= count:
+            return punch_fingerprint(punches[count - 1 - index])
+        index += len(punches)
+    return None
+
+
+def attlog_device(settings, device_id):
+    """Configured device with this id, or a minimal stand-in for a USB-only clock"""
+    for device in settings.get('devices', []):
+        if device_key(device) == str(device_id):
+            return device
+    return {'id': int(device_id) if str(device_id).isdigit() else device_id, 'name': f"USB {device_id}"}
+
+
+def run_import_command(argv):
+    """USB import CLI: --import-attlog FILE DEVICE_ID"""
+    parser = argparse.ArgumentParser(prog="attendux_sync_agent --import-attlog",
+                                     description="Upload a USB attendance export for one device")
+    parser.add_argument('path', metavar='FILE', help="attlog.dat or text export")
+    parser.add_argument('device_id', metavar='DEVICE_ID', help="id of the clock it was exported from")
+    args = parser.parse_args(argv[argv.index('--import-attlog') + 1:])
+    settings = SettingsManager.load()
+    if not settings.get('license_key'):
+        print("No license key configured")
+        return 1
+    device = attlog_device(settings, args.device_id)
+    try:
+        api = AttenduxAPI(settings['license_key'], wire_format=settings.get('wire_format'))
+        stats = import_attlog(api, args.path, device, archive=PunchArchive())
+    except (OSError, RuntimeError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+class TokenBucket:
+    """Rate limiter that may run into debt: spend first, then wait off the overdraft"""
+    
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+    
+    def spend(self, amount):
+        """Take amount tokens; returns seconds to wait before spending again"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class BackfillQueue:
+    """Archived punch ranges still to be uploaded, per device
+    
+    A job covers [start, end) of one device's archive and is worked through
+    a day at a time; 'cursor' is the first day not yet fully uploaded, so a
+    restart resends at most one day.
+    """
+    
+    def __init__(self, path=BACKFILL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.jobs = load_json_state(path, 'jobs', {})
+    
+    def add(self, device, start, end):
+        """Queue [start, end) for a device, merging with a job already queued"""
+        start = (start or ARCHIVE_EPOCH).isoformat()
+        end = end.isoformat()
+        with self._lock:
+            job = self.jobs.get(device_key(device))
+            if job:
+                job['start'] = min(job['start'], start)
+                job['cursor'] = min(job['cursor'], start)
+                job['end'] = max(job['end'], end)
+                job['total'] = None  # Recounted when the lane picks it up
+            else:
+                self.jobs[device_key(device)] = {
+                    'name': device['name'], 'start': start, 'end': end, 'cursor': start,
+                    'sent': 0, 'total': None, 'created': datetime.now().isoformat()
+                }
+            self._save()
+    
+    def pending(self):
+        with self._lock:
+            return [(key, dict(job)) for key, job in self.jobs.items()]
+    
+    def update(self, key, **fields):
+        with self._lock:
+            if key in self.jobs:
+                self.jobs[key].update(fields)
+                self._save()
+    
+    def finish(self, key, end):
+        """Drop a job worked through end, unless add() extended it meanwhile"""
+        with self._lock:
+            job = self.jobs.get(key)
+            if job and job['end'] <= end:
+                del self.jobs[key]
+                self._save()
+    
+    def summary(self):
+        """Remaining jobs for diagnostics"""
+        return {
+            key: {name: job.get(name) for name in ('name', 'cursor', 'end', 'sent', 'total')}
+            for key, job in self.pending()
+        }
+    
+    def _save(self):
+        """Atomically write the queue file"""
+        atomic_write_json(self.path, {'jobs': self.jobs})
+
+
+class IngestSpool:
+    """Durable FIFO of attendance batches received from edge agents
+    
+    Each accepted request is one JSON line, fsynced before the edge is
+    answered, in numbered segment files under SPOOL_DIR. The read position
+    (segment, byte offset) is committed after each cloud upload; fully
+    uploaded segments are deleted. Records left from an earlier run are
+    counted by count_backlog(), off the GUI thread.
+    """
+    
+    def __init__(self, directory=SPOOL_DIR):
+        self.directory = directory
+        self.state_path = os.path.join(directory, "spool_state.json")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.position = load_json_state(self.state_path, 'position', [0, 0])
+        segments = self._segments()
+        self.active = max(segments) if segments else self.position[0]
+        self._repair(self._path(self.active))
+        self.oldest = None  # monotonic time the oldest pending record arrived
+        self.pending = 0    # Records appended since start, plus count_backlog()
+        path = self._path(self.active)
+        self._backlog_end = [self.active, os.path.getsize(path) if os.path.exists(path) else 0]
+    
+    def _segments(self):
+        return sorted(int(name[:-6]) for name in os.listdir(self.directory) if name.endswith('.jsonl'))
+    
+    @staticmethod
+    def _repair(path):
+        """Cut a line torn by a crash, so the next append starts on a fresh line"""
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+    
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:012d}.jsonl")
+    
+    def size(self):
+        return sum(os.path.getsize(self._path(segment)) for segment in self._segments())
+    
+    def append(self, records):
+        """Persist one edge request; returns once it is on disk"""
+        line = (json.dumps(records, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        with self._lock:
+            path = self._path(self.active)
+            if os.path.exists(path) and os.path.getsize(path) >= SPOOL_SEGMENT_BYTES:
+                self.active += 1
+                path = self._path(self.active)
+            with open(path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending += len(records)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+    
+    def count_backlog(self):
+        """Add the records spooled before this run to pending; returns their number
+        
+        Parses every pending line, so it runs on the uplink thread. Lines
+        appended since the spool was opened are counted by append().
+        """
+        end, self._backlog_end = self._backlog_end, None
+        backlog = 0
+        for position, records in self._lines(self.position) if end else ():
+            if position > end:
+                break
+            backlog += len(records)
+        if backlog:
+            with self._lock:
+                self.pending += backlog
+                if self.oldest is None:
+                    self.oldest = time.monotonic()
+        return backlog
+    
+    def _lines(self, position):
+        """(position after the line, records) for every complete line from position on"""
+        segment, offset = position
+        for current in self._segments():
+            if current < segment:
+                continue
+            with open(self._path(current), 'rb') as f:
+                f.seek(offset if current == segment else 0)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # Being written
+                    yield [current, f.tell()], json.loads(line)
+    
+    def read_batch(self, max_records, max_lines=None):
+        """(records, position after them) starting at the committed position"""
+        batch = []
+        position = self.position
+        with self._lock:
+            for lines, (position, records) in enumerate(self._lines(self.position), 1):
+                batch.extend(records)
+                if len(batch) >= max_records or lines == max_lines:
+                    break
+        return batch, position
+    
+    def commit(self, position, count):
+        """The records up to position reached the cloud"""
+        with self._lock:
+            self.position = position
+            atomic_write_json(self.state_path, {'position': position})
+            for segment in self._segments():
+                if segment < position[0]:
+                    os.remove(self._path(segment))
+            self.pending = max(0, self.pending - count)
+            self.oldest = time.monotonic() if self.pending else None
+
+
+class IngestServer(ThreadingHTTPServer):
+    """Local endpoint edge agents post attendance to, in place of API_BASE_URL
+    
+    POST .../attendance with the site's license key and a JSON body, as the
+    cloud expects. Records are spooled durably and acknowledged as synced;
+    the aggregator's uplink takes it from there.
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, license_key, spool, port=AGGREGATOR_PORT):
+        self.license_key = license_key
+        self.spool = spool
+        self.stats = {'requests': 0, 'records': 0, 'bytes': 0, 'rejected': 0}
+        self._stats_lock = threading.Lock()
+        super().__init__(('0.0.0.0', port), IngestHandler)
+    
+    def count(self, **deltas):
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+
+def ingest_record_problem(record):
+    """Why an edge's record would be rejected by the cloud, or None if it is fine"""
+    if not isinstance(record, dict):
+        return "not an object"
+    for field in ('employee_id', 'device_id'):
+        value = record.get(field)
+        if isinstance(value, bool) or not isinstance(value, (str, int)) or value == '':
+            return f"missing or invalid {field}"
+    try:
+        datetime.fromisoformat(record.get('timestamp'))
+    except (TypeError, ValueError):
+        return "missing or invalid timestamp"
+    if isinstance(record.get('status'), bool) or not isinstance(record.get('status'), int):
+        return "missing or invalid status"
+    return None
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    server_version = "AttenduxAggregator/1.0"
+    
+    def do_POST(self):
+        server = self.server
+        if not self.path.rstrip('/').endswith('/attendance'):
+            return self._reply(404, {'success': False, 'error': 'not found'})
+        if not hmac.compare_digest(self.headers.get('X-License-Key', ''), server.license_key):
+            server.count(rejected=1)
+            return self._reply(401, {'success': False, 'error': 'license mismatch'})
+        if server.spool.size() >= SPOOL_MAX_BYTES:
+            return self._reply(503, {'success': False, 'error': 'spool full'}, {'Retry-After': '60'})
+        
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if not 0 <= length <= INGEST_MAX_BODY_BYTES:
+            server.count(rejected=1)
+            self.close_connection = True  # The body is not read
+            return self._reply(413, {'success': False, 'error': f"body over {INGEST_MAX_BODY_BYTES} bytes"})
+        body = self.rfile.read(length)
+        try:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                # Bounded, so a small gzip bomb cannot exhaust memory
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                body = decompressor.decompress(body, INGEST_MAX_BODY_BYTES)
+                if decompressor.unconsumed_tail:
+                    server.count(rejected=1)
+                    return self._reply(413, {
+                        'success': False, 'error': f"decompressed body over {INGEST_MAX_BODY_BYTES} bytes"
+                    })
+                if not decompressor.eof:
+                    raise ValueError("truncated gzip body")
+            records = json.loads(body)['records']
+            if not isinstance(records, list):
+                raise ValueError("records must be a list of objects")
+            for number, record in enumerate(records):
+                problem = ingest_record_problem(record)
+                if problem:
+                    raise ValueError(f"record {number}: {problem}")
+        except (ValueError, KeyError, TypeError, OSError, zlib.error) as e:
+            server.count(rejected=1)
+            return self._reply(400, {'success': False, 'error': str(e)})
+        
+        try:
+            server.spool.append(records)
+        except OSError as e:
+            return self._reply(503, {'success': False, 'error': str(e)}, {'Retry-After': '60'})
+        server.count(requests=1, records=len(records), bytes=len(body))
+        self._reply(200, {'success': True, 'synced': len(records)})
+    
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/health'):
+            return self._reply(200, {'pending': self.server.spool.pending, **self.server.stats})
+        self._reply(404, {'success': False, 'error': 'not found'})
+    
+    def _reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass  # Per-request lines would flood stderr
+
+
+class DeviceProfiles:
+    """Per-device capabilities found on first connect, reused for later connects
+    
+    A profile holds the working transport (tcp/udp), whether the clock
+    answers ping, firmware/serial/platform, the attendance record size and
+    user/record counts and capacity. Connects with a profile skip pyzk's ping
+    and go straight to the right transport; a failed connect drops the
+    profile and discovers it again.
+    """
+    
+    def __init__(self, path=DEVICE_PROFILES_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.devices = load_json_state(path, 'devices', {})
+    
+    def get(self, device):
+        return self.devices.get(device_key(device))
+    
+    def save(self, device, profile):
+        with self._lock:
+            self.devices[device_key(device)] = profile
+            self._save()
+    
+    def update(self, device, **fields):
+        """Refresh fields of an existing profile"""
+        with self._lock:
+            profile = self.devices.get(device_key(device))
+            if profile is None or all(profile.get(name) == value for name, value in fields.items()):
+                return
+            profile.update(fields)
+            self._save()
+    
+    def forget(self, device):
+        with self._lock:
+            if self.devices.pop(device_key(device), None) is not None:
+                self._save()
+    
+    @staticmethod
+    def zk_options(device, profile):
+        """ZK() keyword arguments for connecting with a profile"""
+        return {
+            'force_udp': profile.get('transport') == 'udp',
+            'ommit_ping': True,
+            'password': int(device.get('password') or 0),
+            'encoding': device.get('encoding') or 'UTF-8'
+        }
+    
+    def _save(self):
+        """Atomically write the profiles file"""
+        atomic_write_json(self.path, {'devices': self.devices})
+
+
+class DeviceHealth:
+    """Stall history per device, and quarantine for clocks that keep stalling
+    
+    After QUARANTINE_AFTER_STALLS consecutive stalls a device is skipped for
+    QUARANTINE_BASE_SECONDS, doubling with each repeat up to
+    QUARANTINE_MAX_SECONDS. A device that stalls again right after its
+    quarantine ends goes straight back in; one clean read clears it. The
+    time of the last clean read is kept too (last_read).
+    """
+    
+    def __init__(self, path=DEVICE_HEALTH_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.devices = load_json_state(path, 'devices', {})
+    
+    def quarantined_for(self, device):
+        """Seconds left in the device's quarantine (0 if it may be synced)"""
+        entry = self.devices.get(device_key(device))
+        if not entry or not entry.get('quarantined_until'):
+            return 0
+        return max(0, int(entry['quarantined_until'] - time.time()))
+    
+    def last_read(self, device):
+        """time.time() of the device's last clean read, None if unknown"""
+        return (self.devices.get(device_key(device)) or {}).get('last_ok')
+    
+    def _entry(self, device):
+        return self.devices.setdefault(device_key(device), {
+            'stalls': 0, 'consecutive_stalls': 0, 'quarantines': 0, 'quarantined_until': None
+        })
+    
+    def record_stall(self, device):
+        """Count a stall; returns the quarantine length in seconds if this starts one"""
+        with self._lock:
+            entry = self._entry(device)
+            entry['stalls'] += 1
+            entry['consecutive_stalls'] += 1
+            entry['last_stall'] = datetime.now().isoformat()
+            quarantine = 0
+            if entry['consecutive_stalls'] >= QUARANTINE_AFTER_STALLS:
+                quarantine = min(QUARANTINE_BASE_SECONDS * 2 ** entry['quarantines'], QUARANTINE_MAX_SECONDS)
+                entry['quarantines'] += 1
+                entry['quarantined_until'] = time.time() + quarantine
+            self._save()
+            return quarantine
+    
+    def record_ok(self, device):
+        """A clean read ends any stall streak and quarantine"""
+        with self._lock:
+            entry = self._entry(device)
+            entry['last_ok'] = time.time()
+            entry['consecutive_stalls'] = 0
+            entry['quarantines'] = 0
+            entry['quarantined_until'] = None
+            self._save()
+    
+    def summary(self):
+        """Stall counts and active quarantines for diagnostics"""
+        return {
+            key: {
+                'stalls': entry['stalls'],
+                'consecutive_stalls': entry['consecutive_stalls'],
+                'quarantined_for': max(0, int((entry.get('quarantined_until') or 0) - time.time()))
+            }
+            for key, entry in self.devices.items()
+        }
+    
+    def _save(self):
+        """Atomically write the health file"""
+        atomic_write_json(self.path, {'devices': self.devices})
+
+
+QUEUE_IDLE = object()  # SyncWorker._get timed out without an item
+
+
+class UploadPositions:
+    """Device log positions waiting for their records to be uploaded
+    
+    A device's records are uploaded in the order they were queued, so a
+    position is reached once every record queued up to it was accepted.
+    After a failed upload the device's position stops moving for the run.
+    """
+    
+    def __init__(self):
+        self.pending = {}  # device key -> deque of [records left, position]
+        self.failed = set()
+    
+    def add(self, device, count, position):
+        """Queue count records that take the device to position (None: do not advance)"""
+        key = device_key(device)
+        if key not in self.failed:
+            self.pending.setdefault(key, deque()).append([count, position])
+    
+    def uploaded(self, device, count):
+        """Account count accepted records; returns the position now reached, or None"""
+        queue = self.pending.get(device_key(device))
+        reached = None
+        while queue and (count or not queue[0][0]):
+            take = min(count, queue[0][0])
+            queue[0][0] -= take
+            count -= take
+            if not queue[0][0]:
+                reached = queue.popleft()[1]
+        return reached
+    
+    def fail(self, device):
+        """Stop advancing this device for the rest of the run"""
+        key = device_key(device)
+        self.failed.add(key)
+        self.pending.pop(key, None)
+
+
+class SyncCancelled(Exception):
+    """Raised inside SyncWorker when stop() was requested"""
+
+
+class DeviceUnreachable(Exception):
+    """Raised inside SyncWorker when connecting to a device fails"""
+
+
+def _msgpack_pack(obj, out):
+    """Minimal MessagePack encoder (nil, bool, int, float, str, bytes, list, dict)"""
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True or obj is False:
+        out.append(0xc3 if obj else 0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xff)
+        elif obj >= 0:
+            for marker, fmt, limit in ((0xcc, '>B', 1 << 8), (0xcd, '>H', 1 << 16), (0xce, '>I', 1 << 32), (0xcf, '>Q', 1 << 64)):
+                if obj < limit:
+                    out.append(marker)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise OverflowError(obj)
+        else:
+            for marker, fmt, limit in ((0xd0, '>b', 1 << 7), (0xd1, '>h', 1 << 15), (0xd2, '>i', 1 << 31), (0xd3, '>q', 1 << 63)):
+                if obj >= -limit:
+                    out.append(marker)
+                    out += struct.pack(fmt, obj)
+                    break
+            else:
+                raise OverflowError(obj)
+    elif isinstance(obj, float):
+        out.append(0xcb)
+        out += struct.pack('>d', obj)
+    elif isinstance(obj, str):
+        data = obj.encode('utf-8')
+        size = len(data)
+        if size < 32:
+            out.append(0xa0 | size)
+        elif size < 1 << 8:
+            out += bytes((0xd9, size))
+        elif size < 1 << 16:
+            out.append(0xda)
+            out += struct.pack('>H', size)
+        else:
+            out.append(0xdb)
+            out += struct.pack('>I', size)
+        out += data
+    elif isinstance(obj, (bytes, bytearray)):
+        size = len(obj)
+        if size < 1 << 8:
+            out += bytes((0xc4, size))
+        elif size < 1 << 16:
+            out.append(0xc5)
+            out += struct.pack('>H', size)
+        else:
+            out.append(0xc6)
+            out += struct.pack('>I', size)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        size = len(obj)
+        if size < 16:
+            out.append(0x90 | size)
+        elif size < 1 << 16:
+            out.append(0xdc)
+            out += struct.pack('>H', size)
+        else:
+            out.append(0xdd)
+            out += struct.pack('>I', size)
+        for item in obj:
+            _msgpack_pack(item, out)
+    elif isinstance(obj, dict):
+        size = len(obj)
+        if size < 16:
+            out.append(0x80 | size)
+        elif size < 1 << 16:
+            out.append(0xde)
+            out += struct.pack('>H', size)
+        else:
+            out.append(0xdf)
+            out += struct.pack('>I', size)
+        for key, value in obj.items():
+            _msgpack_pack(key, out)
+            _msgpack_pack(value, out)
+    else:
+        raise TypeError(f"Cannot encode {type(obj).__name__} as MessagePack")
+
+
+def msgpack_dumps(obj):
+    if MSGPACK_AVAILABLE:
+        return msgpack.packb(obj, use_bin_type=True)
+    out = bytearray()
+    _msgpack_pack(obj, out)
+    return bytes(out)
+
+
+def compact_attendance_batch(records):
+    """Columnar form of an upload batch for the binary wire format
+    
+    Records are grouped per device so device_id and type appear once per
+    group. Timestamps (device wall-clock time) become seconds since
+    1970-01-01 in that same local time: a base plus deltas from the
+    previous record. Employee ids are sent as integers when they
+    round-trip exactly and fit a signed 64-bit integer ("0042", non-ASCII
+    digits and longer ids stay strings).
+    """
+    groups = {}
+    for record in records:
+        key = (record['device_id'], record.get('type', 'auto'))
+        groups.setdefault(key, []).append(record)
+    
+    batch = []
+    for (device_id, record_type), group in groups.items():
+        previous = None
+        deltas = []
+        for record in group:
+            stamp = datetime.fromisoformat(record['timestamp'])
+            seconds = int((stamp - datetime(1970, 1, 1)).total_seconds())
+            deltas.append(seconds if previous is None else seconds - previous)
+            previous = seconds
+        employees = []
+        for record in group:
+            employee = str(record['employee_id'])
+            if employee.isascii() and employee.isdecimal() and str(int(employee)) == employee \
+                    and int(employee) < 1 << 63:
+                employee = int(employee)
+            employees.append(employee)
+        batch.append({
+            'device_id': device_id,
+            'type': record_type,
+            'ts': deltas,  # First value absolute, the rest deltas
+            'employee_id': employees,
+            'status': [record['status'] for record in group]
+        })
+    return {'v': 1, 'groups': batch}
+
+
+def encode_attendance(records, wire_format):
+    """(body bytes, content type) for POST /attendance"""
+    if wire_format == WIRE_FORMAT_MSGPACK:
+        return msgpack_dumps(compact_attendance_batch(records)), MSGPACK_CONTENT_TYPE
+    return json.dumps({'records': records}).encode('utf-8'), 'application/json'
+
+
+def run_wire_benchmark(argv):
+    """Compare upload encodings on realistic batches: --wire-benchmark [BATCH_SIZE]"""
+    parser = argparse.ArgumentParser(prog="attendux_sync_agent --wire-benchmark",
+                                     description="Compare upload encodings on realistic batches")
+    parser.add_argument('size', metavar='BATCH_SIZE', type=int, nargs='?', default=UPLOAD_CHUNK_SIZE,
+                        help=f"records per batch (default {UPLOAD_CHUNK_SIZE})")
+    size = parser.parse_args(argv[argv.index('--wire-benchmark') + 1:]).size
+    if size < 1:
+        parser.error("BATCH_SIZE must be at least 1")
+    started_at = datetime(2026, 3, 1, 7, 30)
+    records = [
+        {
+            'employee_id': str(1000 + (i * 37) % 400),
+            'timestamp': (started_at + timedelta(seconds=i * 11)).isoformat(),
+            'device_id': 10 + i % 3,
+            'type': 'auto',
+            'status': 1
+        }
+        for i in range(size)
+    ]
+    
+    def measure(label, encode):
+        body = encode()
+        rounds = max(1, 20000 // size)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            encode()
+        elapsed_ms = (time.perf_counter() - started) / rounds * 1000
+        return label, len(body), elapsed_ms
+    
+    results = [measure('json', lambda: encode_attendance(records, WIRE_FORMAT_JSON)[0])]
+    if MSGPACK_AVAILABLE:
+        results.append(measure('msgpack (library)', lambda: encode_attendance(records, WIRE_FORMAT_MSGPACK)[0]))
+    results.append(measure('msgpack (pure Python)', lambda: _pure_msgpack(compact_attendance_batch(records))))
+    
+    baseline = results[0][1]
+    print(f"{size} records, 3 devices")
+    for label, body_size, elapsed_ms in results:
+        print(f"  {label:<24}{body_size:>9} bytes ({body_size / baseline * 100:5.1f}%)  "
+              f"{body_size / size:6.1f} B/record  {elapsed_ms:7.2f} ms/batch")
+    return 0
+
+
+def _pure_msgpack(obj):
+    out = bytearray()
+    _msgpack_pack(obj, out)
+    return bytes(out)
+
+
+class AttenduxAPI:
+    """Handle API communication with Attendux cloud"""
+    
+    def __init__(self, license_key, uplink_url=None, wire_format=None):
+        self.license_key = license_key
+        self.uplink_url = uplink_url.rstrip('/') if uplink_url else None  # Edge role: the site aggregator
+        self.session = requests.Session()
+        self.session.headers.update({
+            'X-License-Key': license_key,
+            'Content-Type': 'application/json',
+            'User-Agent': 'Attendux-Sync-Agent/1.0'
+        })
+        
+        # Server pacing hints (epoch seconds / seconds)
+        self.not_before = 0.0
+        self.suggested_next_sync = None
+        self.rate_limit_remaining = None
+        
+        # Request body bytes sent to /attendance
+        self.bytes_sent = 0
+        
+        # Upload encoding, upgraded by /verify when the server accepts MessagePack,
+        # unless settings 'wire_format' pins JSON
+        self.wire_format = WIRE_FORMAT_JSON
+        self.preferred_wire_format = wire_format
+    
+    @staticmethod
+    def _parse_retry_after(value):
+        """Parse a Retry-After header (delta seconds or HTTP date) into epoch seconds"""
+        if not value:
+            return None
+        value = value.strip()
+        try:
+            return time.time() + max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return None
+    
+    def _record_pacing(self, response):
+        """Remember rate-limit and Retry-After hints sent by the server"""
+        headers = response.headers
+        wait_until = None
+        
+        if response.status_code in (429, 503):
+            wait_until = self._parse_retry_after(headers.get('Retry-After'))
+        
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            try:
+                self.rate_limit_remaining = int(remaining)
+            except ValueError:
+                self.rate_limit_remaining = None
+            if self.rate_limit_remaining is not None and self.rate_limit_remaining <= 0:
+                try:
+                    reset = float(headers.get('X-RateLimit-Reset', ''))
+                    # Reset is either an epoch timestamp or a delta in seconds
+                    reset_at = reset if reset > 1e9 else time.time() + reset
+                    wait_until = max(wait_until or 0.0, reset_at)
+                except ValueError:
+                    pass
+        
+        if wait_until and wait_until > self.not_before:
+            self.not_before = wait_until
+    
+    def _record_sync_hint(self, data):
+        """Remember the next-sync suggestion returned by /verify"""
+        if not isinstance(data, dict):
+            return
+        next_at = None
+        try:
+            if data.get('next_sync_in') is not None:
+                next_at = time.time() + float(data['next_sync_in'])
+            elif data.get('next_sync_at') is not None:
+                value = data['next_sync_at']
+                if isinstance(value, (int, float)):
+                    next_at = float(value)
+                else:
+                    next_at = datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+        except (TypeError, ValueError):
+            next_at = None
+        self.suggested_next_sync = next_at
+    
+    def _record_wire_formats(self, data):
+        """Use MessagePack uploads if /verify lists it in upload_formats"""
+        if not isinstance(data, dict):
+            return
+        formats = data.get('upload_formats') or []
+        if self.uplink_url:
+            return  # The aggregator takes JSON; it compresses for the WAN
+        if WIRE_FORMAT_MSGPACK in formats and self.preferred_wire_format != WIRE_FORMAT_JSON:
+            self.wire_format = WIRE_FORMAT_MSGPACK
+    
+    def seconds_until_allowed(self):
+        """Seconds the server asked us to wait before calling it again"""
+        return max(0.0, self.not_before - time.time())
+    
+    def verify_license(self):
+        """Verify license key and get company info"""
+        try:
+            response = self.session.post(
+                f"{API_BASE_URL}/verify",
+                timeout=10
+            )
+            self._record_pacing(response)
+            if response.status_code == 200:
+                data = response.json()
+                self._record_sync_hint(data)
+                self._record_wire_formats(data)
+                return data
+            return None
+        except Exception as e:
+            print(f"License verification error: {e}")
+            return None
+    
+    def get_company_devices(self):
+        """Get all devices for this company (tenant)"""
+        try:
+            response = self.session.get(
+                f"{API_BASE_URL}/devices",
+                timeout=10
+            )
+            self._record_pacing(response)
+            if response.status_code == 200:
+                return response.json().get('devices', [])
+            return []
+        except Exception as e:
+            print(f"Get devices error: {e}")
+            return []
+    
+    def send_attendance(self, records, compress=False):
+        """Send attendance records to cloud (or to the site aggregator)
+        
+        Returns the server's reply, {'success': False, 'status': code} for any
+        other HTTP status, or None when the server could not be reached.
+        """
+        try:
+            body, content_type = encode_attendance(records, self.wire_format)
+            headers = {'Content-Type': content_type}
+            if compress:
+                body = gzip.compress(body, compresslevel=6)
+                headers['Content-Encoding'] = 'gzip'
+            response = self.session.post(
+                f"{self.uplink_url or API_BASE_URL}/attendance",
+                data=body,
+                headers=headers,
+                timeout=30
+            )
+            self.bytes_sent += len(body)
+            if response.status_code == 415 and self.wire_format != WIRE_FORMAT_JSON:
+                # Server stopped accepting the binary format: fall back for good
+                self.wire_format = WIRE_FORMAT_JSON
+                return self.send_attendance(records, compress)
+            self._record_pacing(response)
+            if response.status_code == 200:
+                return response.json()
+            return {'success': False, 'status': response.status_code, 'error': response.text[:200]}
+        except Exception as e:
+            print(f"Send attendance error: {e}")
+            return None
+
+
+class PeerGroup(QObject):
+    """Agents of the same license on the LAN, and which of them polls each device
+    
+    Every agent multicasts a signed heartbeat every PEER_HEARTBEAT_SECONDS.
+    Each device belongs to exactly one live agent by rendezvous hashing
+    (highest sha256(agent, device) wins), so all agents with the same peer
+    list agree on the owner without further messages. A peer silent for
+    PEER_TIMEOUT_SECONDS, or one that said goodbye, drops out and its
+    devices move to the others on their next cycle. Heartbeats are signed
+    with the license key and carry only a hash of it; messages more than
+    PEER_MESSAGE_MAX_AGE_SECONDS old, or not newer than the sender's last
+    one, are dropped so a recorded 'bye' cannot be replayed. Devices an
+    agent failed to read PEER_DROP_AFTER_FAILURES times in a row are listed
+    in its heartbeat and go to the next agent in the ranking for a while.
+    """
+    
+    peers_changed = pyqtSignal(int)  # live peer count, excluding this agent
+    
+    def __init__(self, license_key, parent=None, observer=False):
+        super().__init__(parent)
+        self.node_id = uuid.uuid4().hex[:12]
+        self.host = platform.node()
+        self.observer = observer  # Listen only (--peers): never owns devices
+        self.tenant = self.tenant_for(license_key)
+        self._secret = license_key.encode('utf-8')
+        self.peers = {}  # node id -> {'host', 'address', 'seen', 'unreachable'}
+        self.last_ts = {}  # node id -> 'ts' of its newest message
+        self.failures = {}  # device key -> failed reads in a row by this agent
+        self.dropped = {}  # device key -> time.time() until which the peers poll it
+        self.socket = None
+        self.active = False
+        self.timer = QTimer(self)
+        self.timer.setInterval(PEER_HEARTBEAT_SECONDS * 1000)
+        self.timer.timeout.connect(self._heartbeat)
+    
+    @staticmethod
+    def tenant_for(license_key):
+        return hashlib.sha256(f"attendux-peers:{license_key}".encode('utf-8')).hexdigest()[:16]
+    
+    def start(self):
+        """Join the multicast group; returns False (and owns every device) if the LAN refuses"""
+        self.socket = QUdpSocket(self)
+        bound = self.socket.bind(
+            QHostAddress(QHostAddress.AnyIPv4), PEER_PORT,
+            QUdpSocket.ShareAddress | QUdpSocket.ReuseAddressHint
+        )
+        if not bound or not self.socket.joinMulticastGroup(QHostAddress(PEER_GROUP_ADDRESS)):
+            print(f"LAN peer discovery unavailable: {self.socket.errorString()}")
+            self.socket.close()
+            self.socket = None
+            return False
+        self.socket.setSocketOption(QAbstractSocket.MulticastTtlOption, 1)
+        self.socket.setSocketOption(QAbstractSocket.MulticastLoopbackOption, 1)  # Peers on this PC too
+        self.socket.readyRead.connect(self._on_ready_read)
+        self.active = True
+        if not self.observer:
+            self._send('hello')  # Peers answer at once, so the first sync already knows them
+            self.timer.start()
+        else:
+            self._send('probe')
+        return True
+    
+    def stop(self):
+        """Say goodbye so peers take over this agent's devices without waiting for the timeout"""
+        self.timer.stop()
+        if self.socket:
+            if not self.observer:
+                self._send('bye')
+            self.socket.close()
+            self.socket = None
+        self.active = False
+    
+    def _heartbeat(self):
+        self._send('heartbeat')
+        self._expire()
+    
+    def _send(self, kind):
+        if self.socket:
+            self.socket.writeDatagram(self._datagram(kind), QHostAddress(PEER_GROUP_ADDRESS), PEER_PORT)
+    
+    def _datagram(self, kind):
+        message = json.dumps({
+            'v': 1, 'kind': kind, 'tenant': self.tenant, 'node': self.node_id,
+            'host': self.host, 'ts': time.time(), 'unreachable': sorted(self._dropped())
+        }, sort_keys=True)
+        signature = hmac.new(self._secret, message.encode('utf-8'), hashlib.sha256).hexdigest()
+        return json.dumps({'msg': message, 'sig': signature}).encode('utf-8')
+    
+    def _on_ready_read(self):
+        changed = False
+        while self.socket and self.socket.hasPendingDatagrams():
+            data, address, _port = self.socket.readDatagram(self.socket.pendingDatagramSize())
+            changed |= self._receive(data, address.toString())
+        if changed:
+            self.peers_changed.emit(len(self.peers))
+    
+    def _receive(self, data, address):
+        """Apply one datagram; returns True if the peer list changed"""
+        try:
+            envelope = json.loads(data)
+            expected = hmac.new(self._secret, envelope['msg'].encode('utf-8'), hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, envelope['sig']):
+                return False  # Another license, or forged
+            message = json.loads(envelope['msg'])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return False
+        node = message.get('node')
+        if message.get('tenant') != self.tenant or node == self.node_id:
+            return False
+        stamp = message.get('ts')
+        if not isinstance(stamp, (int, float)) or abs(time.time() - stamp) > PEER_MESSAGE_MAX_AGE_SECONDS \
+                or stamp <= self.last_ts.get(node, 0):
+            return False  # Stale or replayed
+        self.last_ts[node] = stamp
+        if message['kind'] == 'bye':
+            return self.peers.pop(node, None) is not None
+        if message['kind'] == 'probe':
+            if not self.observer:
+                self._send('heartbeat')
+            return False
+        unreachable = message.get('unreachable')
+        unreachable = {key for key in unreachable if isinstance(key, str)} if isinstance(unreachable, list) else set()
+        changed = node not in self.peers or self.peers[node]['unreachable'] != unreachable
+        self.peers[node] = {
+            'host': message.get('host'), 'address': address, 'seen': time.monotonic(), 'unreachable': unreachable
+        }
+        if message['kind'] == 'hello' and not self.observer:
+            self._send('heartbeat')
+        return changed
+    
+    def _expire(self):
+        cutoff = time.monotonic() - PEER_TIMEOUT_SECONDS
+        stale = [node for node, peer in self.peers.items() if peer['seen'] < cutoff]
+        for node in stale:
+            del self.peers[node]
+        if stale:
+            self.peers_changed.emit(len(self.peers))
+    
+    def nodes(self):
+        """Live agents, including this one unless it is an observer"""
+        self._expire()
+        nodes = sorted(self.peers)
+        return nodes if self.observer else sorted(nodes + [self.node_id])
+    
+    @staticmethod
+    def _weight(node, device):
+        return hashlib.sha256(f"{node}:{device_key(device)}".encode('utf-8')).digest()
+    
+    def owner(self, device, nodes=None):
+        nodes = nodes or self.nodes()
+        key = device_key(device)
+        # Agents that gave up on the device are skipped, unless all of them did
+        willing = [node for node in nodes if key not in self._unreachable(node)] or nodes
+        return max(willing, key=lambda node: self._weight(node, device)) if willing else None
+    
+    def _unreachable(self, node):
+        if node == self.node_id:
+            return self._dropped()
+        return self.peers.get(node, {}).get('unreachable', ())
+    
+    def _dropped(self):
+        """Device keys this agent currently leaves to its peers"""
+        now = time.time()
+        return {key for key, until in self.dropped.items() if until > now}
+    
+    def record_results(self, results):
+        """Count failed device reads; returns keys now left to the peers
+        
+        After PEER_DROP_AFTER_FAILURES failed reads in a row (and while there
+        are peers to take over) a device is left to them for PEER_DROP_SECONDS.
+        A clean read resets the count.
+        """
+        dropped = []
+        for entry in results:
+            key = entry.get('key')
+            if not key:
+                continue
+            if not entry.get('read_failed'):
+                self.failures.pop(key, None)
+                continue
+            self.failures[key] = self.failures.get(key, 0) + 1
+            if self.failures[key] >= PEER_DROP_AFTER_FAILURES and self.peers and key not in self._dropped():
+                self.dropped[key] = time.time() + PEER_DROP_SECONDS
+                dropped.append(key)
+        if dropped and self.active:
+            self._send('heartbeat')  # Peers pick the devices up on their next cycle
+        return dropped
+    
+    def assign(self, devices):
+        """(devices this agent polls, {device key: host polling it} for the rest)"""
+        nodes = self.nodes()
+        mine, others = [], {}
+        for device in devices:
+            owner = self.owner(device, nodes)
+            if owner == self.node_id:
+                mine.append(device)
+            else:
+                others[device_key(device)] = self.peers.get(owner, {}).get('host') or owner
+        return mine, others
+    
+    def diagnostics(self):
+        return {
+            'node': self.node_id,
+            'active': self.active,
+            'unreachable': sorted(self._dropped()),
+            'peers': {
+                node: {'host': peer['host'], 'address': peer['address'], 'unreachable': sorted(peer['unreachable'])}
+                for node, peer in self.peers.items()
+            }
+        }
+
+
+def run_peer_status(argv):
+    """Listen on the LAN and print which agent polls each configured device: --peers [SECONDS]"""
+    parser = argparse.ArgumentParser(prog="attendux_sync_agent --peers",
+                                     description="Show which agent on the LAN polls each configured device")
+    parser.add_argument('seconds', type=float, nargs='?', default=PEER_HEARTBEAT_SECONDS + 1,
+                        help=f"how long to listen (default {PEER_HEARTBEAT_SECONDS + 1})")
+    seconds = parser.parse_args(argv[argv.index('--peers') + 1:]).seconds
+    if not 0 < seconds < 24 * 60 * 60:
+        parser.error("SECONDS must be positive and under a day")
+    settings = SettingsManager.load()
+    if not settings.get('license_key'):
+        print("No license key configured")
+        return 1
+    
+    app = QCoreApplication(argv)
+    group = PeerGroup(settings['license_key'], observer=True)
+    if not group.start():
+        return 1
+    QTimer.singleShot(int(seconds * 1000), app.quit)
+    app.exec_()
+    
+    nodes = group.nodes()
+    print(f"{len(nodes)} agents:")
+    for node in nodes:
+        print(f"  {node}  {group.peers[node]['host']} ({group.peers[node]['address']})")
+    for device in settings.get('devices', []):
+        owner = group.owner(device, nodes)
+        print(f"  {device['name']:<24} -> {group.peers[owner]['host'] + ' ' + owner if owner else 'nobody'}")
+    group.stop()
+    return 0
+
+
+class SyncPacer:
+    """Schedule auto-sync at a per-agent phase and honour server pacing"""
+    
+    def __init__(self, agent_key):
+        # Deterministic per agent: same license on another PC gets another phase
+        seed = f"{agent_key}:{uuid.getnode()}".encode('utf-8')
+        digest = hashlib.sha256(seed).digest()
+        self.phase_fraction = int.from_bytes(digest[:8], 'big') / float(1 << 64)
+        self.coalesced_ticks = 0
+    
+    def next_sync_at(self, interval_seconds, api=None, last_started=None, now=None):
+        """Return the epoch time of this agent's next sync slot"""
+        now = time.time() if now is None else now
+        phase = self.phase_fraction * interval_seconds
+        
+        # Next slot on this agent's grid; missed slots collapse into this one
+        next_at = phase + (math.floor((now - phase) / interval_seconds) + 1) * interval_seconds
+        if last_started and next_at - last_started < min(MIN_SYNC_GAP_SECONDS, interval_seconds):
+            next_at += interval_seconds
+        
+        return self._apply_server_hints(next_at, api, now)
+    
+    def first_sync_at(self, interval_seconds, api=None, now=None):
+        """Return the epoch time of the first sync after a (re)start"""
+        now = time.time() if now is None else now
+        spread = min(interval_seconds, STARTUP_SYNC_SPREAD_SECONDS)
+        return self._apply_server_hints(now + self.phase_fraction * spread, api, now)
+    
+    def _apply_server_hints(self, next_at, api, now):
+        """Push next_at past any wait requested by the server"""
+        if not api:
+            return next_at
+        
+        hinted = api.suggested_next_sync
+        if hinted and hinted > now:
+            next_at = max(next_at, hinted)
+        
+        if api.not_before > next_at:
+            # Spread agents released by the same Retry-After as well
+            next_at = api.not_before + self.phase_fraction * SERVER_HINT_SPREAD_SECONDS
+        
+        return next_at
+    
+    def record_fire(self, scheduled_at, interval_seconds, now=None):
+        """Count slots skipped because the timer fired late (sleep, suspend)"""
+        now = time.time() if now is None else now
+        if not scheduled_at or interval_seconds <= 0:
+            return 0
+        missed = int(max(0.0, now - scheduled_at) // interval_seconds)
+        self.coalesced_ticks += missed
+        return missed
+
+
+Punch = namedtuple('Punch', ['user_id', 'timestamp', 'status', 'punch'])
+
+
+def decode_zk_time(value):
+    """Decode a ZKTeco packed timestamp (same encoding as zkemsdk DecodeTime)"""
+    second = value % 60
+    value //= 60
+    minute = value % 60
+    value //= 60
+    hour = value % 24
+    value //= 24
+    day = value % 31 + 1
+    value //= 31
+    month = value % 12 + 1
+    year = value // 12 + 2000
+    return datetime(year, month, day, hour, minute, second)
+
+
+def iter_attendance_batches(conn, batch_size=STREAM_BATCH_SIZE, info=None):
+    """Stream a connected device's attendance log in batches of Punch tuples
+    
+    Unlike conn.get_attendance(), the buffer is read chunk by chunk and decoded
+    as it arrives, so memory stays at one chunk plus one batch regardless of
+    how many punches the clock holds. Uses pyzk's buffered-read commands
+    directly; falls back to get_attendance() if they are unavailable.
+    The detected record size is stored in info['record_size'] and the log's
+    record count in info['records'] if given, before the first batch.
+    """
+    send_command = getattr(conn, '_ZK__send_command', None)
+    read_chunk = getattr(conn, '_ZK__read_chunk', None)
+    if send_command is None or read_chunk is None:
+        yield from _batched_attendance(conn, batch_size, info)
+        return
+    
+    conn.read_sizes()
+    if info is not None:
+        info['records'] = conn.records
+    if conn.records == 0:
+        return
+    
+    # Resolve device-internal uids to enrolled user ids once (users are few)
+    users = conn.get_users()
+    user_ids_by_uid = {user.uid: user.user_id for user in users}
+    known_user_ids = {user.user_id for user in users}
+    
+    max_chunk = 0xFFc0 if conn.tcp else 16 * 1024
+    command_string = struct.pack('<bhii', 1, zk_const.CMD_ATTLOG_RRQ, 0, 0)
+    cmd_response = send_command(1503, command_string, 1024)
+    if not cmd_response.get('status'):
+        raise ZKErrorResponse("RWB Not supported")
+    
+    def chunks():
+        if cmd_response['code'] == zk_const.CMD_DATA:
+            # Small logs arrive inline with the reply
+            data = conn._ZK__data
+            if conn.tcp and len(data) < conn._ZK__tcp_length - 8:
+                data += conn._ZK__recieve_raw_data(conn._ZK__tcp_length - 8 - len(data))
+            yield data
+            return
+        size = struct.unpack('I', conn._ZK__data[1:5])[0]
+        start = 0
+        try:
+            while start < size:
+                length = min(max_chunk, size - start)
+                yield read_chunk(start, length)
+                start += length
+        finally:
+            conn.free_data()
+    
+    pending = b''
+    record_size = None
+    batch = []
+    for chunk in chunks():
+        pending += chunk
+        if record_size is None:
+            if len(pending) < 4:
+                continue
+            total_size = struct.unpack('I', pending[:4])[0]
+            record_size = total_size / conn.records
+            if record_size not in (8, 16):
+                record_size = 40
+            record_size = int(record_size)
+            if info is not None:
+                info['record_size'] = record_size
+            pending = pending[4:]
+        
+        usable = len(pending) - len(pending) % record_size
+        for offset in range(0, usable, record_size):
+            raw = pending[offset:offset + record_size]
+            if record_size == 8:
+                uid, status, timestamp, punch = struct.unpack('<HB4sB', raw)
+                user_id = user_ids_by_uid.get(uid, str(uid))
+            elif record_size == 16:
+                user_id, timestamp, status, punch, _reserved, _workcode = struct.unpack('<I4sBB2sI', raw)
+                user_id = str(user_id)
+                if user_id not in known_user_ids:
+                    user_id = user_ids_by_uid.get(user_id, user_id)
+            else:
+                _uid, user_id, status, timestamp, punch, _space = struct.unpack('<H24sB4sB8s', raw)
+                user_id = user_id.split(b'\x00')[0].decode(errors='ignore')
+            
+            timestamp = decode_zk_time(struct.unpack('<I', timestamp)[0])
+            batch.append(Punch(user_id, timestamp, status, punch))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        pending = pending[usable:]
+    
+    if batch:
+        yield batch
+
+
+def _batched_attendance(conn, batch_size, info=None):
+    """Fallback for pyzk builds without buffered-read internals"""
+    attendances = conn.get_attendance()
+    if info is not None:
+        info['records'] = len(attendances)
+    for start in range(0, len(attendances), batch_size):
+        yield [
+            Punch(str(att.user_id), att.timestamp, getattr(att, 'status', 1), getattr(att, 'punch', 0))
+            for att in attendances[start:start + batch_size]
+        ]
+
+
+class UploadAggregator:
+    """Merge records from several devices into shared upload batches
+    
+    Batches are flushed when they reach batch_size records or when the oldest
+    buffered record has waited flush_seconds. Each batch remembers which
+    device contributed which slice, so synced counts, checkpoints and errors
+    are still attributed per device.
+    """
+    
+    def __init__(self, send, on_segment, batch_size=UPLOAD_CHUNK_SIZE, flush_seconds=UPLOAD_FLUSH_SECONDS):
+        self.send = send              # callable(records) -> API result
+        self.on_segment = on_segment  # callable(device, records, synced, ok)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.records = []
+        self.segments = []  # [device, count] in buffer order
+        self.oldest = None
+        self.failed = set()  # device keys whose later records must not be sent
+        self.requests = 0
+    
+    def pending_for(self, device):
+        """Number of buffered records from a device"""
+        key = device_key(device)
+        return sum(count for dev, count in self.segments if device_key(dev) == key)
+    
+    def add(self, device, records):
+        """Buffer a device's records, sending every full batch"""
+        if not records or device_key(device) in self.failed:
+            return
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.records.extend(records)
+        if self.segments and self.segments[-1][0] is device:
+            self.segments[-1][1] += len(records)
+        else:
+            self.segments.append([device, len(records)])
+        while len(self.records) >= self.batch_size:
+            self._send_batch(self.batch_size)
+    
+    def seconds_until_due(self):
+        """Seconds before the partial batch must be flushed (None when empty)"""
+        if self.oldest is None:
+            return None
+        return max(0.0, self.oldest + self.flush_seconds - time.monotonic())
+    
+    def flush(self):
+        """Send everything buffered"""
+        while self.records:
+            self._send_batch(self.batch_size)
+    
+    def _send_batch(self, size):
+        batch = self.records[:size]
+        del self.records[:size]
+        
+        # Split the segment list at the batch boundary
+        batch_segments = []
+        remaining = len(batch)
+        while remaining:
+            device, count = self.segments[0]
+            take = min(count, remaining)
+            batch_segments.append((device, take))
+            remaining -= take
+            if take == count:
+                self.segments.pop(0)
+            else:
+                self.segments[0][1] = count - take
+        self.oldest = time.monotonic() if self.records else None
+        
+        self.requests += 1
+        result = self.send(batch)
+        ok = bool(result and result.get('success'))
+        synced_counts = self._attribute_synced(batch_segments, result) if ok else {}
+        
+        offset = 0
+        for device, count in batch_segments:
+            segment = batch[offset:offset + count]
+            offset += count
+            if not ok:
+                self.failed.add(device_key(device))
+            self.on_segment(device, segment, synced_counts.get(device_key(device), 0), ok)
+        
+        if not ok:
+            self._drop_failed()
+    
+    def _drop_failed(self):
+        """Discard buffered records of devices that just failed"""
+        kept_records = []
+        kept_segments = []
+        offset = 0
+        for device, count in self.segments:
+            if device_key(device) not in self.failed:
+                kept_records.extend(self.records[offset:offset + count])
+                kept_segments.append([device, count])
+            offset += count
+        self.records = kept_records
+        self.segments = kept_segments
+        if not self.records:
+            self.oldest = None
+    
+    @staticmethod
+    def _attribute_synced(segments, result):
+        """Split a batch's synced count across the devices that contributed"""
+        by_device = result.get('synced_by_device')
+        if isinstance(by_device, dict):
+            return {str(key): int(value) for key, value in by_device.items()}
+        
+        totals = {}
+        for device, count in segments:
+            key = device_key(device)
+            totals[key] = totals.get(key, 0) + count
+        batch_size = sum(totals.values())
+        synced = int(result.get('synced', 0))
+        if synced >= batch_size:
+            return totals
+        
+        # Server skipped some (duplicates): share the count proportionally
+        shares = {key: synced * count // batch_size for key, count in totals.items()}
+        leftover = synced - sum(shares.values())
+        for key in sorted(totals, key=totals.get, reverse=True)[:leftover]:
+            shares[key] += 1
+        return shares
+
+
+class SyncEventBus(QObject):
+    """Coalesces sync engine events into periodic UI snapshots
+    
+    Engine threads post from anywhere; everything posted within
+    EVENT_BUS_INTERVAL_MS reaches the GUI as one snapshot_ready. Logs beyond
+    max_log_lines per snapshot are dropped and counted, progress keeps only
+    the latest value and device state is merged per device, so the UI's
+    work per snapshot is bounded however fast the engine runs. Nothing is
+    scheduled while no events arrive.
+    """
+    
+    snapshot_ready = pyqtSignal(dict)  # logs, dropped_logs, progress, device_states
+    _wake = pyqtSignal()
+    
+    def __init__(self, parent=None, interval_ms=EVENT_BUS_INTERVAL_MS, max_log_lines=EVENT_BUS_MAX_LOG_LINES):
+        super().__init__(parent)
+        self.interval_ms = interval_ms
+        self.max_log_lines = max_log_lines
+        self._lock = threading.Lock()
+        self._armed = False
+        self._reset()
+        self.stats = {
+            'posted': 0,
+            'snapshots': 0,
+            'dropped_logs': 0,
+            'superseded_progress': 0,
+            'merged_states': 0
+        }
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self._wake.connect(self._arm, Qt.QueuedConnection)
+    
+    def _reset(self):
+        self._logs = []
+        self._dropped_logs = 0
+        self._progress = None
+        self._states = {}
+    
+    def _posted(self):
+        """Count an event and wake the GUI thread once per interval (lock held)"""
+        self.stats['posted'] += 1
+        if not self._armed:
+            self._armed = True
+            self._wake.emit()
+    
+    def _arm(self):
+        if not self._timer.isActive():
+            self._timer.start(self.interval_ms)
+    
+    def log(self, message, level="info"):
+        with self._lock:
+            if len(self._logs) < self.max_log_lines:
+                self._logs.append((message, level))
+            else:
+                self._dropped_logs += 1
+                self.stats['dropped_logs'] += 1
+            self._posted()
+    
+    def progress(self, current, total):
+        with self._lock:
+            if self._progress is not None:
+                self.stats['superseded_progress'] += 1
+            self._progress = (current, total)
+            self._posted()
+    
+    def device_state(self, key, state):
+        with self._lock:
+            if key in self._states:
+                self.stats['merged_states'] += 1
+            self._states.setdefault(key, {}).update(state)
+            self._posted()
+    
+    def flush(self):
+        """Emit everything posted so far as one snapshot (GUI thread)"""
+        self._timer.stop()
+        with self._lock:
+            self._armed = False
+            if not (self._logs or self._dropped_logs or self._progress or self._states):
+                return
+            snapshot = {
+                'logs': self._logs,
+                'dropped_logs': self._dropped_logs,
+                'progress': self._progress,
+                'device_states': self._states
+            }
+            self._reset()
+            self.stats['snapshots'] += 1
+        self.snapshot_ready.emit(snapshot)
+
+
+class SyncWorker(QThread):
+    """Background worker for syncing devices
+    
+    Device reads (producer thread) run ahead of cloud uploads (this thread)
+    through a bounded queue, so the LAN and the uplink work at the same time.
+    Device logs are streamed in STREAM_BATCH_SIZE batches and at most
+    PIPELINE_QUEUE_DEPTH batches wait in memory, however large the log is.
+    """
+    
+    # Signals; logs, progress and device state go through self.events (SyncEventBus)
+    sync_complete_signal = pyqtSignal(dict)  # result stats
+    
+    def __init__(self, api, devices, checkpoint=None, events=None, profiler=None, archive=None, profiles=None,
+                 health=None, backfill=None):
+        super().__init__()
+        self.api = api
+        self.devices = devices
+        self.checkpoint = checkpoint or SyncCheckpoint()
+        self.events = events or SyncEventBus()
+        self.profiler = profiler
+        self.archive = archive
+        self.profiles = profiles
+        self.health = health
+        self.backfill = backfill
+        self.tracer = SpanTracer("sync")
+        self.zk_factory = ZK if ZK_AVAILABLE else None  # TrafficCapture/TrafficReplay swap this
+        self.is_running = True
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._deferred = False
+        self._active_conn = None
+        self._device_deadline = None   # monotonic; the watchdog aborts the session past it
+        self._device_key = None
+        self._stalled = None           # key of the device whose session the watchdog aborted
+        self._cycle_expired = False
+        self._abandon_fetch = threading.Event()
+        self.started_at = None
+        self.aggregator = None
+        self.device_results = {}
+        self.device_timings = {}  # device key -> connect/fetch seconds, written by the fetch thread
+    
+    def run(self):
+        """Run sync process, traced, and under the profiler if one was given"""
+        if self.profiler:
+            self.profiler.start()
+        try:
+            with self.tracer.span('sync_cycle', devices=len(self.devices)):
+                self._sync()
+        finally:
+            if self.profiler:
+                try:
+                    paths = self.profiler.stop()
+                    self.events.log(f"🔬 Profile saved to {os.path.dirname(paths[0])}", "info")
+                except Exception as e:
+                    self.events.log(f"⚠️ Failed to write profile: {e}", "warning")
+            try:
+                self.tracer.export()
+            except Exception as e:
+                print(f"Failed to write sync trace: {e}")
+    
+    def _sync(self):
+        """One sync cycle: fetch and upload pipelines, then report"""
+        self.total_synced = 0
+        self.total_records = 0
+        self.errors = []
+        self.fetch_seconds = 0.0
+        self.upload_seconds = 0.0
+        self._deferred = False
+        self.device_timings = {}
+        self.stalls = []
+        self.quarantined = []
+        self.started_at = time.monotonic()
+        bytes_before = getattr(self.api, 'bytes_sent', 0)
+        
+        self.events.log("🔄 Starting sync...", "info")
+        
+        started = time.perf_counter()
+        work = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+        producer = threading.Thread(target=self._fetch_devices, args=(work,), name="SyncFetch", daemon=True)
+        watchdog_done = threading.Event()
+        watchdog = threading.Thread(
+            target=self._watchdog, args=(producer, watchdog_done), name="SyncWatchdog", daemon=True
+        )
+        producer.start()
+        watchdog.start()
+        try:
+            self._upload_devices(work)
+        except SyncCancelled:
+            pass
+        # Device reads notice cancellation on their own; don't wait on a hung clock
+        while producer.is_alive() and not self._cancel.is_set() and not self._abandon_fetch.is_set():
+            producer.join(CANCEL_POLL_SECONDS)
+        watchdog_done.set()
+        wall_seconds = time.perf_counter() - started
+        
+        # Time both stages were busy at once
+        overlap = max(0.0, self.fetch_seconds + self.upload_seconds - wall_seconds)
+        shorter_stage = min(self.fetch_seconds, self.upload_seconds)
+        pipeline = {
+            'wall_seconds': round(wall_seconds, 3),
+            'fetch_seconds': round(self.fetch_seconds, 3),
+            'upload_seconds': round(self.upload_seconds, 3),
+            'overlap_seconds': round(overlap, 3),
+            'overlap_ratio': round(min(1.0, overlap / shorter_stage), 3) if shorter_stage > 0 else 0.0
+        }
+        
+        # Per-device timings from the fetch thread; upload bytes split by records uploaded
+        bytes_uploaded = getattr(self.api, 'bytes_sent', 0) - bytes_before
+        for key, entry in self.device_results.items():
+            entry.update(self.device_timings.get(key, {}))
+            if self.total_records:
+                entry['bytes'] = int(bytes_uploaded * entry['uploaded'] / self.total_records)
+        
+        # Complete
+        result = {
+            'total_synced': self.total_synced,
+            'total_records': self.total_records,
+            'devices_count': len(self.devices),
+            'errors': self.errors,
+            'pipeline': pipeline,
+            'upload_requests': self.aggregator.requests if self.aggregator else 0,
+            'bytes_uploaded': bytes_uploaded,
+            'device_results': [
+                {key: value for key, value in entry.items() if key != 'reported'}
+                for entry in self.device_results.values()
+            ],
+            'stalls': self.stalls,
+            'quarantined': self.quarantined,
+            'cycle_expired': self._cycle_expired,
+            'cancelled': self._cancel.is_set(),
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        self.events.log(
+            f"⚡ Fetch {pipeline['fetch_seconds']:.1f}s + upload {pipeline['upload_seconds']:.1f}s "
+            f"in {pipeline['wall_seconds']:.1f}s (overlap {pipeline['overlap_ratio'] * 100:.0f}%), "
+            f"{result['upload_requests']} upload requests",
+            "info"
+        )
+        if self._cancel.is_set():
+            self.events.log(f"⏹ Sync stopped, {self.total_synced} records synced (progress saved)", "warning")
+        elif len(self.errors) == 0:
+            self.events.log(f"✅ Sync completed! {self.total_synced} records synced", "success")
+        else:
+            self.events.log(f"⚠️ Sync completed with {len(self.errors)} errors", "warning")
+        
+        self.sync_complete_signal.emit(result)
+    
+    def _add_error(self, error, icon="❌", level="error"):
+        """Record an error from either pipeline stage"""
+        with self._lock:
+            self.errors.append(error)
+        self.events.log(f"   {icon} {error}", level)
+    
+    def _fetch_devices(self, work):
+        """Producer: read each device and queue its records for upload"""
+        try:
+            for idx, device in enumerate(self.devices):
+                if not self.is_running or self._deferred or self._abandon_fetch.is_set():
+                    break
+                if self._cycle_expired:
+                    skipped = len(self.devices) - idx
+                    self._add_error(
+                        f"Sync cycle passed its {CYCLE_DEADLINE_SECONDS // 60} min budget, "
+                        f"{skipped} devices left for the next cycle", icon="⏱", level="warning"
+                    )
+                    break
+                
+                self.events.progress(idx + 1, len(self.devices))
+                
+                # Check if ZK library is available
+                if not ZK_AVAILABLE:
+                    self._add_error(f"ZK library not installed. Cannot sync {device['name']}")
+                    continue
+                
+                key = device_key(device)
+                quarantine = self.health.quarantined_for(device) if self.health else 0
+                if quarantine:
+                    self.quarantined.append(device['name'])
+                    self.events.log(
+                        f"⛔ Skipping {device['name']}: quarantined for {quarantine // 60} more min after repeated stalls",
+                        "warning"
+                    )
+                    self.events.device_state(key, {'status': 'quarantined'})
+                    self._put(work, (idx, device, [], True, "quarantined", None))
+                    continue
+                
+                try:
+                    self._fetch_device(idx, device, work)
+                except SyncCancelled:
+                    raise
+                except Exception as e:
+                    error = f"Error syncing {device['name']}: {str(e)}"
+                    if self._stalled == key:
+                        error = self._record_stall(device)
+                    elif not self._cancel.is_set():
+                        self._add_error(error)
+                        status = 'unreachable' if isinstance(e, DeviceUnreachable) else 'error'
+                        self.events.device_state(key, {'status': status})
+                    # Let the uploader close out whatever was queued for this device
+                    self._put(work, (idx, device, [], True, error, None))
+        except SyncCancelled:
+            pass
+        finally:
+            try:
+                self._put(work, None)
+            except SyncCancelled:
+                pass
+    
+    def _record_stall(self, device):
+        """Log and count a session the watchdog aborted; returns the error text"""
+        self.stalls.append(device['name'])
+        error = f"{device['name']} stalled past its {self._device_budget(device)}s budget, session aborted"
+        self._add_error(error, icon="⏱")
+        self.events.device_state(device_key(device), {'status': 'stalled'})
+        if self.health:
+            try:
+                quarantine = self.health.record_stall(device)
+            except OSError as e:
+                print(f"Failed to save device health: {e}")
+                quarantine = 0
+            if quarantine:
+                self.events.log(
+                    f"   ⛔ {device['name']} quarantined for {quarantine // 60} min after "
+                    f"{QUARANTINE_AFTER_STALLS} stalls in a row", "warning"
+                )
+                self.events.device_state(device_key(device), {'status': 'quarantined'})
+        return error
+    
+    def _device_budget(self, device):
+        """Seconds a device session may take, scaled by the size of its log"""
+        profile = self.profiles.get(device) if self.profiles else None
+        records = (profile or {}).get('records')
+        if not isinstance(records, int):
+            records = 0
+        return DEVICE_DEADLINE_BASE_SECONDS + DEVICE_DEADLINE_PER_1000_RECORDS * records // 1000
+    
+    def _watchdog(self, producer, done):
+        """Abort device sessions and cycles that outrun their budgets
+        
+        A clock that accepts TCP but trickles (or stops) mid-transfer keeps
+        pyzk's recv() alive far past its socket timeout. Shutting the socket
+        down makes the read fail, so the device is recorded as stalled and
+        the rest of the fleet carries on.
+        """
+        cycle_deadline = self.started_at + CYCLE_DEADLINE_SECONDS
+        abandon_at = None
+        while not done.wait(WATCHDOG_POLL_SECONDS):
+            if self._cancel.is_set():
+                return
+            now = time.monotonic()
+            deadline = self._device_deadline
+            if deadline is not None and now > deadline and self._stalled is None:
+                self._stalled = self._device_key
+                self._abort_device_session()
+            
+            if now > cycle_deadline and not self._cycle_expired:
+                self._cycle_expired = True
+                self._abort_device_session()
+                abandon_at = now + CYCLE_ABANDON_GRACE_SECONDS
+            if abandon_at and now > abandon_at and producer.is_alive() and not self._abandon_fetch.is_set():
+                # The read ignored the abort: upload what was read and finish without it
+                self._abandon_fetch.set()
+                self._add_error("Device read did not stop after the cycle deadline; abandoned it", icon="⏱")
+    
+    def _put(self, work, item):
+        """Queue an item, giving up if the sync is cancelled while the queue is full"""
+        while True:
+            if self._cancel.is_set() or self._abandon_fetch.is_set():
+                raise SyncCancelled()
+            try:
+                work.put(item, timeout=CANCEL_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
     
-    def __init__(self, license_key):
-        self.license_key = license_key
-        self.session = requests.Session()
-        self.session.headers.update({
-            'X-License-Key': license_key,
-            'Content-Type': 'application/json',
-            'User-Agent': 'Attendux-Sync-Agent/1.0'
-        })
+    def _get(self, work, timeout=None):
+        """Take the next item, returning promptly if the sync is cancelled
+        
+        Returns QUEUE_IDLE if nothing arrived within timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self._cancel.is_set():
+                raise SyncCancelled()
+            if self._abandon_fetch.is_set():
+                return None  # Treat as end of input; the stuck read is left behind
+            wait = CANCEL_POLL_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return QUEUE_IDLE
+            try:
+                return work.get(timeout=wait)
+            except queue.Empty:
+                continue
     
-    def verify_license(self):
-        """Verify license key and get company info"""
+    def _fetch_device(self, idx, device, work):
+        """Connect to a device and queue its new attendance in upload batches"""
+        self.events.log(f"📡 Connecting to {device['name']} ({device['ip']}:{device['port']})...", "info")
+        
+        key = device_key(device)
+        self.events.device_state(key, {'status': 'connecting'})
+        
+        # Watchdog budget for connect + read; time blocked on the uploader is added back
+        self._device_key = key
+        self._stalled = None
+        self._device_deadline = time.monotonic() + self._device_budget(device)
+        
+        fetch_started = time.perf_counter()
         try:
-            response = self.session.post(
-                f"{API_BASE_URL}/verify",
-                timeout=10
+            conn = self._connect(device)
+        except Exception:
+            self._device_deadline = None
+            raise
+        connect_seconds = time.perf_counter() - fetch_started
+        self.device_timings[key] = {'connect_seconds': round(connect_seconds, 3)}
+        self.events.device_state(key, {
+            'status': 'syncing',
+            'latency_ms': int(connect_seconds * 1000)
+        })
+        
+        found = 0
+        queued = 0
+        blocked_seconds = 0.0
+        device_started = time.perf_counter()
+        cutoff = self._backfill_cutoff(device)
+        backfilled = 0
+        base, last_record = self.checkpoint.position(device)
+        tracking = True
+        index = 0
+        device_id = device.get('id', device['name'])
+        read_info = {}
+        archive_read = {}
+        try:
+            batches = iter_attendance_batches(conn, info=read_info)
+            while True:
+                with self.tracer.span('fetch', device=device['name']):
+                    punches = next(batches, None)
+                if punches is None:
+                    break
+                start, index = index, index + len(punches)
+                archived = self._archive(device, punches, start, archive_read, read_info.get('records'))
+                
+                # Skip log records already uploaded; a log shorter than the checkpoint,
+                # or one whose record at the checkpoint changed, was cleared
+                if base and read_info.get('records', base) < base:
+                    self._log_rewritten(device, "was cleared; sending all of it")
+                    base = 0
+                first = max(base - start, 0)
+                if base and start < base <= index and punch_fingerprint(punches[base - 1 - start]) != last_record:
+                    # Earlier batches were skipped already: send the rest, then all of it next cycle
+                    self._log_rewritten(device, "was rewritten; it is sent in full next cycle")
+                    base, tracking, first = 0, False, 0
+                found += len(punches)
+                selected, handed = self._split_backlog(device, punches[first:], archived, cutoff)
+                backfilled += handed
+                with self.tracer.span('transform', device=device['name'], punches=len(punches)):
+                    records = [
+                        {
+                            'employee_id': str(punch.user_id),
+                            'timestamp': punch.timestamp.isoformat(),
+                            'device_id': device_id,
+                            'type': 'auto',
+                            'status': punch.status
+                        }
+                        for punch in selected
+                    ]
+                    records.sort(key=lambda r: r['timestamp'])
+                position = (index, punch_fingerprint(punches[-1])) if tracking and index > base else None
+                if not records and not position:
+                    continue
+                queued += len(records)
+                
+                # Blocks while the uploader is PIPELINE_QUEUE_DEPTH batches behind;
+                # only reading time counts as fetch time
+                self.fetch_seconds += time.perf_counter() - fetch_started
+                put_started = time.perf_counter()
+                self._put(work, (idx, device, records, False, None, position))
+                fetch_started = time.perf_counter()
+                blocked_seconds += fetch_started - put_started
+                self._device_deadline += fetch_started - put_started
+        finally:
+            self._device_deadline = None
+            self._active_conn = None
+            if not self._cancel.is_set() and self._stalled != key:
+                with self.tracer.span('disconnect', device=device['name']):
+                    conn.disconnect()
+            self.fetch_seconds += time.perf_counter() - fetch_started
+            # Connect + read, excluding time blocked on a full upload queue
+            self.device_timings[key]['fetch_seconds'] = round(
+                connect_seconds + (time.perf_counter() - device_started) - blocked_seconds, 3
             )
-            if response.status_code == 200:
-                return response.json()
+        if self._stalled == key:
+            # pyzk can swallow the aborted read and return what it had; that is not a full log
+            raise DeviceUnreachable("session aborted by watchdog")
+        if base and index < base:
+            self._log_rewritten(device, "was cleared; it is sent in full next cycle")
+
+        if self.archive:
+            try:
+                self.archive.commit(device, archive_read)
+            except OSError as e:
+                print(f"Failed to save archive state: {e}")
+            rejected = self.archive.rejected.pop(key, 0)
+            if rejected:
+                self.events.log(
+                    f"   ⚠️ {rejected} punches from {device['name']} not archived "
+                    f"(dated before 2000 or employee id over {ARCHIVE_EMPLOYEE_BYTES} bytes); they are still uploaded",
+                    "warning"
+                )
+        self._refresh_profile(device, conn, read_info)
+        if self.health:
+            try:
+                self.health.record_ok(device)
+            except OSError as e:
+                print(f"Failed to save device health: {e}")
+        
+        self.events.log(f"   Found {found} records from {device['name']} ({queued} to upload)", "info")
+        if backfilled:
+            self.events.log(
+                f"   ⏮ {device['name']} was not read for over {BACKFILL_AFTER_HOURS} h: {backfilled} punches "
+                f"before {cutoff.strftime('%Y-%m-%d %H:%M')} go to the backfill lane", "info"
+            )
+        self.events.device_state(key, {'records': found})
+        self._put(work, (idx, device, [], True, None, None))
+    
+    def _log_rewritten(self, device, what):
+        """Reset a device whose log no longer continues its checkpoint"""
+        self.checkpoint.reset(device)
+        self.events.log(f"   ⚠️ The attendance log of {device['name']} {what}", "warning")
+    
+    def _backfill_cutoff(self, device):
+        """Backfill cutoff for a device not read cleanly for BACKFILL_AFTER_HOURS, else None"""
+        if not self.backfill or not self.archive or not self.health:
             return None
-        except Exception as e:
-            print(f"License verification error: {e}")
+        cutoff = datetime.now().replace(microsecond=0) - timedelta(hours=BACKFILL_AFTER_HOURS)
+        last_read = self.health.last_read(device)
+        if last_read and datetime.fromtimestamp(last_read) >= cutoff:
             return None
+        return cutoff
     
-    def get_company_devices(self):
-        """Get all devices for this company (tenant)"""
-        try:
-            response = self.session.get(
-                f"{API_BASE_URL}/devices",
-                timeout=10
-            )
-            if response.status_code == 200:
-                return response.json().get('devices', [])
-            return []
-        except Exception as e:
-            print(f"Get devices error: {e}")
-            return []
+    def _split_backlog(self, device, punches, archived, cutoff):
+        """Hand a far-behind device's old punches to the backfill lane
+        
+        Only punches this read wrote to the archive are handed over, since
+        the lane uploads from there; everything else is uploaded now.
+        Returns (punches to upload now, number handed over).
+        """
+        if not cutoff or not archived:
+            return punches, 0
+        stored = {id(punch) for punch in archived}
+        now, later = [], []
+        for punch in punches:
+            (later if punch.timestamp < cutoff and id(punch) in stored else now).append(punch)
+        if later:
+            self.backfill.add(device, min(punch.timestamp for punch in later), cutoff)
+        return now, len(later)
+    
+    def _connect(self, device):
+        """Connect with the device's cached profile, discovering it when missing or stale"""
+        if self._cancel.is_set():
+            raise SyncCancelled()
+        ip, port = device['ip'], int(device['port'])
+        
+        if self.profiles is None:
+            # No profile store (tests, old callers): plain pyzk defaults
+            zk = self.zk_factory(ip, port=port, timeout=DEVICE_CONNECT_TIMEOUT)
+            self._active_conn = zk
+            try:
+                with self.tracer.span('connect', device=device['name'], ip=ip):
+                    return zk.connect()
+            except Exception as e:
+                raise DeviceUnreachable(str(e)) from e
+        
+        profile = self.profiles.get(device)
+        if profile:
+            zk = self.zk_factory(ip, port=port, timeout=DEVICE_CONNECT_TIMEOUT,
+                                 **DeviceProfiles.zk_options(device, profile))
+            self._active_conn = zk
+            try:
+                with self.tracer.span('connect', device=device['name'], ip=ip, transport=profile.get('transport')):
+                    return zk.connect()
+            except Exception as e:
+                if self._cancel.is_set():
+                    raise SyncCancelled()
+                self.events.log(f"   🔍 Cached connection profile failed for {device['name']} ({e}), rediscovering", "warning")
+                self.profiles.forget(device)
+        
+        with self.tracer.span('probe', device=device['name'], ip=ip):
+            conn, profile = self._discover(device)
+        self.profiles.save(device, profile)
+        self.events.log(
+            f"   🔍 {device['name']}: {profile['transport'].upper()}, "
+            f"ping {'ok' if profile['ping'] else 'blocked'}, firmware {profile.get('firmware') or '?'}", "info"
+        )
+        return conn
     
-    def send_attendance(self, records):
-        """Send attendance records to cloud"""
+    def _discover(self, device):
+        """Find a working transport and read the clock's identity and capacity"""
+        ip, port = device['ip'], int(device['port'])
+        base_options = DeviceProfiles.zk_options(device, {})
+        base_options.pop('force_udp')
+        
+        probe = self.zk_factory(ip, port=port, timeout=DEVICE_CONNECT_TIMEOUT, **base_options)
         try:
-            response = self.session.post(
-                f"{API_BASE_URL}/attendance",
-                json={'records': records},
-                timeout=30
+            ping = bool(probe.helper.test_ping())
+        except Exception:
+            ping = False
+        
+        last_error = None
+        for transport in ('tcp', 'udp'):
+            if self._cancel.is_set():
+                raise SyncCancelled()
+            zk = self.zk_factory(ip, port=port, timeout=DEVICE_CONNECT_TIMEOUT,
+                                 force_udp=(transport == 'udp'), **base_options)
+            self._active_conn = zk
+            try:
+                conn = zk.connect()
+            except Exception as e:
+                last_error = e
+                continue
+            
+            profile = {'transport': transport, 'ping': ping, 'discovered': datetime.now().isoformat()}
+            for field, read in (
+                ('firmware', conn.get_firmware_version),
+                ('serial', conn.get_serialnumber),
+                ('platform', conn.get_platform)
+            ):
+                try:
+                    profile[field] = read()
+                except Exception:
+                    profile[field] = None  # Older firmware lacks some of these
+            return conn, profile
+        raise DeviceUnreachable(str(last_error))
+    
+    def _refresh_profile(self, device, conn, read_info):
+        """Store record size and log counts seen during the read"""
+        if self.profiles is None or not self.profiles.get(device):
+            return
+        fields = {name: getattr(conn, name, None) for name in ('users', 'records', 'users_cap', 'rec_cap')}
+        if read_info.get('record_size'):
+            fields['record_size'] = read_info['record_size']
+        self.profiles.update(device, **fields)
+        
+        records, capacity = fields.get('records'), fields.get('rec_cap')
+        if isinstance(records, int) and isinstance(capacity, int) and capacity > 0 \
+                and records >= capacity * DEVICE_LOG_FULL_WARNING:
+            self.events.log(
+                f"   ⚠️ {device['name']} attendance log is {records * 100 // capacity}% full "
+                f"({records}/{capacity}); clear it on the clock", "warning"
             )
-            if response.status_code == 200:
-                return response.json()
+    
+    def _archive(self, device, punches, start, read, log_records):
+        """Copy punches to the local archive; returns those written (None if it failed)
+        
+        A full disk never fails the sync.
+        """
+        if not self.archive:
             return None
-        except Exception as e:
-            print(f"Send attendance error: {e}")
+        try:
+            with self.tracer.span('archive', device=device['name'], punches=len(punches)):
+                return self.archive.append(device, punches, start, read, log_records)
+        except (OSError, struct.error) as e:
+            self.events.log(f"⚠️ Punch archive disabled for this run: {e}", "warning")
+            self.archive = None
             return None
+    
+    def _upload_devices(self, work):
+        """Consumer: upload queued batches while later batches and devices are read
+        
+        Records from several devices share upload requests through an
+        UploadAggregator; per-device outcomes are kept in self.device_results.
+        """
+        self.aggregator = UploadAggregator(self._send_batch, self._on_segment_uploaded)
+        self.positions = UploadPositions()
+        self.device_results = {}
+        finished = set()  # idx of devices fully read
+        indexes = {}
+        
+        while True:
+            item = self._get(work, self.aggregator.seconds_until_due())
+            if item is QUEUE_IDLE:
+                self._flush_uploads()
+                self._report_finished(finished, indexes)
+                continue
+            if item is None:
+                break
+            idx, device, records, device_done, error, position = item
+            indexes[device_key(device)] = idx
+            entry = self._device_result(device)
+            if error:
+                entry['read_failed'] = True
+                if not entry['error']:
+                    entry['error'] = error
+            
+            if self._deferred or not self.is_running:
+                continue  # Drain so the producer is never blocked on a full queue
+            
+            entry['records'] += len(records)
+            if records or position:
+                self.positions.add(device, len(records), position)
+            if not records:
+                # Nothing to send: the position is reached once earlier records are
+                self._advance(device, self.positions.uploaded(device, 0))
+            upload_started = time.perf_counter()
+            try:
+                self.aggregator.add(device, records)
+            finally:
+                self.upload_seconds += time.perf_counter() - upload_started
+            
+            if device_done:
+                finished.add(idx)
+            self._report_finished(finished, indexes)
+        
+        if not self._deferred and self.is_running:
+            self._flush_uploads()
+        self._report_finished(finished, indexes)
+    
+    def _device_result(self, device):
+        """Per-device accounting entry for this cycle"""
+        key = device_key(device)
+        if key not in self.device_results:
+            self.device_results[key] = {
+                'name': device['name'], 'key': key, 'records': 0, 'uploaded': 0, 'synced': 0, 'error': None
+            }
+        return self.device_results[key]
+    
+    def _flush_uploads(self):
+        """Send the aggregator's partial batch"""
+        upload_started = time.perf_counter()
+        try:
+            self.aggregator.flush()
+        finally:
+            self.upload_seconds += time.perf_counter() - upload_started
+    
+    def _send_batch(self, records):
+        """Send one shared batch, honouring server back-off"""
+        if self._cancel.is_set():
+            raise SyncCancelled()
+        wait = self.api.seconds_until_allowed()
+        if wait > 0:
+            # Server is shedding load; leave the remaining devices for the next cycle
+            if not self._deferred:
+                self._deferred = True
+                pending = sum(1 for entry in self.device_results.values() if not entry['error'])
+                self._add_error(
+                    f"Server asked to retry in {int(wait)}s, deferring {pending} devices",
+                    icon="⏳", level="warning"
+                )
+            return {'success': False, 'deferred': True}
+        
+        # Send to cloud
+        with self.tracer.span('upload_chunk', records=len(records)):
+            return self._call_cancellable(self.api.send_attendance, records)
+    
+    def _on_segment_uploaded(self, device, records, synced, ok):
+        """Attribute a shared batch's outcome to one contributing device"""
+        entry = self._device_result(device)
+        if not ok:
+            if not entry['error'] and not self._deferred:
+                entry['error'] = f"Failed to sync {device['name']}"
+                self._add_error(entry['error'])
+                self.events.device_state(device_key(device), {'status': 'error'})
+            elif not entry['error']:
+                entry['error'] = "deferred"
+            self.positions.fail(device)
+            return
+        
+        entry['uploaded'] += len(records)
+        entry['synced'] += synced
+        self.total_synced += synced
+        self.total_records += len(records)
+        self._advance(device, self.positions.uploaded(device, len(records)), records[-1]['timestamp'])
+    
+    def _advance(self, device, reached, uploaded_through=None):
+        """Move the device checkpoint to a log position whose records are all uploaded"""
+        if reached:
+            self.checkpoint.advance(device, *reached, uploaded_through=uploaded_through)
+    
+    def _report_finished(self, finished, indexes):
+        """Log devices whose records are all read and flushed"""
+        for key, entry in self.device_results.items():
+            idx = indexes.get(key)
+            if idx not in finished or entry.get('reported'):
+                continue
+            if entry['error']:
+                entry['reported'] = True
+                continue
+            device = self.devices[idx]
+            if self.aggregator.pending_for(device):
+                continue
+            entry['reported'] = True
+            self.events.device_state(key, {
+                'status': 'ok',
+                'last_sync': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            })
+            if entry['uploaded']:
+                self.events.log(
+                    f"   ✅ Synced {entry['synced']}/{entry['uploaded']} records from {entry['name']}", "success"
+                )
+            else:
+                self.events.log(f"   ℹ️ No new records from {entry['name']}", "info")
+    
+    def _call_cancellable(self, fn, *args):
+        """Run a blocking call on a helper thread so stop() never waits for it"""
+        outcome = {}
+        done = threading.Event()
+        
+        def target():
+            try:
+                outcome['result'] = fn(*args)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+        
+        threading.Thread(target=target, name="SyncCall", daemon=True).start()
+        while not done.wait(CANCEL_POLL_SECONDS):
+            if self._cancel.is_set():
+                # The abandoned call finishes (or times out) on its own; its chunk is
+                # not checkpointed and is simply re-sent next time
+                raise SyncCancelled()
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+    
+    def _abort_device_session(self):
+        """Unblock a device read stuck in recv() by shutting its socket down"""
+        zk = self._active_conn
+        sock = getattr(zk, '_ZK__sock', None) if zk else None
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+    
+    def stop(self):
+        """Stop sync process (returns immediately; run() winds down within milliseconds)"""
+        self.is_running = False
+        self._cancel.set()
+        self._abort_device_session()
 
 
-class SyncWorker(QThread):
-    """Background worker for syncing devices"""
+class BackfillWorker(QThread):
+    """Background lane uploading queued archive ranges under bandwidth and request caps
     
-    # Signals
-    log_signal = pyqtSignal(str, str)  # message, level (info/success/error)
-    progress_signal = pyqtSignal(int, int)  # current, total
-    sync_complete_signal = pyqtSignal(dict)  # result stats
+    Runs only while no sync cycle does (realtime_busy is set during
+    cycles) so fresh punches never wait behind history, and pauses for
+    server back-off. Progress and ETA are posted per device as the
+    'backfill' device state. Finishes when the queue is empty.
+    """
     
-    def __init__(self, api, devices):
+    def __init__(self, api, queue, archive, events, realtime_busy,
+                 bytes_per_second=BACKFILL_MAX_BYTES_PER_SECOND,
+                 requests_per_minute=BACKFILL_MAX_REQUESTS_PER_MINUTE):
         super().__init__()
         self.api = api
-        self.devices = devices
-        self.is_running = True
+        self.queue = queue
+        self.archive = archive
+        self.events = events
+        self.realtime_busy = realtime_busy
+        self.bandwidth = TokenBucket(bytes_per_second, bytes_per_second)
+        self.request_rate = TokenBucket(requests_per_minute / 60.0, max(1, requests_per_minute // 10))
+        self._cancel = threading.Event()
+        self.sent = 0
+        self.throttled_seconds = 0.0
     
     def run(self):
-        """Run sync process"""
-        total_synced = 0
-        total_records = 0
-        errors = []
+        try:
+            while not self._cancel.is_set():
+                jobs = self.queue.pending()
+                if not jobs:
+                    break
+                for key, job in jobs:
+                    if self._cancel.is_set():
+                        break
+                    self._run_job(key, job)
+        except SyncCancelled:
+            pass
+        except Exception as e:
+            self.events.log(f"❌ Backfill stopped: {e}", "error")
+    
+    def _run_job(self, key, job):
+        end = datetime.fromisoformat(job['end'])
+        cursor = datetime.fromisoformat(job['cursor'])
+        if job.get('total') is None:
+            job['total'] = job['sent'] + self.archive.count(cursor, end, [key])
+            self.queue.update(key, total=job['total'])
+            self.events.log(f"⏮ Backfilling {job['name']}: ~{job['total']} punches", "info")
         
-        self.log_signal.emit("🔄 Starting sync...", "info")
+        started = time.monotonic()
+        sent_here = 0
+        for _key, day in self.archive.days(cursor, end, [key]):
+            day_start = max(cursor, datetime.fromisoformat(day))
+            day_end = min(end, datetime.fromisoformat(day) + timedelta(days=1))
+            records = sorted(self.archive.records(day_start, day_end, device_keys=[key]),
+                             key=lambda record: record['timestamp'])
+            for offset in range(0, len(records), UPLOAD_CHUNK_SIZE):
+                self._send(records[offset:offset + UPLOAD_CHUNK_SIZE], job['name'])
+            job['sent'] += len(records)
+            sent_here += len(records)
+            self.queue.update(key, cursor=day_end.isoformat(), sent=job['sent'])
+            self._report(key, job, sent_here, time.monotonic() - started)
         
-        for idx, device in enumerate(self.devices):
-            if not self.is_running:
-                break
-            
-            self.progress_signal.emit(idx + 1, len(self.devices))
+        self.queue.finish(key, job['end'])
+        self.events.device_state(key, {'backfill': None})
+        self.events.log(f"✅ Backfill of {job['name']} finished: {job['sent']} punches", "success")
+    
+    def _send(self, records, name):
+        """Upload one chunk once real-time work, server back-off and both caps allow
+        
+        A failed upload is retried after each BACKFILL_RETRY_SECONDS pause;
+        when the last retry fails too, the lane stops until the next sync.
+        """
+        for attempt, retry_in in enumerate(BACKFILL_RETRY_SECONDS + (None,), 1):
+            self._wait(0)
+            self._wait(self.request_rate.spend(1))
+            bytes_before = self.api.bytes_sent
+            result = self.api.send_attendance(records)
+            self._wait(self.bandwidth.spend(self.api.bytes_sent - bytes_before))
+            if result and result.get('success'):
+                self.sent += len(records)
+                return
+            if retry_in is None:
+                raise RuntimeError(f"upload for {name} failed {attempt} times in a row; it resumes after the next sync")
+            self.events.log(f"⚠️ Backfill upload for {name} failed; retrying in {retry_in}s", "warning")
+            self._wait(retry_in)
+    
+    def _wait(self, seconds):
+        """Sleep off throttling, then until no sync cycle runs and the server allows calls"""
+        deadline = time.monotonic() + seconds
+        while True:
+            if self._cancel.is_set():
+                raise SyncCancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 and not self.realtime_busy.is_set():
+                remaining = self.api.seconds_until_allowed()
+                if remaining <= 0:
+                    return
+            self.throttled_seconds += min(max(remaining, 0), BACKFILL_POLL_SECONDS)
+            self._cancel.wait(min(max(remaining, 0), BACKFILL_POLL_SECONDS) or BACKFILL_POLL_SECONDS)
+    
+    def _report(self, key, job, sent_here, elapsed):
+        total = max(job['total'] or 0, job['sent'])
+        percent = min(99, job['sent'] * 100 // total) if total else 99
+        eta = None
+        if sent_here and elapsed > 0:
+            eta = int((total - job['sent']) / (sent_here / elapsed))
+        self.events.device_state(key, {'backfill': (percent, eta)})
+    
+    def stop(self):
+        self._cancel.set()
+
+
+class AggregatorUplink(QThread):
+    """Uploads the ingest spool to the cloud in large gzip batches
+    
+    Sends once AGGREGATOR_BATCH_RECORDS are waiting or the oldest has waited
+    AGGREGATOR_FLUSH_SECONDS, honours server back-off, and retries uploads
+    that failed on the network, 5xx, 429 or a license error with increasing
+    delays. A batch the cloud rejects with another 4xx is resent one edge
+    request at a time; the requests still rejected go to DEAD_LETTER_FILE
+    so they cannot block the spool. WAN counters sit next to the ingest
+    (LAN) counters so the saving over edges uploading directly is visible.
+    """
+    
+    def __init__(self, api, spool, server, events):
+        super().__init__()
+        self.api = api
+        self.spool = spool
+        self.server = server
+        self.events = events
+        self._cancel = threading.Event()
+        self.dead_letter_path = DEAD_LETTER_FILE
+        self.stats = {'requests': 0, 'records': 0, 'bytes': 0, 'failures': 0, 'dead_lettered': 0}
+    
+    def run(self):
+        try:
+            self._run()
+        except SyncCancelled:
+            pass
+    
+    def _run(self):
+        backlog = self.spool.count_backlog()
+        if backlog:
+            self.events.log(f"🛰 {backlog} records left in the spool from the last run", "info")
+        failures = 0
+        isolate_until = None  # Spool position of a rejected batch, resent one request at a time
+        while not self._cancel.is_set():
+            due = isolate_until is not None or self.spool.pending >= AGGREGATOR_BATCH_RECORDS or (
+                self.spool.oldest is not None and time.monotonic() - self.spool.oldest >= AGGREGATOR_FLUSH_SECONDS
+            )
+            wait = self.api.seconds_until_allowed()
+            if not due or wait > 0:
+                self._cancel.wait(min(max(wait, 0), 5.0) or 0.5)
+                continue
             
-            try:
-                # Check if ZK library is available
-                if not ZK_AVAILABLE:
-                    error = f"ZK library not installed. Cannot sync {device['name']}"
-                    errors.append(error)
-                    self.log_signal.emit(f"   ❌ {error}", "error")
+            records, position = self.spool.read_batch(AGGREGATOR_BATCH_RECORDS, 1 if isolate_until else None)
+            if not records:
+                self.spool.commit(position, self.spool.pending)  # Only empty batches were left
+                continue
+            bytes_before = self.api.bytes_sent
+            result = self._send(records)
+            sent_bytes = self.api.bytes_sent - bytes_before
+            status = (result or {}).get('status')
+            if status and 400 <= status < 500 and status not in (401, 403, 429):
+                if isolate_until is None:
+                    isolate_until = position
+                    self.events.log(
+                        f"⚠️ Cloud rejected {len(records)} spooled records (HTTP {status}); "
+                        f"resending them one edge request at a time", "warning"
+                    )
                     continue
-                
-                # Connect to device
-                self.log_signal.emit(f"📡 Connecting to {device['name']} ({device['ip']}:{device['port']})...", "info")
-                
-                zk = ZK(device['ip'], port=int(device['port']), timeout=5)
-                conn = zk.connect()
-                
-                # Get attendance records
-                attendances = conn.get_attendance()
-                self.log_signal.emit(f"   Found {len(attendances)} records", "info")
-                
-                if len(attendances) > 0:
-                    # Prepare records
-                    records = []
-                    for att in attendances:
-                        records.append({
-                            'employee_id': str(att.user_id),
-                            'timestamp': att.timestamp.isoformat(),
-                            'device_id': device.get('id', device['name']),
-                            'type': 'auto',
-                            'status': att.status if hasattr(att, 'status') else 1
-                        })
-                    
-                    # Send to cloud
-                    result = self.api.send_attendance(records)
-                    
-                    if result and result.get('success'):
-                        synced = result.get('synced', 0)
-                        total_synced += synced
-                        total_records += len(records)
-                        self.log_signal.emit(f"   ✅ Synced {synced}/{len(records)} records", "success")
-                    else:
-                        error = f"Failed to sync {device['name']}"
-                        errors.append(error)
-                        self.log_signal.emit(f"   ❌ {error}", "error")
-                else:
-                    self.log_signal.emit(f"   ℹ️ No new records", "info")
-                
-                conn.disconnect()
-                
-            except Exception as e:
-                error = f"Error syncing {device['name']}: {str(e)}"
-                errors.append(error)
-                self.log_signal.emit(f"   ❌ {error}", "error")
-        
-        # Complete
-        result = {
-            'total_synced': total_synced,
-            'total_records': total_records,
-            'devices_count': len(self.devices),
-            'errors': errors,
-            'timestamp': datetime.now().isoformat()
+                self._dead_letter(records, status, result.get('error'))
+                self.spool.commit(position, len(records))
+                if position >= isolate_until:
+                    isolate_until = None
+                continue
+            if not result or not result.get('success'):
+                self.stats['failures'] += 1
+                delay = AGGREGATOR_RETRY_SECONDS[min(failures, len(AGGREGATOR_RETRY_SECONDS) - 1)]
+                failures += 1
+                self.events.log(f"⚠️ Uplink of {len(records)} spooled records failed, retrying in {delay}s", "warning")
+                self._cancel.wait(delay)
+                continue
+            failures = 0
+            self.spool.commit(position, len(records))
+            if isolate_until is not None and position >= isolate_until:
+                isolate_until = None
+            self.stats['requests'] += 1
+            self.stats['records'] += len(records)
+            self.stats['bytes'] += sent_bytes
+            self.events.log(
+                f"🛰 Uplinked {len(records)} records ({sent_bytes // 1024} KB gzip), "
+                f"{self.spool.pending} still spooled", "info"
+            )
+    
+    def savings(self):
+        """WAN use against what edges would have sent the cloud directly"""
+        ingest = self.server.stats
+        return {
+            'ingest_requests': ingest['requests'],
+            'ingest_bytes': ingest['bytes'],
+            'wan_requests': self.stats['requests'],
+            'wan_bytes': self.stats['bytes'],
+            'request_reduction': round(1 - self.stats['requests'] / ingest['requests'], 3) if ingest['requests'] else None,
+            'byte_reduction': round(1 - self.stats['bytes'] / ingest['bytes'], 3) if ingest['bytes'] else None,
+            'spooled': self.spool.pending,
+            'uplink_failures': self.stats['failures'],
+            'dead_lettered': self.stats['dead_lettered']
         }
+    
+    def _send(self, records):
+        """Upload on a helper thread so stop() never waits for a slow WAN request"""
+        outcome = {}
+        done = threading.Event()
         
-        if len(errors) == 0:
-            self.log_signal.emit(f"✅ Sync completed! {total_synced} records synced", "success")
-        else:
-            self.log_signal.emit(f"⚠️ Sync completed with {len(errors)} errors", "warning")
+        def target():
+            try:
+                outcome['result'] = self.api.send_attendance(records, compress=True)
+            finally:
+                done.set()
         
-        self.sync_complete_signal.emit(result)
+        threading.Thread(target=target, name="UplinkCall", daemon=True).start()
+        while not done.wait(CANCEL_POLL_SECONDS):
+            if self._cancel.is_set():
+                # Not committed: the batch is sent again after a restart
+                raise SyncCancelled()
+        return outcome.get('result')
+    
+    def _dead_letter(self, records, status, error):
+        """Set aside records the cloud will never accept, so the spool moves on"""
+        line = json.dumps({
+            'rejected': datetime.now().isoformat(), 'status': status, 'error': error, 'records': records
+        }, ensure_ascii=False)
+        os.makedirs(os.path.dirname(self.dead_letter_path), exist_ok=True)
+        with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats['dead_lettered'] += len(records)
+        self.events.log(
+            f"❌ Cloud rejected {len(records)} records from an edge (HTTP {status}); "
+            f"kept in {self.dead_letter_path}", "error"
+        )
     
     def stop(self):
-        """Stop sync process"""
-        self.is_running = False
+        self._cancel.set()
+
+
+def format_duration(seconds):
+    """Short human duration: 45s, 12 min, 3.5 h"""
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+class DeviceTableModel(QAbstractTableModel):
+    """Device list with live per-device sync state
+    
+    Rows are kept as plain lists indexed by device key, so a state change
+    touches one row and emits dataChanged for that row only.
+    """
+    
+    COLUMNS = ['col_name', 'col_address', 'col_id', 'col_status', 'col_last_sync', 'col_records', 'col_latency',
+               'col_backfill']
+    NAME, ADDRESS, ID, STATUS, LAST_SYNC, RECORDS, LATENCY, BACKFILL = range(8)
+    STATE_COLUMNS = {'status': STATUS, 'last_sync': LAST_SYNC, 'records': RECORDS, 'latency_ms': LATENCY,
+                     'backfill': BACKFILL}
+    SORT_ROLE = Qt.UserRole + 1
+    DEVICE_ROLE = Qt.UserRole
+    
+    STATUS_COLORS = {
+        'ok': BRAND_SUCCESS,
+        'syncing': BRAND_PRIMARY,
+        'connecting': BRAND_PRIMARY,
+        'error': BRAND_DANGER,
+        'unreachable': BRAND_DANGER,
+        'stalled': BRAND_DANGER,
+        'quarantined': BRAND_WARNING,
+        'peer': BRAND_SECONDARY
+    }
+    
+    def __init__(self, translate, parent=None):
+        super().__init__(parent)
+        self.translate = translate
+        self._rows = []       # [name, address, id, status, last_sync, records, latency_ms, backfill]
+        self._devices = []    # device dicts, same order as _rows
+        self._row_by_key = {}
+    
+    def set_devices(self, devices, last_sync_by_key=None):
+        """Replace all devices (cloud reload); live state of known devices is kept"""
+        previous = {key: self._rows[row] for key, row in self._row_by_key.items()}
+        last_sync_by_key = last_sync_by_key or {}
+        
+        self.beginResetModel()
+        self._rows = []
+        self._devices = list(devices)
+        self._row_by_key = {}
+        for row, device in enumerate(self._devices):
+            key = device_key(device)
+            old = previous.get(key)
+            self._rows.append([
+                device['name'],
+                f"{device['ip']}:{device['port']}",
+                device.get('id', 'N/A'),
+                old[self.STATUS] if old else '',
+                old[self.LAST_SYNC] if old else last_sync_by_key.get(key, ''),
+                old[self.RECORDS] if old else None,
+                old[self.LATENCY] if old else None,
+                old[self.BACKFILL] if old else None
+            ])
+            self._row_by_key[key] = row
+        self.endResetModel()
+    
+    def update_device(self, key, state):
+        """Apply live state fields to one device row"""
+        row = self._row_by_key.get(key)
+        if row is None:
+            return
+        values = self._rows[row]
+        changed = []
+        for field, value in state.items():
+            column = self.STATE_COLUMNS.get(field)
+            if column is not None and values[column] != value:
+                values[column] = value
+                changed.append(column)
+        if changed:
+            self.dataChanged.emit(self.index(row, min(changed)), self.index(row, max(changed)))
+    
+    def device_at(self, row):
+        return self._devices[row]
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.translate(self.COLUMNS[section])
+        return None
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self._rows[index.row()][index.column()]
+        column = index.column()
+        
+        if role == Qt.DisplayRole:
+            if value is None or value == '':
+                return ''
+            if column == self.LATENCY:
+                return f"{value} ms"
+            if column == self.BACKFILL:
+                percent, eta = value
+                return f"{percent}%" if eta is None else f"{percent}% · {format_duration(eta)}"
+            if column == self.STATUS:
+                return self.translate(f"status_{value}")
+            return str(value)
+        if role == self.SORT_ROLE:
+            if column == self.BACKFILL and value is not None:
+                return value[0]
+            return -1 if value is None else value
+        if role == Qt.ForegroundRole and column == self.STATUS:
+            color = self.STATUS_COLORS.get(value)
+            return QColor(color) if color else None
+        if role == Qt.TextAlignmentRole and column in (self.RECORDS, self.LATENCY):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role == self.DEVICE_ROLE:
+            return self._devices[index.row()]
+        return None
+
+
+class TaskExecutor(QObject):
+    """Shared thread pool for GUI-initiated background work
+    
+    Results are delivered to callbacks on the GUI thread. Submitting a key
+    that is already in flight joins the running task instead of starting a
+    second one, and cancel(key) drops a task's callbacks.
+    """
+    
+    _task_finished = pyqtSignal(object, int, object, object)  # key, token, result, error
+    
+    def __init__(self, max_workers=TASK_POOL_WORKERS):
+        super().__init__()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="AttenduxTask")
+        self._inflight = {}  # key -> entry
+        self._next_token = 0
+        self.stats = {
+            'submitted': 0,
+            'deduplicated': 0,
+            'completed': 0,
+            'failed': 0,
+            'cancelled': 0
+        }
+        # Emitted from pool threads, queued onto the GUI thread
+        self._task_finished.connect(self._deliver)
+    
+    def submit(self, key, fn, on_done=None, on_error=None):
+        """Run fn() in the pool; on_done(result) / on_error(exc) run on the GUI thread"""
+        entry = self._inflight.get(key)
+        if entry:
+            entry['callbacks'].append((on_done, on_error))
+            self.stats['deduplicated'] += 1
+            return entry['future']
+        
+        self._next_token += 1
+        token = self._next_token
+        entry = {'token': token, 'callbacks': [(on_done, on_error)], 'started': time.time()}
+        self._inflight[key] = entry
+        entry['future'] = self._pool.submit(self._run, key, token, fn)
+        self.stats['submitted'] += 1
+        return entry['future']
+    
+    def _run(self, key, token, fn):
+        try:
+            result = fn()
+        except Exception as e:
+            self._task_finished.emit(key, token, None, e)
+            return
+        self._task_finished.emit(key, token, result, None)
+    
+    def _deliver(self, key, token, result, error):
+        entry = self._inflight.get(key)
+        if not entry or entry['token'] != token:
+            return  # Cancelled (and possibly resubmitted) meanwhile
+        del self._inflight[key]
+        self.stats['failed' if error else 'completed'] += 1
+        
+        for on_done, on_error in entry['callbacks']:
+            try:
+                if error is None:
+                    if on_done:
+                        on_done(result)
+                elif on_error:
+                    on_error(error)
+                else:
+                    print(f"Background task {key} failed: {error}")
+            except Exception as e:
+                print(f"Background task {key} callback error: {e}")
+    
+    def is_running(self, key):
+        """Whether a task with this key is in flight"""
+        return key in self._inflight
+    
+    def cancel(self, key):
+        """Drop a task's callbacks and cancel it if it hasn't started"""
+        entry = self._inflight.pop(key, None)
+        if not entry:
+            return False
+        entry['future'].cancel()
+        self.stats['cancelled'] += 1
+        return True
+    
+    def shutdown(self):
+        """Cancel everything and stop accepting work (does not wait)"""
+        for key in list(self._inflight):
+            self.cancel(key)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+    
+    def diagnostics(self):
+        """Counters for the diagnostics report"""
+        now = time.time()
+        return dict(self.stats, in_flight={
+            str(key): round(now - entry['started'], 1) for key, entry in self._inflight.items()
+        })
 
 
 class AttenduxSyncAgent(QMainWindow):
@@ -379,8 +4516,55 @@ class AttenduxSyncAgent(QMainWindow):
         self.company_info = None
         self.sync_worker = None
         self.sync_timer = QTimer()
-        self.sync_timer.timeout.connect(self.start_sync)
-        self.dashboard_browser = None
+        self.sync_timer.setSingleShot(True)  # Re-armed for every slot by schedule_next_sync
+        self.sync_timer.timeout.connect(self.on_sync_timer)
+        self.auto_sync_enabled = False
+        self.sync_pacer = None
+        self.next_sync_at = None
+        self.last_sync_started = None
+        self.dashboard_process = None
+        self.dashboard_rss_before = None
+        self.dashboard_show_requested = None
+        self.tasks = TaskExecutor()
+        self.sync_history = SyncHistory()
+        self.scheduler = SyncScheduler(self.settings)
+        self.device_health = DeviceHealth()
+        # One checkpoint, archive and profile store for every worker: an abandoned
+        # worker still winding down must not overwrite what its replacement saved
+        self.checkpoint = SyncCheckpoint()
+        self.archive = PunchArchive()
+        self.device_profiles = DeviceProfiles()
+        self.abandoned_workers = []   # Stopped threads kept referenced until they return
+        self.backfill_queue = BackfillQueue()
+        self.peers = None  # PeerGroup, while licensed and auto-syncing
+        self.verified_license_key = None
+        self.ingest_server = None  # Aggregator role: IngestServer + AggregatorUplink
+        self.uplink = None
+        self.backfill_worker = None
+        self.realtime_busy = threading.Event()  # Set while a sync cycle runs; backfill yields
+        self.abandoned_worker_count = 0
+        
+        # --capture FILE records the next sync run for --replay
+        self.capture = None
+        if '--capture' in sys.argv[:-1]:
+            self.capture = TrafficCapture(sys.argv[sys.argv.index('--capture') + 1])
+        self.stylesheet_applied = False
+        self.first_paint_done = False
+        self.pending_resume = False
+        
+        # Tray idle mode: while hidden, UI changes are buffered and applied on show
+        self.idle = False
+        self.idle_monitor = IdleMonitor()
+        self.idle_sample_timer = QTimer()
+        self.idle_sample_timer.setTimerType(Qt.VeryCoarseTimer)
+        self.idle_sample_timer.timeout.connect(self.idle_monitor.sample)
+        self.pending_log = deque(maxlen=IDLE_LOG_BUFFER_LINES)
+        self.pending_log_dropped = 0
+        self.pending_device_states = {}
+        
+        # Sync engine events arrive as rate-limited snapshots
+        self.sync_events = SyncEventBus(self)
+        self.sync_events.snapshot_ready.connect(self.on_sync_events)
         
         # Set initial layout direction based on language
         if self.current_language == 'ar':
@@ -391,13 +4575,19 @@ class AttenduxSyncAgent(QMainWindow):
         self.init_ui()
         self.update_ui_language()
         
-        # Defer heavy operations to avoid blocking UI on startup
-        # Load logo asynchronously after UI is shown
-        QTimer.singleShot(500, self.load_logo_async)
+        # Start deferred work as soon as the event loop runs; both are asynchronous
+        QTimer.singleShot(0, self.load_logo_async)
+        self.tasks.submit('history_compact', self.sync_history.compact, lambda kept: None,
+                          lambda e: print(f"History compaction error: {e}"))
+        self.tasks.submit('schedule_load', lambda: self.scheduler.load(self.sync_history), lambda count: None,
+                          lambda e: print(f"Sync schedule load error: {e}"))
         
-        # Auto-connect if license key exists (defer to avoid blocking)
+        # Auto-connect if license key exists
         if self.settings.get('license_key'):
-            QTimer.singleShot(2000, self.auto_connect)
+            QTimer.singleShot(0, self.auto_connect)
+        
+        # Not shown yet; main() either shows the window or leaves it in the tray
+        self.enter_idle_mode()
     
     def tr(self, key):
         """Translate key to current language"""
@@ -449,6 +4639,8 @@ class AttenduxSyncAgent(QMainWindow):
             self.dashboard_btn.setText(self.tr('open_dashboard'))
         if hasattr(self, 'sync_now_btn'):
             self.sync_now_btn.setText(self.tr('sync_now'))
+        if hasattr(self, 'import_btn'):
+            self.import_btn.setText(self.tr('import_usb'))
         if hasattr(self, 'start_sync_btn'):
             current_text = self.start_sync_btn.text()
             if self.tr('start_auto_sync') in current_text or 'Start' in current_text:
@@ -465,6 +4657,8 @@ class AttenduxSyncAgent(QMainWindow):
             self.startup_checkbox.setText(self.tr('startup'))
         if hasattr(self, 'notifications_checkbox'):
             self.notifications_checkbox.setText(self.tr('notifications'))
+        if hasattr(self, 'prewarm_checkbox'):
+            self.prewarm_checkbox.setText(self.tr('prewarm_dashboard'))
         if hasattr(self, 'logs_group'):
             self.logs_group.setTitle(self.tr('activity_logs'))
         if hasattr(self, 'clear_logs_btn'):
@@ -475,16 +4669,16 @@ class AttenduxSyncAgent(QMainWindow):
         self.setWindowTitle(self.tr('app_title'))
         self.setMinimumSize(1100, 800)
         
-        self.setStyleSheet(self.get_stylesheet())
+        # The stylesheet is applied on first show (see showEvent): a tray-only
+        # start never pays for polishing every widget
         
-        # Start maximized for better display
+        # main() shows the window maximized (or keeps it in the tray)
         screen = QApplication.desktop().screenGeometry()
         self.setGeometry(
             (screen.width() - 1100) // 2,
             (screen.height() - 800) // 2,
             1100, 800
         )
-        self.showMaximized()  # Start maximized to avoid cropped fields
         
         # Create central widget
         central_widget = QWidget()
@@ -535,7 +4729,7 @@ class AttenduxSyncAgent(QMainWindow):
         self.title_label.setObjectName("title")
         self.title_label.setStyleSheet(f"font-size: 24px; font-weight: bold; color: {BRAND_PRIMARY_DARK};")
         self.subtitle_label = QLabel(self.tr('app_subtitle'))
-        self.subtitle_label.setStyleSheet(f"font-size: 12px; color: #666;")
+        self.subtitle_label.setStyleSheet("font-size: 12px; color: #666;")
         title_layout.addWidget(self.title_label)
         title_layout.addWidget(self.subtitle_label)
         header_layout.addLayout(title_layout)
@@ -626,7 +4820,17 @@ class AttenduxSyncAgent(QMainWindow):
         
         license_layout.addLayout(key_layout)
         
-        # Company info (hidden initially)
+        # Company info is built on first successful connect (ensure_company_info_widget)
+        self.license_layout = license_layout
+        self.company_info_widget = None
+        
+        self.license_group.setLayout(license_layout)
+        layout.addWidget(self.license_group)
+    
+    def ensure_company_info_widget(self):
+        """Build the company info block the first time it is needed"""
+        if self.company_info_widget is not None:
+            return
         self.company_info_widget = QWidget()
         company_info_layout = QVBoxLayout(self.company_info_widget)
         company_info_layout.setContentsMargins(0, 10, 0, 0)
@@ -639,21 +4843,46 @@ class AttenduxSyncAgent(QMainWindow):
         company_info_layout.addWidget(self.company_plan_label)
         company_info_layout.addWidget(self.company_expiry_label)
         
-        self.company_info_widget.setVisible(False)
-        license_layout.addWidget(self.company_info_widget)
-        
-        self.license_group.setLayout(license_layout)
-        layout.addWidget(self.license_group)
+        self.license_layout.addWidget(self.company_info_widget)
     
     def create_devices_section(self, layout):
         """Create devices list section"""
         self.devices_group = QGroupBox(self.tr('devices_cloud'))
         devices_layout = QVBoxLayout()
         
-        # Devices list
-        self.devices_list = QListWidget()
-        self.devices_list.setMinimumHeight(150)
-        devices_layout.addWidget(self.devices_list)
+        # Device filter
+        self.devices_filter = QLineEdit()
+        self.devices_filter.setPlaceholderText(self.tr('filter_devices'))
+        devices_layout.addWidget(self.devices_filter)
+        
+        # Devices table (model/view, sorted and filtered through a proxy)
+        self.devices_model = DeviceTableModel(self.tr, self)
+        self.devices_proxy = QSortFilterProxyModel(self)
+        self.devices_proxy.setSourceModel(self.devices_model)
+        self.devices_proxy.setSortRole(DeviceTableModel.SORT_ROLE)
+        self.devices_proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+        self.devices_proxy.setFilterKeyColumn(-1)
+        self.devices_filter.textChanged.connect(self.devices_proxy.setFilterFixedString)
+        
+        self.devices_view = QTableView()
+        self.devices_view.setModel(self.devices_proxy)
+        self.devices_view.setMinimumHeight(150)
+        self.devices_view.setSortingEnabled(True)
+        self.devices_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.devices_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.devices_view.setAlternatingRowColors(True)
+        self.devices_view.setWordWrap(False)
+        self.devices_view.verticalHeader().setVisible(False)
+        # Fixed row height and column widths: no per-row measuring with thousands of devices
+        self.devices_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.devices_view.verticalHeader().setDefaultSectionSize(30)
+        self.devices_view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.devices_view.horizontalHeader().setStretchLastSection(True)
+        self.devices_view.horizontalHeader().setDefaultSectionSize(140)
+        devices_layout.addWidget(self.devices_view)
+        
+        # Show devices cached from the last session until the cloud reload
+        self.devices_model.set_devices(self.settings.get('devices', []), self.checkpoint_sync_times())
         
         # Device buttons
         device_buttons = QHBoxLayout()
@@ -693,6 +4922,10 @@ class AttenduxSyncAgent(QMainWindow):
         self.start_sync_btn.setEnabled(False)
         control_layout.addWidget(self.start_sync_btn)
         
+        self.import_btn = QPushButton(self.tr('import_usb'))
+        self.import_btn.clicked.connect(self.import_usb_log)
+        control_layout.addWidget(self.import_btn)
+        
         control_layout.addStretch()
         
         layout.addWidget(control_widget)
@@ -723,6 +4956,12 @@ class AttenduxSyncAgent(QMainWindow):
         self.notifications_checkbox.stateChanged.connect(self.save_settings)
         settings_layout.addWidget(self.notifications_checkbox)
         
+        self.prewarm_checkbox = QCheckBox(self.tr('prewarm_dashboard'))
+        self.prewarm_checkbox.setChecked(self.settings.get('dashboard_prewarm', False))
+        self.prewarm_checkbox.setEnabled(WEBENGINE_AVAILABLE)
+        self.prewarm_checkbox.stateChanged.connect(self.save_settings)
+        settings_layout.addWidget(self.prewarm_checkbox)
+        
         settings_layout.addStretch()
         
         self.settings_group.setLayout(settings_layout)
@@ -781,18 +5020,15 @@ class AttenduxSyncAgent(QMainWindow):
     
     def load_logo_async(self):
         """Download and display logo asynchronously (non-blocking)"""
-        class LogoDownloader(QThread):
-            logo_ready = pyqtSignal(bytes)
-            
-            def run(self):
-                try:
-                    response = requests.get(LOGO_URL, timeout=5)
-                    if response.status_code == 200:
-                        self.logo_ready.emit(response.content)
-                except:
-                    pass
+        def download_logo():
+            response = requests.get(LOGO_URL, timeout=5)
+            if response.status_code == 200:
+                return response.content
+            return None
         
         def on_logo_ready(logo_data):
+            if not logo_data:
+                return
             try:
                 pixmap = QPixmap()
                 pixmap.loadFromData(logo_data)
@@ -825,18 +5061,87 @@ class AttenduxSyncAgent(QMainWindow):
         except:
             pass
         
-        # Download in background thread
-        self.logo_downloader = LogoDownloader()
-        self.logo_downloader.logo_ready.connect(on_logo_ready)
-        self.logo_downloader.start()
+        # Download in the shared background pool
+        self.tasks.submit('logo', download_logo, on_logo_ready, lambda e: None)
     
     def auto_connect(self):
         """Auto-connect on startup"""
+        # If auto-sync was running before, resume it once the connect attempt
+        # has settled (see on_connect_settled) rather than after a fixed delay
+        self.pending_resume = self.settings.get('auto_sync_was_running', False)
         self.connect_license()
+    
+    def update_peer_group(self):
+        """Share the devices with other agents of this license on the LAN
         
-        # If auto-sync was running before, resume it
-        if self.settings.get('auto_sync_was_running', False) and self.api:
-            QTimer.singleShot(2000, self.resume_auto_sync)
+        Only a verified agent that is auto-syncing advertises itself; otherwise
+        it would claim devices it never polls.
+        """
+        license_key = self.verified_license_key
+        if not (license_key and self.auto_sync_enabled and self.settings.get('lan_peering', True)):
+            if self.peers:
+                self.peers.stop()
+                self.peers = None
+            return
+        if self.peers:
+            if self.peers.tenant == PeerGroup.tenant_for(license_key):
+                return
+            self.peers.stop()
+        self.peers = PeerGroup(license_key, self)
+        self.peers.peers_changed.connect(
+            lambda count: self.log(f"🤝 {count} other agent(s) of this license on the LAN", "info")
+        )
+        self.peers.start()
+    
+    def start_aggregator(self, license_key):
+        """Accept edge agents' uploads and forward them over the WAN in gzip batches"""
+        if self.ingest_server:
+            if hmac.compare_digest(self.ingest_server.license_key, license_key):
+                return
+            self.stop_aggregator()
+        try:
+            spool = IngestSpool()
+            self.ingest_server = IngestServer(license_key, spool, self.settings.get('aggregator_port', AGGREGATOR_PORT))
+        except OSError as e:
+            self.log(f"❌ Aggregator could not start: {e}", "error")
+            return
+        threading.Thread(target=self.ingest_server.serve_forever, name="AggregatorIngest", daemon=True).start()
+        self.uplink = AggregatorUplink(AttenduxAPI(license_key), spool, self.ingest_server, self.sync_events)
+        self.uplink.start()
+        self.log(f"🛰 Aggregator listening on port {self.ingest_server.server_address[1]}", "info")
+    
+    def stop_aggregator(self):
+        if self.ingest_server:
+            self.ingest_server.shutdown()
+            self.ingest_server.server_close()
+            self.ingest_server = None
+        if self.uplink:
+            self.uplink.stop()
+            if not self.uplink.wait(SYNC_STOP_DEADLINE_MS):
+                self.abandoned_workers.append(self.uplink)  # Keep the QThread alive until it returns
+            self.uplink = None
+    
+    def on_connect_settled(self):
+        """License check and device load finished (or failed): resume auto-sync"""
+        STARTUP.mark('connected')
+        if self.pending_resume:
+            self.pending_resume = False
+            self.resume_auto_sync()
+        self.start_backfill()
+    
+    def start_backfill(self):
+        """Start the backfill lane if ranges are queued and it is not running"""
+        if not self.api or not self.backfill_queue.pending():
+            return
+        if self.backfill_worker and self.backfill_worker.isRunning():
+            return
+        kbps = self.settings.get('backfill_kbps')
+        self.backfill_worker = BackfillWorker(
+            self.api, self.backfill_queue, self.archive, self.sync_events, self.realtime_busy,
+            bytes_per_second=kbps * 1024 if kbps else BACKFILL_MAX_BYTES_PER_SECOND,
+            requests_per_minute=self.settings.get('backfill_requests_per_minute', BACKFILL_MAX_REQUESTS_PER_MINUTE)
+        )
+        self.backfill_worker.start()
     
     def connect_license(self):
         """Connect to Attendux cloud (async to avoid UI freeze)"""
@@ -846,28 +5151,27 @@ class AttenduxSyncAgent(QMainWindow):
             self.log("Please enter a license key", "error")
             return
         
+        # The same check is already in flight; its result will update the UI
+        if self.tasks.is_running(('verify_license', license_key)):
+            return
+        
         self.log("🔑 Verifying license...", "info")
         self.connect_btn.setEnabled(False)
         self.connect_btn.setText("Connecting..." if self.current_language == 'en' else "جاري الاتصال...")
         
-        # Create API instance
-        self.api = AttenduxAPI(license_key)
+        # Create API instance; edge agents upload through the site aggregator
+        role = self.settings.get('role', ROLE_STANDALONE)
+        uplink_url = self.settings.get('uplink_url') if role == ROLE_EDGE else None
+        self.api = AttenduxAPI(license_key, uplink_url=uplink_url, wire_format=self.settings.get('wire_format'))
+        if self.capture and self.capture.active:
+            self.capture.attach_api(self.api)
         
-        # Verify license in background thread
-        class LicenseVerifier(QThread):
-            result_ready = pyqtSignal(dict)
-            
-            def __init__(self, api):
-                super().__init__()
-                self.api = api
-            
-            def run(self):
-                try:
-                    result = self.api.verify_license()
-                    self.result_ready.emit(result if result else {})
-                except Exception as e:
-                    print(f"License verification error: {e}")
-                    self.result_ready.emit({})
+        # Verify license in the shared background pool
+        tracer = SpanTracer("connect")
+        
+        def verify(api=self.api):
+            with tracer.span('license_verify'):
+                return api.verify_license() or {}
         
         def on_result_ready(result):
             if result and result.get('valid'):
@@ -878,6 +5182,7 @@ class AttenduxSyncAgent(QMainWindow):
                 self.status_label.setText(f"✅ {self.tr('connected')} - {self.company_info.get('name', 'Unknown')}")
                 
                 # Show company info
+                self.ensure_company_info_widget()
                 self.company_name_label.setText(f"{self.tr('company_label')}: {self.company_info.get('name', 'N/A')}")
                 self.company_plan_label.setText(f"{self.tr('plan_label')}: {self.company_info.get('plan', 'N/A')}")
                 
@@ -893,212 +5198,74 @@ class AttenduxSyncAgent(QMainWindow):
                 # Save license key
                 self.settings['license_key'] = license_key
                 self.save_settings()
+                self.verified_license_key = license_key
+                self.update_peer_group()
+                if role == ROLE_AGGREGATOR:
+                    # Only a verified license may accept (and acknowledge) edge uploads
+                    self.start_aggregator(license_key)
                 
                 self.log(f"✅ Connected as {self.company_info.get('name')}", "success")
                 
                 # Load devices (also async)
-                QTimer.singleShot(500, self.load_company_devices)
+                self.load_company_devices()
+                
+                # Optionally preload the dashboard once things are quiet
+                if self.settings.get('dashboard_prewarm', False):
+                    QTimer.singleShot(DASHBOARD_PREWARM_DELAY_MS, self.prewarm_dashboard)
                 
             else:
                 self.status_indicator.setStyleSheet(f"color: {BRAND_DANGER}; font-size: 24px;")
                 self.status_label.setText("❌ Invalid License")
                 self.log("❌ Invalid license key or expired", "error")
+                self.verified_license_key = None
+                self.update_peer_group()
+                self.stop_aggregator()
+                # Still resume: cached devices sync once the network is back
+                self.on_connect_settled()
             
             self.connect_btn.setEnabled(True)
             self.connect_btn.setText(self.tr('connect'))
         
-        self.license_verifier = LicenseVerifier(self.api)
-        self.license_verifier.result_ready.connect(on_result_ready)
-        self.license_verifier.start()
+        def on_verify_error(error):
+            print(f"License verification error: {error}")
+            on_result_ready({})
+        
+        def on_verified(result):
+            try:
+                tracer.export()
+            except Exception as e:
+                print(f"Failed to write connect trace: {e}")
+            on_result_ready(result)
+        
+        self.tasks.submit(
+            ('verify_license', license_key),
+            verify,
+            on_verified,
+            on_verify_error
+        )
     
     def open_dashboard(self):
-        """Open Attendux dashboard in embedded browser - fullscreen without toolbar"""
-        dashboard_url = "https://app.attendux.com"
+        """Open Attendux dashboard in a separate process - fullscreen without toolbar
         
+        Chromium lives in its own process (run_dashboard_process), so the agent
+        never loads QtWebEngine and closing the dashboard returns its memory.
+        """
         # If QtWebEngine is not available, use external browser
         if not WEBENGINE_AVAILABLE:
             import webbrowser
-            webbrowser.open(dashboard_url)
-            self.log(f"🌐 Opening dashboard in external browser", "info")
+            webbrowser.open(DASHBOARD_URL)
+            self.log("🌐 Opening dashboard in external browser", "info")
             return
         
         try:
-            # Create dashboard window if not exists
-            if not self.dashboard_browser or not self.dashboard_browser.isVisible():
-                self.dashboard_browser = QWidget()
-                self.dashboard_browser.setWindowTitle("أتندوكس - لوحة التحكم")
-                
-                # Make it fullscreen or maximized
-                screen = QApplication.desktop().screenGeometry()
-                self.dashboard_browser.setGeometry(0, 0, screen.width(), screen.height())
-                self.dashboard_browser.showMaximized()  # Start maximized
-                
-                # Create layout with no margins for fullscreen
-                browser_layout = QVBoxLayout(self.dashboard_browser)
-                browser_layout.setContentsMargins(0, 0, 0, 0)
-                browser_layout.setSpacing(0)
-                
-                try:
-                    # Configure persistent session profile for cookie/session storage
-                    if WEBENGINE_AVAILABLE:
-                        from PyQt5.QtWebEngineWidgets import QWebEngineProfile
-                        
-                        # Get or create persistent profile
-                        profile = QWebEngineProfile.defaultProfile()
-                        
-                        # Enable persistent cookies (critical for login sessions)
-                        profile.setPersistentCookiesPolicy(QWebEngineProfile.AllowPersistentCookies)
-                        
-                        # Set cache directory for persistence
-                        import os
-                        cache_dir = os.path.expanduser("~/.attendux_sync/cache")
-                        storage_dir = os.path.expanduser("~/.attendux_sync/storage")
-                        
-                        try:
-                            os.makedirs(cache_dir, exist_ok=True)
-                            os.makedirs(storage_dir, exist_ok=True)
-                        except:
-                            pass
-                        
-                        profile.setCachePath(cache_dir)
-                        profile.setPersistentStoragePath(storage_dir)
-                        
-                        # Set a proper User-Agent to avoid detection issues
-                        profile.setHttpUserAgent("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
-                        
-                        # Disable HTTP strict transport security (HSTS) to avoid issues
-                        profile.setHttpCacheType(QWebEngineProfile.MemoryHttpCache)
-                    
-                    # Create web view - takes full window (no toolbar)
-                    web_view = QWebEngineView()
-                    
-                    # Track URL changes to detect redirect loops
-                    self.url_change_count = 0
-                    self.last_url = None
-                    
-                    # Add URL change handler to detect refresh issues
-                    def on_url_changed(url):
-                        url_str = url.toString()
-                        self.log(f"🌐 URL Changed: {url_str}", "info")
-                        
-                        # Detect redirect loop (same URL changing repeatedly)
-                        if self.last_url == url_str:
-                            self.url_change_count += 1
-                            if self.url_change_count > 3:
-                                self.log(f"⚠️ WARNING: Redirect loop detected! URL: {url_str}", "error")
-                                self.log(f"⚠️ Stopping page load to prevent infinite loop", "error")
-                                web_view.stop()
-                                return
-                        else:
-                            self.url_change_count = 0
-                            self.last_url = url_str
-                    
-                    def on_load_started():
-                        self.log(f"🔄 Page load started...", "info")
-                    
-                    def on_load_finished(success):
-                        if success:
-                            self.log(f"✅ Page loaded successfully", "info")
-                            # Inject JavaScript to disable any auto-refresh or meta refresh tags
-                            inject_script = """
-                            (function() {
-                                // Remove any meta refresh tags
-                                var metaRefresh = document.querySelector('meta[http-equiv="refresh"]');
-                                if (metaRefresh) {
-                                    metaRefresh.remove();
-                                    console.log('Attendux Sync: Removed meta refresh tag');
-                                }
-                                
-                                // Store original reload function
-                                var originalReload = window.location.reload;
-                                var reloadAttempts = 0;
-                                
-                                // Override location.reload to prevent auto-refresh
-                                window.location.reload = function(forcedReload) {
-                                    reloadAttempts++;
-                                    console.warn('Attendux Sync: Blocked automatic page reload attempt #' + reloadAttempts);
-                                    console.trace('Reload called from:');
-                                    // Don't actually reload
-                                    return false;
-                                };
-                                
-                                // Prevent setInterval/setTimeout from calling reload
-                                var originalSetInterval = window.setInterval;
-                                window.setInterval = function(func, delay) {
-                                    // Check if function calls reload
-                                    var funcStr = func.toString();
-                                    if (funcStr.includes('reload') || funcStr.includes('location.href')) {
-                                        console.warn('Attendux Sync: Blocked setInterval that calls reload/redirect');
-                                        return 0; // Return dummy interval ID
-                                    }
-                                    return originalSetInterval.apply(this, arguments);
-                                };
-                                
-                                console.log('Attendux Sync: Auto-refresh prevention initialized');
-                            })();
-                            """
-                            web_view.page().runJavaScript(inject_script)
-                        else:
-                            self.log(f"❌ Page load failed", "error")
-                    
-                    web_view.urlChanged.connect(on_url_changed)
-                    web_view.loadStarted.connect(on_load_started)
-                    web_view.loadFinished.connect(on_load_finished)
-                    
-                    # Enable web features that might be needed
-                    if WEBENGINE_AVAILABLE:
-                        from PyQt5.QtWebEngineWidgets import QWebEngineSettings
-                        settings = web_view.settings()
-                        settings.setAttribute(QWebEngineSettings.LocalStorageEnabled, True)
-                        settings.setAttribute(QWebEngineSettings.JavascriptEnabled, True)
-                        settings.setAttribute(QWebEngineSettings.JavascriptCanOpenWindows, False)
-                        settings.setAttribute(QWebEngineSettings.LocalContentCanAccessRemoteUrls, True)
-                        settings.setAttribute(QWebEngineSettings.AutoLoadImages, True)
-                        
-                        # BALANCED: Disable heavy features to reduce lag
-                        settings.setAttribute(QWebEngineSettings.WebGLEnabled, False)  # Disable WebGL (causes lag)
-                        settings.setAttribute(QWebEngineSettings.Accelerated2dCanvasEnabled, False)  # Disable 2D accel (causes lag)
-                        settings.setAttribute(QWebEngineSettings.AutoLoadIconsForPage, False)  # Skip favicons (faster load)
-                        
-                        # Additional optimization settings
-                        settings.setAttribute(QWebEngineSettings.PluginsEnabled, False)  # No plugins needed
-                        settings.setAttribute(QWebEngineSettings.ScrollAnimatorEnabled, False)  # No smooth scroll
-                        settings.setAttribute(QWebEngineSettings.FocusOnNavigationEnabled, False)  # Reduce focus events
-                        settings.setAttribute(QWebEngineSettings.AllowRunningInsecureContent, False)  # Security + speed
-                        
-                        self.log(f"✅ WebEngine: Balanced mode (WebGL OFF, 2D Canvas OFF, optimized)", "info")
-                    
-                    # BALANCED: Optimize rendering for stability and performance
-                    web_view.setUpdatesEnabled(True)
-                    web_view.setAttribute(Qt.WA_OpaquePaintEvent, True)  # Opaque (faster, no transparency)
-                    web_view.setAttribute(Qt.WA_NoSystemBackground, True)  # Skip system bg (faster)
-                    web_view.setAttribute(Qt.WA_DontCreateNativeAncestors, True)  # Reduce native widget overhead
-                    
-                    # Limit render updates (reduces CPU usage)
-                    if PLATFORM == 'Windows':
-                        web_view.setUpdatesEnabled(True)  # Keep updates but optimize
-                    
-                    self.log(f"✅ Rendering: Balanced mode (opaque paint, optimized updates)", "info")
-                    
-                    web_view.setUrl(QUrl(dashboard_url))
-                    browser_layout.addWidget(web_view)
-                    
-                    # Store web_view reference for potential future use
-                    self.dashboard_webview = web_view
-                except Exception as web_error:
-                    # Fallback: Open in external browser if QtWebEngine fails
-                    import webbrowser
-                    webbrowser.open(dashboard_url)
-                    self.dashboard_browser.close()
-                    self.log(f"🌐 Opening dashboard in external browser (QtWebEngine error)", "info")
-                    return
-            
-            # Show the browser window
-            self.dashboard_browser.show()
-            self.dashboard_browser.raise_()
-            self.dashboard_browser.activateWindow()
+            self.dashboard_show_requested = time.perf_counter()
+            if self.dashboard_process and self.dashboard_process.state() != QProcess.NotRunning:
+                # Already running (or prewarmed in the background): just bring the window forward
+                self.dashboard_process.write(b"show\n")
+            else:
+                self.start_dashboard_process()
             
-            self.log(f"🌐 {self.tr('open_dashboard')}: {dashboard_url}", "info")
+            self.log(f"🌐 {self.tr('open_dashboard')}: {DASHBOARD_URL}", "info")
             
             if self.notifications_checkbox.isChecked():
                 msg_title = "لوحة التحكم" if self.current_language == 'ar' else "Dashboard Opened"
@@ -1112,57 +5279,218 @@ class AttenduxSyncAgent(QMainWindow):
         except Exception as e:
             self.log(f"❌ Failed to open dashboard: {str(e)}", "error")
     
+    def prewarm_dashboard(self):
+        """Load the dashboard hidden in the background so opening it is instant"""
+        if not WEBENGINE_AVAILABLE or not self.settings.get('dashboard_prewarm', False):
+            return
+        if self.dashboard_process and self.dashboard_process.state() != QProcess.NotRunning:
+            return
+        if self.sync_worker and self.sync_worker.isRunning():
+            # Don't compete with a sync for CPU and bandwidth; try again later
+            QTimer.singleShot(DASHBOARD_PREWARM_DELAY_MS, self.prewarm_dashboard)
+            return
+        self.log("🌐 Preloading dashboard in the background...", "info")
+        self.start_dashboard_process(prewarm=True)
+    
+    def start_dashboard_process(self, prewarm=False):
+        """Launch this executable in dashboard mode"""
+        self.dashboard_process = QProcess(self)
+        self.dashboard_process.setProcessChannelMode(QProcess.SeparateChannels)
+        self.dashboard_process.readyReadStandardOutput.connect(self.on_dashboard_output)
+        self.dashboard_process.finished.connect(self.on_dashboard_finished)
+        self.dashboard_process.errorOccurred.connect(self.on_dashboard_error)
+        
+        if getattr(sys, 'frozen', False):
+            program, args = sys.executable, []
+        else:
+            program, args = sys.executable, [os.path.abspath(__file__)]
+        args += ['--dashboard', '--lang', self.current_language]
+        if prewarm:
+            args.append('--prewarm')
+        
+        self.dashboard_rss_before = process_memory_mb()
+        self.dashboard_process.start(program, args)
+    
+    def on_dashboard_output(self, *args):
+        """Relay the dashboard process's status lines into the activity log"""
+        while self.dashboard_process and self.dashboard_process.canReadLine():
+            line = bytes(self.dashboard_process.readLine()).decode('utf-8', errors='replace').strip()
+            parts = line.split(' ', 2)
+            if len(parts) == 3 and parts[0] == 'LOG':
+                self.log(parts[2], parts[1])
+            elif len(parts) >= 2 and parts[0] == 'READY':
+                dashboard_rss = process_memory_mb(int(self.dashboard_process.processId()))
+                self.log(
+                    f"📊 Dashboard ready in {parts[1]} ms (dashboard RSS {dashboard_rss:.0f} MB, "
+                    f"agent RSS {process_memory_mb():.0f} MB)", "info"
+                )
+            elif parts[0] == 'SHOWN' and self.dashboard_show_requested:
+                elapsed = (time.perf_counter() - self.dashboard_show_requested) * 1000
+                self.dashboard_show_requested = None
+                self.log(f"📊 Dashboard window shown {elapsed:.0f} ms after click", "info")
+            elif len(parts) == 3 and parts[0] == 'CACHE':
+                hits, total = int(parts[1]), int(parts[2])
+                ratio = hits / total * 100 if total else 0.0
+                self.log(f"📊 Dashboard cache: {hits}/{total} assets from disk cache ({ratio:.0f}% hit ratio)", "info")
+    
+    def on_dashboard_finished(self, *args):
+        """Dashboard window closed: its memory is back to the system"""
+        self.log(f"🌐 Dashboard closed (agent RSS {process_memory_mb():.0f} MB)", "info")
+        self.dashboard_process = None
+    
+    def on_dashboard_error(self, error):
+        """Dashboard process failed to start: fall back to the external browser"""
+        if error == QProcess.FailedToStart:
+            import webbrowser
+            webbrowser.open(DASHBOARD_URL)
+            self.log("🌐 Opening dashboard in external browser (dashboard process failed)", "info")
+            self.dashboard_process = None
+    
+    def close_dashboard(self):
+        """Close the dashboard process if it is running"""
+        if self.dashboard_process and self.dashboard_process.state() != QProcess.NotRunning:
+            self.dashboard_process.write(b"quit\n")
+            if not self.dashboard_process.waitForFinished(1000):
+                self.dashboard_process.kill()
+    
+    def checkpoint_sync_times(self):
+        """Last successful upload time per device, from the sync checkpoint"""
+        times = {}
+        for key, entry in list(self.checkpoint.devices.items()):
+            if entry.get('updated'):
+                times[key] = entry['updated'][:19].replace('T', ' ')
+        return times
+    
+    def on_sync_events(self, snapshot):
+        """Apply one coalesced snapshot of sync engine events"""
+        logs = snapshot['logs']
+        if snapshot['dropped_logs']:
+            logs = logs + [(f"… {snapshot['dropped_logs']} sync log lines skipped", "warning")]
+        self.log_many(logs)
+        
+        for key, state in snapshot['device_states'].items():
+            self.on_device_state(key, state)
+        
+        if snapshot['progress']:
+            current, total = snapshot['progress']
+            self.tray_icon.setToolTip(f"Attendux Sync Agent - {self.tr('sync_now')} {current}/{total}")
+    
+    def on_device_state(self, key, state):
+        """Live per-device state from the sync worker"""
+        if self.idle:
+            self.pending_device_states.setdefault(key, {}).update(state)
+            return
+        self.devices_model.update_device(key, state)
+    
     def load_company_devices(self):
         """Load devices from cloud for this company (async)"""
-        if not self.api:
+        if not self.api or self.tasks.is_running('load_devices'):
             return
         
         self.log("📡 Loading devices from cloud...", "info")
         self.refresh_devices_btn.setEnabled(False)
         
-        class DeviceLoader(QThread):
-            devices_ready = pyqtSignal(list)
-            
-            def __init__(self, api):
-                super().__init__()
-                self.api = api
-            
-            def run(self):
-                try:
-                    devices = self.api.get_company_devices()
-                    self.devices_ready.emit(devices if devices else [])
-                except Exception as e:
-                    print(f"Device loading error: {e}")
-                    self.devices_ready.emit([])
-        
         def on_devices_ready(devices):
             if devices:
                 self.settings['devices'] = devices
                 self.save_settings()
                 
-                # Update device list
-                self.devices_list.clear()
-                for device in devices:
-                    item_text = f"✓ {device['name']} - {device['ip']}:{device['port']} (ID: {device.get('id', 'N/A')})"
-                    item = QListWidgetItem(item_text)
-                    item.setData(Qt.UserRole, device)
-                    self.devices_list.addItem(item)
+                # Update device table
+                self.devices_model.set_devices(devices, self.checkpoint_sync_times())
                 
                 self.log(f"✅ Loaded {len(devices)} devices for your company", "success")
             else:
                 self.log("ℹ️ No devices found. Add devices in Attendux dashboard first.", "warning")
             
             self.refresh_devices_btn.setEnabled(True)
+            self.on_connect_settled()
+        
+        def on_devices_error(error):
+            print(f"Device loading error: {error}")
+            on_devices_ready([])
+        
+        self.tasks.submit(
+            'load_devices',
+            lambda api=self.api: api.get_company_devices() or [],
+            on_devices_ready,
+            on_devices_error
+        )
+    
+    def sync_worker_busy(self):
+        """Whether a sync is running; a worker past WORKER_ABANDON_SECONDS is replaced
+        
+        The worker's own watchdog should end any cycle well before this; if
+        it is still running, it is stopped and set aside so one stuck run
+        cannot block every later cycle until the agent restarts.
+        """
+        self.abandoned_workers = [worker for worker in self.abandoned_workers if worker.isRunning()]
+        worker = self.sync_worker
+        if not worker or not worker.isRunning():
+            return False
+        if worker.started_at is None or time.monotonic() - worker.started_at < WORKER_ABANDON_SECONDS:
+            return True
+        
+        self.log(f"⏱ Sync has run for over {WORKER_ABANDON_SECONDS // 60} min; abandoning it", "error")
+        self.abandoned_worker_count += 1
+        try:
+            worker.sync_complete_signal.disconnect()
+        except TypeError:
+            pass
+        worker.stop()
+        self.abandoned_workers.append(worker)  # Keep the QThread alive until it returns
+        self.sync_worker = None
+        self.realtime_busy.clear()
+        self.sync_now_btn.setEnabled(True)
+        return False
+    
+    def import_usb_log(self):
+        """Upload an attlog export from a USB stick for one device"""
+        if not self.api:
+            self.log("❌ Connect your license before importing", "error")
+            return
+        if self.sync_worker_busy() or self.tasks.is_running('import_attlog'):
+            self.log("⚠️ Wait for the running sync or import to finish", "warning")
+            return
+        path, _ = QFileDialog.getOpenFileName(
+            self, self.tr('import_usb'), "", "Attendance logs (*.dat *.txt *.csv);;All files (*)"
+        )
+        if not path:
+            return
+        devices = self.settings.get('devices', [])
+        names = [f"{device['name']} ({device_key(device)})" for device in devices]
+        name, ok = QInputDialog.getItem(self, self.tr('import_usb'), self.tr('col_name'), names, 0, False)
+        if not ok or not name:
+            return
+        device = devices[names.index(name)]
         
-        self.device_loader = DeviceLoader(self.api)
-        self.device_loader.devices_ready.connect(on_devices_ready)
-        self.device_loader.start()
+        self.log(f"📥 Importing {os.path.basename(path)} for {device['name']}...", "info")
+        events = self.sync_events
+        
+        def on_imported(stats):
+            self.log(
+                f"✅ Imported {stats['uploaded']} records for {device['name']} "
+                f"({stats['already_synced']} already synced, {stats['skipped']} unreadable rows) "
+                f"at {stats['records_per_second']} records/sec", "success"
+            )
+            self.on_device_state(device_key(device), {'last_sync': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+        
+        self.tasks.submit(
+            'import_attlog',
+            lambda api=self.api: import_attlog(api, path, device, self.checkpoint, self.archive,
+                                               log=lambda message: events.log(message, "info")),
+            on_imported,
+            lambda e: self.log(f"❌ Import failed: {e}", "error")
+        )
     
     def start_sync(self):
         """Start sync process"""
-        if self.sync_worker and self.sync_worker.isRunning():
+        if self.sync_worker_busy():
             self.log("⚠️ Sync already in progress", "warning")
             return
+        if self.tasks.is_running('import_attlog'):
+            # Both write the checkpoint and archive state
+            self.log("⚠️ USB import in progress, sync skipped", "warning")
+            return
         
         devices = self.settings.get('devices', [])
         
@@ -1170,26 +5498,90 @@ class AttenduxSyncAgent(QMainWindow):
             self.log("❌ No devices to sync. Load devices first.", "error")
             return
         
+        # Other agents of this license on the LAN poll their share of the devices
+        if self.peers and self.peers.active:
+            total = len(devices)
+            devices, others = self.peers.assign(devices)
+            for key in others:
+                self.on_device_state(key, {'status': 'peer'})
+            if others:
+                self.log(
+                    f"🤝 Syncing {len(devices)} of {total} devices; "
+                    f"{len(others)} handled by {', '.join(sorted(set(others.values())))}", "info"
+                )
+            if not devices:
+                return
+        
+        # Busiest and most overdue devices first
+        plan = self.scheduler.plan(devices)
+        devices = [device for device, _ in plan]
+        if len(devices) > 1:
+            self.log(f"📋 Sync order: {SyncScheduler.describe(plan)}", "info")
+        
         # Disable buttons
         self.sync_now_btn.setEnabled(False)
+        self.last_sync_started = time.time()
+        STARTUP.mark('first_sync_started')
         
         # Start worker
-        self.sync_worker = SyncWorker(self.api, devices)
-        self.sync_worker.log_signal.connect(self.log)
+        profiler = SyncProfiler() if SyncProfiler.enabled(self.settings) else None
+        self.sync_worker = SyncWorker(
+            self.api, devices, self.checkpoint, events=self.sync_events, profiler=profiler,
+            archive=self.archive, profiles=self.device_profiles, health=self.device_health,
+            backfill=self.backfill_queue
+        )
+        if self.capture and self.capture.active and ZK_AVAILABLE:
+            self.log(f"🎙 Capturing this sync run to {self.capture.path}", "info")
+            self.capture.begin_run(devices, self.checkpoint, self.sync_worker.profiles)
+            self.sync_worker.zk_factory = self.capture.zk_factory
         self.sync_worker.sync_complete_signal.connect(self.sync_completed)
+        self.realtime_busy.set()
         self.sync_worker.start()
     
     def sync_completed(self, result):
         """Handle sync completion"""
+        # Show the run's last log lines before anything below
+        self.sync_events.flush()
+        self.realtime_busy.clear()
+        self.tray_icon.setToolTip("Attendux Sync Agent")
+        
+        if 'first_sync' not in STARTUP.marks:
+            first_sync_ms = STARTUP.mark('first_sync')
+            self.log(f"⏱ Startup: {STARTUP.summary()}", "info")
+            if first_sync_ms > STARTUP_FIRST_SYNC_BUDGET_SECONDS * 1000:
+                self.log(
+                    f"⚠️ First sync took {first_sync_ms / 1000:.0f}s from launch "
+                    f"(budget {STARTUP_FIRST_SYNC_BUDGET_SECONDS}s)", "warning"
+                )
+        
         # Update last sync time
         self.settings['last_sync'] = result['timestamp']
         self.save_settings()
         
+        try:
+            self.sync_history.append(result)
+        except Exception as e:
+            print(f"Failed to record sync history: {e}")
+        self.scheduler.record(result)
+        if self.peers:
+            for key in self.peers.record_results(result.get('device_results', [])):
+                self.log(f"🤝 Leaving {key} to the other agents after repeated failed reads", "warning")
+        
+        if self.capture and self.capture.active and self.capture.devices:
+            try:
+                self.log(f"🎙 Sync run captured: {self.capture.save()}", "success")
+            except Exception as e:
+                self.log(f"❌ Failed to save capture: {e}", "error")
+        
         self.last_sync_label.setText(f"{self.tr('last_sync')}: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
         # Re-enable buttons
         self.sync_now_btn.setEnabled(True)
         
+        # Re-arm auto-sync now that server hints from this run are known
+        self.schedule_next_sync()
+        self.start_backfill()
+        
         # Show notification
         if self.notifications_checkbox.isChecked():
             if len(result['errors']) == 0:
@@ -1209,39 +5601,89 @@ class AttenduxSyncAgent(QMainWindow):
     
     def toggle_auto_sync(self):
         """Toggle auto-sync on/off"""
-        if self.sync_timer.isActive():
-            # Stop auto-sync
-            self.sync_timer.stop()
-            self.start_sync_btn.setText(self.tr('start_auto_sync'))
-            self.start_sync_btn.setObjectName("primaryButton")
-            self.log("⏸ Auto-sync stopped", "info")
-            
-            # Save state
-            self.settings['auto_sync_was_running'] = False
-            SettingsManager.save(self.settings)
+        if self.auto_sync_enabled:
+            self.disable_auto_sync()
         else:
-            # Start auto-sync
-            interval = self.interval_spinbox.value() * 60 * 1000  # Convert to milliseconds
-            self.sync_timer.start(interval)
-            self.start_sync_btn.setText(self.tr('stop_auto_sync'))
-            self.start_sync_btn.setObjectName("dangerButton")
-            self.log(f"▶ Auto-sync started (every {self.interval_spinbox.value()} minutes)", "success")
-            
-            # Save state
-            self.settings['auto_sync_was_running'] = True
-            SettingsManager.save(self.settings)
-            
-            # Do immediate sync
+            # User clicked: sync right away, then follow the jittered schedule
+            self.enable_auto_sync(immediate=True)
+    
+    def enable_auto_sync(self, immediate=False):
+        """Start auto-sync on this agent's jittered schedule"""
+        self.auto_sync_enabled = True
+        self.sync_pacer = SyncPacer(self.settings.get('license_key', ''))
+        self.start_sync_btn.setText(self.tr('stop_auto_sync'))
+        self.start_sync_btn.setObjectName("dangerButton")
+        self.log(f"▶ Auto-sync started (every {self.interval_spinbox.value()} minutes)", "success")
+        self.update_peer_group()
+        
+        # Save state
+        self.settings['auto_sync_was_running'] = True
+        SettingsManager.save(self.settings)
+        
+        if immediate:
             self.start_sync()
+            self.schedule_next_sync()
+        else:
+            self.schedule_next_sync(first=True)
+        
+        # Refresh button style
+        self.start_sync_btn.setStyle(self.start_sync_btn.style())
+    
+    def disable_auto_sync(self):
+        """Stop auto-sync"""
+        self.auto_sync_enabled = False
+        self.sync_timer.stop()
+        self.next_sync_at = None
+        self.start_sync_btn.setText(self.tr('start_auto_sync'))
+        self.start_sync_btn.setObjectName("primaryButton")
+        self.log("⏸ Auto-sync stopped", "info")
+        self.update_peer_group()
+        
+        # Save state
+        self.settings['auto_sync_was_running'] = False
+        SettingsManager.save(self.settings)
         
         # Refresh button style
         self.start_sync_btn.setStyle(self.start_sync_btn.style())
     
+    def schedule_next_sync(self, first=False):
+        """Arm the sync timer for this agent's next slot"""
+        if not self.auto_sync_enabled or not self.sync_pacer:
+            return
+        
+        interval = self.interval_spinbox.value() * 60
+        if first:
+            next_at = self.sync_pacer.first_sync_at(interval, self.api)
+        else:
+            next_at = self.sync_pacer.next_sync_at(interval, self.api, self.last_sync_started)
+        
+        self.next_sync_at = next_at
+        delay_ms = max(0, int((next_at - time.time()) * 1000))
+        self.sync_timer.start(delay_ms)
+    
+    def on_sync_timer(self):
+        """Auto-sync slot reached"""
+        interval = self.interval_spinbox.value() * 60
+        missed = self.sync_pacer.record_fire(self.next_sync_at, interval) if self.sync_pacer else 0
+        if missed:
+            self.log(f"⏭ Coalesced {missed} missed sync slot(s) into one", "info")
+        
+        if self.sync_worker_busy():
+            # Previous cycle still running: skip this slot. Re-arm anyway, so a
+            # worker that never completes cannot stop auto-sync for good
+            if self.sync_pacer:
+                self.sync_pacer.coalesced_ticks += 1
+            self.schedule_next_sync()
+            return
+        
+        self.start_sync()
+        self.schedule_next_sync()
+    
     def resume_auto_sync(self):
         """Resume auto-sync after app restart"""
-        if not self.sync_timer.isActive() and self.settings.get('auto_sync_was_running', False):
+        if not self.auto_sync_enabled and self.settings.get('auto_sync_was_running', False):
             self.log("🔄 Resuming auto-sync from previous session...", "info")
-            self.toggle_auto_sync()
+            self.enable_auto_sync(immediate=False)
     
     def save_settings(self):
         """Save settings to file"""
@@ -1257,6 +5699,7 @@ class AttenduxSyncAgent(QMainWindow):
         
         self.settings['auto_start'] = auto_start_enabled
         self.settings['show_notifications'] = self.notifications_checkbox.isChecked()
+        self.settings['dashboard_prewarm'] = self.prewarm_checkbox.isChecked()
         SettingsManager.save(self.settings)
     
     def add_to_startup(self):
@@ -1384,20 +5827,35 @@ class AttenduxSyncAgent(QMainWindow):
     
     def log(self, message, level="info"):
         """Add log message"""
+        self.log_many([(message, level)])
+    
+    def log_many(self, entries):
+        """Add (message, level) log lines with a single append and scroll"""
+        if not entries:
+            return
         timestamp = datetime.now().strftime('%H:%M:%S')
         
-        # Color based on level
-        if level == "success":
-            color = BRAND_SUCCESS
-        elif level == "error":
-            color = BRAND_DANGER
-        elif level == "warning":
-            color = BRAND_WARNING
-        else:
-            color = BRAND_GRAY_800
+        lines = []
+        for message, level in entries:
+            # Color based on level
+            if level == "success":
+                color = BRAND_SUCCESS
+            elif level == "error":
+                color = BRAND_DANGER
+            elif level == "warning":
+                color = BRAND_WARNING
+            else:
+                color = BRAND_GRAY_800
+            lines.append(f'<span style="color: {color};">[{timestamp}] {message}</span>')
         
-        html = f'<span style="color: {color};">[{timestamp}] {message}</span>'
-        self.log_text.append(html)
+        if self.idle:
+            # Hidden: keep the lines for leave_idle_mode instead of laying out text
+            for html in lines:
+                if len(self.pending_log) == self.pending_log.maxlen:
+                    self.pending_log_dropped += 1
+                self.pending_log.append(html)
+            return
+        self.log_text.append('<br>'.join(lines))
         
         # Auto-scroll to bottom
         scrollbar = self.log_text.verticalScrollBar()
@@ -1413,6 +5871,78 @@ class AttenduxSyncAgent(QMainWindow):
                 self.raise_()  # Bring to front
                 self.activateWindow()  # Give focus
     
+    def enter_idle_mode(self):
+        """Window hidden: stop repainting, buffer UI changes, coarsen timers"""
+        if self.idle:
+            return
+        self.idle = True
+        self.centralWidget().setUpdatesEnabled(False)
+        
+        # Let the OS batch the scheduler's wakeup with others (second granularity)
+        self.sync_timer.setTimerType(Qt.VeryCoarseTimer)
+        if self.sync_timer.isActive():
+            self.sync_timer.start(self.sync_timer.remainingTime())
+        
+        self.idle_monitor.start()
+        self.idle_sample_timer.start(IDLE_SAMPLE_MS)
+    
+    def leave_idle_mode(self):
+        """Window shown again: apply everything buffered in one pass"""
+        if not self.idle:
+            return
+        self.idle = False
+        self.idle_sample_timer.stop()
+        measurement = self.idle_monitor.stop()
+        
+        self.sync_timer.setTimerType(Qt.CoarseTimer)
+        if self.sync_timer.isActive():
+            self.sync_timer.start(self.sync_timer.remainingTime())
+        
+        if self.pending_log:
+            lines = list(self.pending_log)
+            if self.pending_log_dropped:
+                lines.insert(0, f'<span style="color: {BRAND_GRAY_800};">… {self.pending_log_dropped} earlier lines omitted</span>')
+            self.log_text.append('<br>'.join(lines))
+            self.pending_log.clear()
+            self.pending_log_dropped = 0
+        
+        for key, state in self.pending_device_states.items():
+            self.devices_model.update_device(key, state)
+        self.pending_device_states = {}
+        
+        self.centralWidget().setUpdatesEnabled(True)
+        
+        if measurement and measurement['idle_hours'] >= 0.1:
+            wakeups = measurement['wakeups_per_min']
+            self.log(
+                f"💤 Idle for {measurement['idle_hours']:.1f} h: "
+                f"{wakeups if wakeups is not None else '?'} wakeups/min, "
+                f"RSS drift {measurement['rss_drift_mb']:+.1f} MB", "info"
+            )
+        
+        scrollbar = self.log_text.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+    
+    def showEvent(self, event):
+        """Apply the stylesheet lazily, right before the first paint"""
+        if not self.stylesheet_applied:
+            self.stylesheet_applied = True
+            self.setStyleSheet(self.get_stylesheet())
+        self.leave_idle_mode()
+        super().showEvent(event)
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        if not event.spontaneous():
+            # Hidden to the tray (not merely minimized)
+            self.enter_idle_mode()
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            STARTUP.mark('first_paint')
+    
     def closeEvent(self, event):
         """Handle window close"""
         event.ignore()
@@ -1428,17 +5958,66 @@ class AttenduxSyncAgent(QMainWindow):
     
     def quit_app(self):
         """Quit application"""
-        # Stop sync if running
+        # Stop sync if running; progress is checkpointed so the next start resumes
         if self.sync_worker and self.sync_worker.isRunning():
             self.sync_worker.stop()
-            self.sync_worker.wait()
+            self.sync_worker.wait(SYNC_STOP_DEADLINE_MS)
+        if self.backfill_worker and self.backfill_worker.isRunning():
+            self.backfill_worker.stop()
+            self.backfill_worker.wait(SYNC_STOP_DEADLINE_MS)
+        if self.peers:
+            self.peers.stop()
+        self.stop_aggregator()
         
         # Stop timer
         self.sync_timer.stop()
         
+        # Close the dashboard process
+        self.close_dashboard()
+        
+        # Drop pending background tasks and leave a diagnostics snapshot
+        self.write_diagnostics()
+        self.tasks.shutdown()
+        
         # Quit
         QApplication.quit()
     
+    def collect_diagnostics(self):
+        """Runtime counters for support tickets"""
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'startup_ms': STARTUP.marks,
+            'tasks': self.tasks.diagnostics(),
+            'sync_events': self.sync_events.stats,
+            'history': self.sync_history.report(),
+            'coalesced_sync_slots': self.sync_pacer.coalesced_ticks if self.sync_pacer else 0,
+            'peers': self.peers.diagnostics() if self.peers else None,
+            'role': self.settings.get('role', ROLE_STANDALONE),
+            'aggregator': self.uplink.savings() if self.uplink else None,
+            'backfill': {
+                'jobs': self.backfill_queue.summary(),
+                'sent': self.backfill_worker.sent if self.backfill_worker else 0,
+                'throttled_seconds': round(self.backfill_worker.throttled_seconds, 1) if self.backfill_worker else 0
+            },
+            'watchdog': {
+                'abandoned_workers': self.abandoned_worker_count,
+                'devices': self.device_health.summary()
+            },
+            'idle': {
+                'current': self.idle_monitor.measure(),
+                'samples': self.idle_monitor.samples
+            }
+        }
+    
+    def write_diagnostics(self):
+        """Write collect_diagnostics() to DIAGNOSTICS_FILE"""
+        try:
+            os.makedirs(APP_DIR, exist_ok=True)
+            with open(DIAGNOSTICS_FILE, 'w', encoding='utf-8') as f:
+                json.dump(self.collect_diagnostics(), f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"Failed to write diagnostics: {e}")
+    
     def get_stylesheet(self):
         """Get application stylesheet with proper sizing"""
         return f"""
@@ -1540,23 +6119,26 @@ class AttenduxSyncAgent(QMainWindow):
                 border-width: 2px;
             }}
             
-            QListWidget {{
+            QTableView {{
                 border: 2px solid #e5e7eb;
                 border-radius: 8px;
                 background: white;
-                padding: 8px;
+                alternate-background-color: #fafafa;
+                gridline-color: #f3f4f6;
                 font-size: 13px;
             }}
             
-            QListWidget::item {{
-                padding: 12px;
-                border-bottom: 1px solid #f3f4f6;
-                min-height: 36px;
+            QTableView::item:selected {{
+                background-color: #f0f9ff;
+                color: {BRAND_GRAY_800};
             }}
             
-            QListWidget::item:hover {{
-                background-color: #f0f9ff;
-                border-radius: 4px;
+            QHeaderView::section {{
+                background-color: {BRAND_GRAY_100};
+                border: none;
+                border-bottom: 1px solid #e5e7eb;
+                padding: 6px 8px;
+                font-weight: 600;
             }}
             
             QTextEdit {{
@@ -1638,8 +6220,408 @@ class AttenduxSyncAgent(QMainWindow):
         """
 
 
+class DashboardWindow(QWidget):
+    """Embedded Attendux dashboard, hosted by the dashboard process
+    
+    Status lines go to stdout ("LOG <level> <message>", "READY <ms>") for the
+    agent to relay; commands arrive on stdin ("show", "quit").
+    """
+    
+    command_received = pyqtSignal(str)
+    
+    # Resources served from the HTTP cache report a zero transfer size
+    CACHE_STATS_SCRIPT = """
+    (function() {
+        var entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));
+        var hits = 0, total = 0;
+        entries.forEach(function(e) {
+            if (!e.decodedBodySize) { return; }  // Opaque cross-origin entry: not measurable
+            total++;
+            if (e.transferSize === 0) { hits++; }
+        });
+        return [hits, total];
+    })();
+    """
+    
+    def __init__(self, language='ar'):
+        super().__init__()
+        from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEngineProfile, QWebEngineSettings
+        
+        self.setWindowTitle("أتندوكس - لوحة التحكم" if language == 'ar' else "Attendux - Dashboard")
+        self.ready_reported = False
+        
+        # Make it fullscreen or maximized
+        screen = QApplication.desktop().screenGeometry()
+        self.setGeometry(0, 0, screen.width(), screen.height())
+        
+        # Create layout with no margins for fullscreen
+        browser_layout = QVBoxLayout(self)
+        browser_layout.setContentsMargins(0, 0, 0, 0)
+        browser_layout.setSpacing(0)
+        
+        # Configure persistent session profile for cookie/session storage
+        profile = QWebEngineProfile.defaultProfile()
+        
+        # Enable persistent cookies (critical for login sessions)
+        profile.setPersistentCookiesPolicy(QWebEngineProfile.AllowPersistentCookies)
+        
+        # Set cache directory for persistence
+        cache_dir = os.path.join(APP_DIR, "cache")
+        storage_dir = os.path.join(APP_DIR, "storage")
+        
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            os.makedirs(storage_dir, exist_ok=True)
+        except:
+            pass
+        
+        profile.setCachePath(cache_dir)
+        profile.setPersistentStoragePath(storage_dir)
+        
+        # Set a proper User-Agent to avoid detection issues
+        profile.setHttpUserAgent("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
+        
+        # Size-capped disk cache so restarts don't re-download every asset
+        profile.setHttpCacheType(QWebEngineProfile.DiskHttpCache)
+        profile.setHttpCacheMaximumSize(DASHBOARD_CACHE_MAX_BYTES)
+        
+        # Create web view - takes full window (no toolbar)
+        self.web_view = QWebEngineView()
+        
+        # Track URL changes to detect redirect loops
+        self.url_change_count = 0
+        self.last_url = None
+        
+        self.web_view.urlChanged.connect(self.on_url_changed)
+        self.web_view.loadStarted.connect(self.on_load_started)
+        self.web_view.loadFinished.connect(self.on_load_finished)
+        
+        # Enable web features that might be needed
+        settings = self.web_view.settings()
+        settings.setAttribute(QWebEngineSettings.LocalStorageEnabled, True)
+        settings.setAttribute(QWebEngineSettings.JavascriptEnabled, True)
+        settings.setAttribute(QWebEngineSettings.JavascriptCanOpenWindows, False)
+        settings.setAttribute(QWebEngineSettings.LocalContentCanAccessRemoteUrls, True)
+        settings.setAttribute(QWebEngineSettings.AutoLoadImages, True)
+        
+        # BALANCED: Disable heavy features to reduce lag
+        settings.setAttribute(QWebEngineSettings.WebGLEnabled, False)  # Disable WebGL (causes lag)
+        settings.setAttribute(QWebEngineSettings.Accelerated2dCanvasEnabled, False)  # Disable 2D accel (causes lag)
+        settings.setAttribute(QWebEngineSettings.AutoLoadIconsForPage, False)  # Skip favicons (faster load)
+        
+        # Additional optimization settings
+        settings.setAttribute(QWebEngineSettings.PluginsEnabled, False)  # No plugins needed
+        settings.setAttribute(QWebEngineSettings.ScrollAnimatorEnabled, False)  # No smooth scroll
+        settings.setAttribute(QWebEngineSettings.FocusOnNavigationEnabled, False)  # Reduce focus events
+        settings.setAttribute(QWebEngineSettings.AllowRunningInsecureContent, False)  # Security + speed
+        
+        self.log("✅ WebEngine: Balanced mode (WebGL OFF, 2D Canvas OFF, optimized)", "info")
+        
+        # BALANCED: Optimize rendering for stability and performance
+        self.web_view.setAttribute(Qt.WA_OpaquePaintEvent, True)  # Opaque (faster, no transparency)
+        self.web_view.setAttribute(Qt.WA_NoSystemBackground, True)  # Skip system bg (faster)
+        self.web_view.setAttribute(Qt.WA_DontCreateNativeAncestors, True)  # Reduce native widget overhead
+        
+        self.web_view.setUrl(QUrl(DASHBOARD_URL))
+        browser_layout.addWidget(self.web_view)
+        
+        self.command_received.connect(self.on_command)
+        threading.Thread(target=self._read_commands, name="DashboardStdin", daemon=True).start()
+    
+    @staticmethod
+    def log(message, level="info"):
+        """Send a log line to the agent"""
+        DashboardWindow.send(f"LOG {level} {message}")
+    
+    @staticmethod
+    def send(line):
+        """Write one status line to the agent; dropped when there is no pipe"""
+        if sys.stdout is None:
+            return
+        try:
+            print(line, flush=True)
+        except (OSError, ValueError):
+            pass
+    
+    def _read_commands(self):
+        """Read agent commands; EOF means the agent went away"""
+        if sys.stdin is None:
+            return  # Started by hand: the window lives until it is closed
+        for line in sys.stdin:
+            self.command_received.emit(line.strip())
+        self.command_received.emit("quit")
+    
+    def on_command(self, command):
+        if command == "show":
+            self.showMaximized()
+            self.raise_()
+            self.activateWindow()
+            self.send("SHOWN")
+        elif command == "quit":
+            QApplication.quit()
+    
+    def on_url_changed(self, url):
+        url_str = url.toString()
+        self.log(f"🌐 URL Changed: {url_str}", "info")
+        
+        # Detect redirect loop (same URL changing repeatedly)
+        if self.last_url == url_str:
+            self.url_change_count += 1
+            if self.url_change_count > 3:
+                self.log(f"⚠️ WARNING: Redirect loop detected! URL: {url_str}", "error")
+                self.log("⚠️ Stopping page load to prevent infinite loop", "error")
+                self.web_view.stop()
+                return
+        else:
+            self.url_change_count = 0
+            self.last_url = url_str
+    
+    def on_cache_stats(self, stats):
+        """Report how many page assets came from the disk cache"""
+        if isinstance(stats, list) and len(stats) == 2:
+            self.send(f"CACHE {int(stats[0])} {int(stats[1])}")
+    
+    def on_load_started(self):
+        self.log("🔄 Page load started...", "info")
+    
+    def on_load_finished(self, success):
+        if not success:
+            self.log("❌ Page load failed", "error")
+            return
+        
+        self.log("✅ Page loaded successfully", "info")
+        if not self.ready_reported:
+            self.ready_reported = True
+            self.send(f"READY {int((time.perf_counter() - _PROCESS_STARTED) * 1000)}")
+            self.web_view.page().runJavaScript(self.CACHE_STATS_SCRIPT, self.on_cache_stats)
+        
+        # Inject JavaScript to disable any auto-refresh or meta refresh tags
+        inject_script = """
+        (function() {
+            // Remove any meta refresh tags
+            var metaRefresh = document.querySelector('meta[http-equiv="refresh"]');
+            if (metaRefresh) {
+                metaRefresh.remove();
+                console.log('Attendux Sync: Removed meta refresh tag');
+            }
+            
+            // Store original reload function
+            var originalReload = window.location.reload;
+            var reloadAttempts = 0;
+            
+            // Override location.reload to prevent auto-refresh
+            window.location.reload = function(forcedReload) {
+                reloadAttempts++;
+                console.warn('Attendux Sync: Blocked automatic page reload attempt #' + reloadAttempts);
+                console.trace('Reload called from:');
+                // Don't actually reload
+                return false;
+            };
+            
+            // Prevent setInterval/setTimeout from calling reload
+            var originalSetInterval = window.setInterval;
+            window.setInterval = function(func, delay) {
+                // Check if function calls reload
+                var funcStr = func.toString();
+                if (funcStr.includes('reload') || funcStr.includes('location.href')) {
+                    console.warn('Attendux Sync: Blocked setInterval that calls reload/redirect');
+                    return 0; // Return dummy interval ID
+                }
+                return originalSetInterval.apply(this, arguments);
+            };
+            
+            console.log('Attendux Sync: Auto-refresh prevention initialized');
+        })();
+        """
+        self.web_view.page().runJavaScript(inject_script)
+
+
+def run_history_report(argv):
+    """Capacity planning report: --history [DAYS]"""
+    parser = argparse.ArgumentParser(prog="attendux_sync_agent --history",
+                                     description="Sync timing and volume report from the sync history")
+    parser.add_argument('days', type=int, nargs='?', default=7, help="days of history to cover (default 7)")
+    args = parser.parse_args(argv[argv.index('--history') + 1:])
+    if args.days < 1:
+        parser.error("DAYS must be at least 1")
+    print(json.dumps(SyncHistory().report(args.days), indent=2, ensure_ascii=False))
+    return 0
+
+
+def archive_time(text):
+    """FROM/TO of the archive commands: a date or an ISO timestamp"""
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a date or ISO timestamp: {text!r}")
+    if moment.tzinfo:
+        raise argparse.ArgumentTypeError(f"use the clocks' local time, without a UTC offset: {text!r}")
+    return moment
+
+
+def run_archive_command(argv):
+    """Archive CLI:
+    --archive-query FROM TO [EMPLOYEE]   print archived punches as JSON lines
+    --reupload FROM TO [DEVICE_KEY]      send an archived window to the cloud again
+    (FROM/TO are dates or ISO timestamps; TO is exclusive)
+    """
+    command = '--archive-query' if '--archive-query' in argv else '--reupload'
+    parser = argparse.ArgumentParser(prog=f"attendux_sync_agent {command}", description=(
+        "Print archived punches as JSON lines" if command == '--archive-query'
+        else "Send an archived window to the cloud again"
+    ))
+    parser.add_argument('start', metavar='FROM', type=archive_time, help="date or ISO timestamp")
+    parser.add_argument('end', metavar='TO', type=archive_time, help="date or ISO timestamp (exclusive)")
+    parser.add_argument('key', metavar='EMPLOYEE' if command == '--archive-query' else 'DEVICE_KEY', nargs='?')
+    args = parser.parse_args(argv[argv.index(command) + 1:])
+    if args.end <= args.start:
+        parser.error("TO must be after FROM")
+    start, end = args.start, args.end
+    archive = PunchArchive()
+    
+    if command == '--archive-query':
+        started = time.perf_counter()
+        count = 0
+        for record in archive.records(start, end, employee_id=args.key):
+            print(json.dumps(record, ensure_ascii=False))
+            count += 1
+        print(f"{count} punches in {time.perf_counter() - started:.3f}s", file=sys.stderr)
+        return 0
+    
+    settings = SettingsManager.load()
+    if not settings.get('license_key'):
+        print("No license key configured")
+        return 1
+    api = AttenduxAPI(settings['license_key'], wire_format=settings.get('wire_format'))
+    try:
+        sent, synced = reupload_archive(api, archive, start, end, [args.key] if args.key else None)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Re-uploaded {sent} records ({synced} synced)")
+    return 0
+
+
+def run_replay(argv):
+    """Re-run a captured sync cycle headless: --replay FILE [--speed X] [--profile]"""
+    parser = argparse.ArgumentParser(prog="attendux_sync_agent --replay",
+                                     description="Re-run a sync cycle captured with --capture")
+    parser.add_argument('path', metavar='FILE', help="capture file")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="multiplier for the recorded latencies; 0 skips them (default 1)")
+    parser.add_argument('--profile', action='store_true', help="profile the replayed run")
+    args = parser.parse_args(argv[argv.index('--replay') + 1:])
+    if args.speed < 0:
+        parser.error("--speed must not be negative")
+    if not ZK_AVAILABLE:
+        print("ZK library not installed; cannot replay device traffic")
+        return 1
+    
+    try:
+        replay = TrafficReplay(args.path, args.speed)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"❌ Cannot read capture {args.path}: {e}")
+        return 1
+    
+    app = QCoreApplication(argv)
+    results = []
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        profiler = SyncProfiler() if SyncProfiler.enabled() else None
+        events = SyncEventBus(max_log_lines=sys.maxsize)  # Headless: print every line
+        worker = SyncWorker(
+            replay.api(), replay.devices, replay.checkpoint(checkpoint_dir), events, profiler,
+            profiles=replay.profiles(checkpoint_dir)
+        )
+        worker.zk_factory = replay.zk_factory
+        events.snapshot_ready.connect(
+            lambda snapshot: [print(f"[{level}] {message}") for message, level in snapshot['logs']]
+        )
+        worker.sync_complete_signal.connect(results.append)
+        worker.finished.connect(app.quit)
+        worker.start()
+        app.exec_()
+        events.flush()
+    
+    if not results:
+        return 1
+    result = results[0]
+    print(json.dumps({
+        'pipeline': result['pipeline'],
+        'total_records': result['total_records'],
+        'total_synced': result['total_synced'],
+        'upload_requests': result['upload_requests'],
+        'errors': result['errors']
+    }, indent=2, ensure_ascii=False))
+    return 0
+
+
+def _attach_agent_pipes():
+    """UTF-8 stdin/stdout to the agent, also in a --windowed build
+    
+    A windowed executable starts with sys.stdin and sys.stdout set to None,
+    but the pipes QProcess created are still its standard handles.
+    """
+    for name, fd, mode in (('stdin', 0, 'r'), ('stdout', 1, 'w')):
+        stream = getattr(sys, name)
+        if stream is None:
+            try:
+                setattr(sys, name, open(fd, mode, encoding='utf-8', errors='replace', closefd=False))
+            except (OSError, ValueError):
+                pass
+        elif hasattr(stream, 'reconfigure'):
+            stream.reconfigure(encoding='utf-8', errors='replace')
+
+
+def run_dashboard_process(argv):
+    """Entry point for `--dashboard`: host the dashboard in its own process"""
+    language = argv[argv.index('--lang') + 1] if '--lang' in argv[:-1] else 'ar'
+    
+    if PLATFORM == 'Windows':
+        # Chromium flags for BALANCED performance (all in one line to avoid concatenation issues)
+        os.environ['QTWEBENGINE_CHROMIUM_FLAGS'] = '--disable-gpu-vsync --disable-smooth-scrolling --enable-low-end-device-mode --disable-accelerated-video-decode --single-process --disable-extensions'
+        os.environ['QTWEBENGINE_DISABLE_SANDBOX'] = '1'
+    
+    # QtWebEngine must be imported before the QApplication is created
+    import PyQt5.QtWebEngineWidgets  # noqa: F401
+    _attach_agent_pipes()
+    
+    app = QApplication(argv)
+    app.setApplicationName("Attendux Dashboard")
+    app.setOrganizationName("Attendux")
+    window = DashboardWindow(language)
+    # A prewarmed dashboard loads hidden until the agent sends "show"
+    if '--prewarm' not in argv:
+        window.showMaximized()
+        window.send("SHOWN")
+    return app.exec_()
+
+
 def main():
     """Main entry point"""
+    if '--dashboard' in sys.argv:
+        sys.exit(run_dashboard_process(sys.argv))
+    
+    if '--replay' in sys.argv:
+        sys.exit(run_replay(sys.argv))
+    
+    if '--wire-benchmark' in sys.argv:
+        sys.exit(run_wire_benchmark(sys.argv))
+    
+    if '--archive-query' in sys.argv or '--reupload' in sys.argv:
+        sys.exit(run_archive_command(sys.argv))
+    
+    if '--import-attlog' in sys.argv:
+        sys.exit(run_import_command(sys.argv))
+    
+    if '--peers' in sys.argv:
+        sys.exit(run_peer_status(sys.argv))
+    
+    if '--history' in sys.argv:
+        sys.exit(run_history_report(sys.argv))
+    
+    STARTUP.mark('imports')
+    
+
     try:
         # Windows-specific fixes
         if PLATFORM == 'Windows':
@@ -1647,10 +6629,6 @@ def main():
             # Use WARP (software renderer) instead of full hardware for stability
             os.environ['QT_ANGLE_PLATFORM'] = 'warp'  # Software D3D renderer (stable, no flash)
             
-            # Chromium flags for BALANCED performance (all in one line to avoid concatenation issues)
-            os.environ['QTWEBENGINE_CHROMIUM_FLAGS'] = '--disable-gpu-vsync --disable-smooth-scrolling --enable-low-end-device-mode --disable-accelerated-video-decode --single-process --disable-extensions'
-            os.environ['QTWEBENGINE_DISABLE_SANDBOX'] = '1'
-            
             # Moderate OpenGL - not full hardware, not full software
             os.environ['QT_OPENGL'] = 'angle'  # Use ANGLE for compatibility
             
@@ -1692,6 +6670,7 @@ def main():
         app = QApplication(sys.argv)
         app.setApplicationName("Attendux Sync Agent")
         app.setOrganizationName("Attendux")
+        STARTUP.mark('app_created')
         
         # BALANCED: Windows-specific settings for stability + performance
         if PLATFORM == 'Windows':
@@ -1717,13 +6696,8 @@ def main():
             font = QFont("Segoe UI", 9)
             app.setFont(font)
         
-        # Process events before showing window to ensure UI is responsive
-        QApplication.processEvents()
-        
         window = AttenduxSyncAgent()
-        
-        # Process events again to finish initialization
-        QApplication.processEvents()
+        STARTUP.mark('ui_built')
         
         # On Windows, start minimized to tray to avoid duplicate taskbar icons
         # User can open window from tray menu
@@ -1739,11 +6713,14 @@ def main():
                     3000
                 )
         else:
-            # On Mac/Linux, show window normally
-            window.show()
+            # On Mac/Linux, show window maximized to avoid cropped fields
+            window.showMaximized()
         
-        # Final event processing to ensure UI is ready
-        QApplication.processEvents()
+        # Cold start: process start to event loop running, without QtWebEngine loaded
+        def on_event_loop_started():
+            STARTUP.mark('event_loop')
+            window.log(f"🚀 Started: {STARTUP.summary()} (RSS {process_memory_mb():.0f} MB)", "info")
+        QTimer.singleShot(0, on_event_loop_started)
         
         sys.exit(app.exec_())
         
@@ -0,0 +1,155 @@
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+
+# The agent keeps its data under ~/.attendux_sync; keep test runs out of the real one
+os.environ['HOME'] = tempfile.mkdtemp(prefix='attendux-test-')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import attendux_sync_agent as agent
+
+
+def encode_zk_time(moment):
+    """Inverse of decode_zk_time"""
+    return (
+        ((moment.year % 100) * 12 * 31 + (moment.month - 1) * 31 + moment.day - 1) * 86400
+        + (moment.hour * 60 + moment.minute) * 60 + moment.second
+    )
+
+
+def attlog(punches, record_size=16):
+    """(user_id, datetime) pairs as 8-, 16- or 40-byte attendance records"""
+    rows = []
+    for number, (user_id, moment) in enumerate(punches):
+        stamp = struct.pack('<I', encode_zk_time(moment))
+        if record_size == 8:
+            rows.append(struct.pack('<HB4sB', int(user_id), 1, stamp, number % 2))
+        elif record_size == 16:
+            rows.append(struct.pack('<I4sBB2sI', int(user_id), stamp, 1, number % 2, b'', 0))
+        else:
+            rows.append(struct.pack('<H24sB4sB8s', number + 1, str(user_id).encode(), 1, stamp, number % 2, b''))
+    return b''.join(rows)
+
+
+class FakeClock:
+    """Minimal ZKTeco TCP device answering what pyzk needs to read the attendance log
+
+    self.punches is read on every connection, so tests change the log between cycles.
+    """
+
+    def __init__(self, punches=(), record_size=16):
+        self.punches = list(punches)
+        self.record_size = record_size
+        self.server = socket.socket()
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def device(self, device_id=1, name='Clock'):
+        return {'id': device_id, 'name': name, 'ip': '127.0.0.1', 'port': self.port}
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _reply(self, conn, command, reply_id, data=b''):
+        packet = struct.pack('<4H', command, 0, 77, reply_id) + data
+        conn.sendall(struct.pack('<HHI', 0x5050, 0x7d82, len(packet)) + packet)
+
+    def _handle(self, conn):
+        const = agent.zk_const
+        with conn:
+            while True:
+                top = conn.recv(8)
+                if len(top) < 8:
+                    return
+                length = struct.unpack('<HHI', top)[2]
+                body = b''
+                while len(body) < length:
+                    body += conn.recv(length - len(body))
+                command, _checksum, _session, reply_id = struct.unpack('<4H', body[:8])
+                if command == const.CMD_GET_FREE_SIZES:
+                    sizes = [0] * 20
+                    sizes[8] = len(self.punches)
+                    self._reply(conn, const.CMD_ACK_OK, reply_id, struct.pack('20i', *sizes) + b'\0' * 12)
+                elif command == 1503:
+                    records = attlog(self.punches, self.record_size)
+                    self._reply(conn, const.CMD_DATA, reply_id, struct.pack('I', len(records)) + records)
+                elif command == const.CMD_EXIT:
+                    self._reply(conn, const.CMD_ACK_OK, reply_id)
+                    return
+                else:
+                    self._reply(conn, const.CMD_ACK_OK, reply_id)
+
+    def close(self):
+        self.server.close()
+
+
+class FakeAPI:
+    """AttenduxAPI stand-in that accepts every batch and keeps what it was sent"""
+
+    def __init__(self):
+        self.sent = []
+        self.bytes_sent = 0
+        self.not_before = 0
+        self.suggested_next_sync = None
+
+    def seconds_until_allowed(self):
+        return 0
+
+    def send_attendance(self, records, compress=False):
+        self.sent.extend(records)
+        return {'success': True, 'synced': len(records)}
+
+
+@pytest.fixture
+def clock():
+    if not agent.ZK_AVAILABLE:
+        pytest.skip("pyzk is not installed")
+    import zk.base
+    original = zk.base.ZK_helper.test_ping
+    zk.base.ZK_helper.test_ping = lambda self: True
+    device = FakeClock()
+    yield device
+    device.close()
+    zk.base.ZK_helper.test_ping = original
+
+
+@pytest.fixture
+def tmp_file(tmp_path):
+    return lambda name: str(tmp_path / name)
+
+
+@pytest.fixture(scope='session')
+def qapp():
+    from PyQt5.QtCore import QCoreApplication
+    return QCoreApplication.instance() or QCoreApplication(sys.argv)
+
+
+@pytest.fixture
+def run_cycle(qapp, tmp_file):
+    """Run one SyncWorker cycle in this thread; returns (result, log lines)"""
+    def run(api, devices, checkpoint, **kwargs):
+        events = agent.SyncEventBus()
+        logs = []
+        events.snapshot_ready.connect(lambda snapshot: logs.extend(text for text, _level in snapshot['logs']))
+        kwargs.setdefault('profiles', agent.DeviceProfiles(tmp_file('profiles.json')))
+        worker = agent.SyncWorker(api, devices, checkpoint, events=events, **kwargs)
+        results = []
+        worker.sync_complete_signal.connect(results.append)
+        worker.run()
+        events.flush()
+        return results[0], logs
+    return run
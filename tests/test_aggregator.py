@@ -0,0 +1,209 @@
+import gzip
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import attendux_sync_agent as agent
+
+
+def records(device_id, count, employee_id='100'):
+    return [
+        {'employee_id': employee_id, 'timestamp': f"2026-05-01T08:{minute:02d}:00", 'device_id': device_id,
+         'type': 'auto', 'status': 1}
+        for minute in range(count)
+    ]
+
+
+def test_spool_commit_and_recovery(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, 'SPOOL_SEGMENT_BYTES', 400)
+    spool = agent.IngestSpool(str(tmp_path))
+    for device_id in range(6):
+        spool.append(records(device_id, 3))
+    assert spool.pending == 18
+    assert len(spool._segments()) > 1
+
+    batch, position = spool.read_batch(7)
+    assert [record['device_id'] for record in batch] == [0, 0, 0, 1, 1, 1, 2, 2, 2]
+    spool.commit(position, len(batch))
+    assert min(spool._segments()) == position[0]
+
+    # Crash with a torn line: the reopened spool resumes after the commit
+    with open(spool._path(spool.active), 'ab') as f:
+        f.write(b'[{"employee_id": "1"')
+    reopened = agent.IngestSpool(str(tmp_path))
+    assert reopened.pending == 0  # Counted by the uplink thread, not on open
+    assert reopened.count_backlog() == 9
+    assert reopened.pending == 9
+    reopened.append(records(9, 1))
+    batch, position = reopened.read_batch(100)
+    assert [record['device_id'] for record in batch] == [3, 3, 3, 4, 4, 4, 5, 5, 5, 9]
+    reopened.commit(position, len(batch))
+    assert agent.IngestSpool(str(tmp_path)).count_backlog() == 0
+
+
+def test_backlog_count_skips_lines_appended_meanwhile(tmp_path):
+    agent.IngestSpool(str(tmp_path)).append(records(1, 4))
+    spool = agent.IngestSpool(str(tmp_path))
+    lines = spool._lines
+
+    def append_while_counting(position):
+        spool.append(records(2, 2))  # Counted by append()
+        return lines(position)
+
+    spool._lines = append_while_counting
+    assert spool.count_backlog() == 4
+    assert spool.pending == 6
+
+
+def test_read_batch_by_lines(tmp_path):
+    spool = agent.IngestSpool(str(tmp_path))
+    spool.append(records(1, 2))
+    spool.append(records(2, 2))
+    batch, _position = spool.read_batch(100, 1)
+    assert [record['device_id'] for record in batch] == [1, 1]
+
+
+@pytest.fixture
+def ingest(tmp_path):
+    server = agent.IngestServer('LIC', agent.IngestSpool(str(tmp_path / 'spool')), 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, body, license_key='LIC', gzipped=False):
+    data = body if isinstance(body, bytes) else json.dumps(body).encode()
+    headers = {'X-License-Key': license_key, 'Content-Type': 'application/json'}
+    if gzipped:
+        headers['Content-Encoding'] = 'gzip'
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.server_address[1]}/api/sync/attendance", data=data, headers=headers
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize('bad', [
+    {'timestamp': '2026-05-01T08:00:00', 'device_id': 1},
+    {'employee_id': '', 'timestamp': '2026-05-01T08:00:00', 'device_id': 1},
+    {'employee_id': '7', 'timestamp': 'yesterday', 'device_id': 1},
+    {'employee_id': '7', 'timestamp': '2026-05-01T08:00:00', 'device_id': None},
+    {'employee_id': ['7'], 'timestamp': '2026-05-01T08:00:00', 'device_id': 1},
+    {'employee_id': '7', 'timestamp': '2026-05-01T08:00:00', 'device_id': 1},
+    {'employee_id': '7', 'timestamp': '2026-05-01T08:00:00', 'device_id': 1, 'status': 'in'},
+    {'employee_id': '7', 'timestamp': '2026-05-01T08:00:00', 'device_id': 1, 'status': True},
+    'not a record',
+])
+def test_ingest_rejects_invalid_records(ingest, bad):
+    status, reply = post(ingest, {'records': records(1, 2) + [bad]})
+    assert status == 400
+    assert reply['error'].startswith('record 2:')
+    assert ingest.spool.pending == 0
+
+
+def test_ingest_spools_valid_records(ingest):
+    assert post(ingest, {'records': records(1, 3)}) == (200, {'success': True, 'synced': 3})
+    assert post(ingest, {'records': records(1, 3)}, license_key='OTHER')[0] == 401
+    gzipped = gzip.compress(json.dumps({'records': records(2, 2)}).encode())
+    assert post(ingest, gzipped, gzipped=True) == (200, {'success': True, 'synced': 2})
+    assert ingest.spool.pending == 5
+
+
+def test_ingest_limits_body_size(ingest, monkeypatch):
+    monkeypatch.setattr(agent, 'INGEST_MAX_BODY_BYTES', 4096)
+    assert post(ingest, {'records': records(1, 60)})[0] == 413
+    # A few hundred bytes that inflate past the limit
+    bomb = gzip.compress(b'{"records": [' + b' ' * 100000 + b']}')
+    assert len(bomb) < 4096
+    assert post(ingest, bomb, gzipped=True)[0] == 413
+    assert post(ingest, gzip.compress(b'{"records": []}')[:-8], gzipped=True)[0] == 400
+    assert ingest.spool.pending == 0
+    assert ingest.stats['rejected'] == 3
+
+
+class CloudAPI:
+    """Cloud stand-in: rejects batches holding a poisoned record, can fail transiently"""
+
+    def __init__(self, transient=0):
+        self.accepted = []
+        self.calls = 0
+        self.transient = transient
+        self.bytes_sent = 0
+        self.delay = 0
+
+    def seconds_until_allowed(self):
+        return 0
+
+    def send_attendance(self, batch, compress=False):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.transient:
+            self.transient -= 1
+            return {'success': False, 'status': 503, 'error': 'busy'}
+        if any(record['employee_id'] == 'poison' for record in batch):
+            return {'success': False, 'status': 422, 'error': 'unknown employee'}
+        self.accepted.extend(batch)
+        return {'success': True, 'synced': len(batch)}
+
+
+def run_uplink(api, spool, tmp_path, until):
+    uplink = agent.AggregatorUplink(api, spool, None, agent.SyncEventBus())
+    uplink.dead_letter_path = str(tmp_path / 'dead_letter.jsonl')
+    thread = threading.Thread(target=uplink.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not until() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    uplink.stop()
+    thread.join(5)
+    return uplink
+
+
+def test_rejected_request_is_dead_lettered_and_spool_moves_on(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, 'AGGREGATOR_FLUSH_SECONDS', 0)
+    spool = agent.IngestSpool(str(tmp_path / 'spool'))
+    spool.append(records(1, 3))
+    spool.append(records(2, 2) + records(2, 1, employee_id='poison'))
+    spool.append(records(3, 4))
+    api = CloudAPI()
+    uplink = run_uplink(api, spool, tmp_path, lambda: spool.pending == 0)
+
+    assert spool.pending == 0
+    assert sorted({record['device_id'] for record in api.accepted}) == [1, 3]
+    assert len(api.accepted) == 7
+    (line,) = (tmp_path / 'dead_letter.jsonl').read_text().splitlines()
+    dead = json.loads(line)
+    assert dead['status'] == 422 and len(dead['records']) == 3
+    assert uplink.stats['dead_lettered'] == 3
+
+
+def test_server_errors_are_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, 'AGGREGATOR_FLUSH_SECONDS', 0)
+    monkeypatch.setattr(agent, 'AGGREGATOR_RETRY_SECONDS', (0.01,))
+    spool = agent.IngestSpool(str(tmp_path / 'spool'))
+    spool.append(records(1, 3))
+    api = CloudAPI(transient=2)
+    uplink = run_uplink(api, spool, tmp_path, lambda: spool.pending == 0)
+    assert len(api.accepted) == 3 and api.calls == 3
+    assert uplink.stats['failures'] == 2
+    assert not (tmp_path / 'dead_letter.jsonl').exists()
+
+
+def test_stop_does_not_wait_for_a_slow_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, 'AGGREGATOR_FLUSH_SECONDS', 0)
+    spool = agent.IngestSpool(str(tmp_path / 'spool'))
+    spool.append(records(1, 3))
+    api = CloudAPI()
+    api.delay = 30
+    started = time.monotonic()
+    run_uplink(api, spool, tmp_path, lambda: api.calls)
+    assert time.monotonic() - started < 5
+    assert spool.pending == 3  # Not committed: sent again next time
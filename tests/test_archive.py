@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import attendux_sync_agent as agent
+from conftest import FakeAPI
+
+
+DEVICE = {'id': 4, 'name': 'Gate'}
+DAY = datetime(2026, 5, 4, 8, 0)
+
+
+def punch(user_id, moment, status=1):
+    return agent.Punch(str(user_id), moment, status, 0)
+
+
+def archive_read(archive, punches, device=DEVICE):
+    """One full pass over a device log holding punches; returns those written"""
+    read = {}
+    written = archive.append(device, punches, 0, read)
+    archive.commit(device, read)
+    return written
+
+
+def test_append_commit_and_query(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    punches = [punch(index % 3 + 1, DAY + timedelta(minutes=index)) for index in range(10)]
+    punches.append(punch(1, DAY + timedelta(days=1)))
+    assert archive_read(archive, punches) == punches
+
+    found = list(archive.query(DAY, DAY + timedelta(days=2)))
+    assert sorted(p for _key, p in found) == sorted(punches)
+    assert {key for key, _p in found} == {'4'}
+    assert [p for _key, p in archive.query(DAY, DAY + timedelta(days=1), employee_id='2')] == [
+        p for p in punches[:10] if p.user_id == '2'
+    ]
+    assert archive.count(DAY, DAY + timedelta(days=1)) == 11
+    records = list(archive.records(DAY, DAY + timedelta(hours=1), employee_id='1'))
+    assert records[0] == {
+        'employee_id': '1', 'timestamp': DAY.isoformat(), 'device_id': 4, 'type': 'auto', 'status': 1
+    }
+
+
+def test_committed_punches_are_archived_once(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    punches = [punch(1, DAY + timedelta(minutes=index)) for index in range(5)]
+    archive_read(archive, punches)
+
+    # The whole log is read again next cycle, plus one new punch
+    reopened = agent.PunchArchive(str(tmp_path))
+    newer = punch(2, DAY + timedelta(hours=1))
+    assert archive_read(reopened, punches + [newer]) == [newer]
+    assert len(list(reopened.query(DAY, DAY + timedelta(days=1)))) == 6
+
+
+def test_back_dated_punch_is_archived(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    punches = [punch(1, DAY + timedelta(hours=1)), punch(1, DAY + timedelta(hours=2))]
+    archive_read(archive, punches)
+
+    # Clock corrected backwards: the next punch is older than everything archived
+    earlier = punch(2, DAY)
+    assert archive_read(archive, punches + [earlier]) == [earlier]
+    assert [p for _key, p in archive.query(DAY, DAY + timedelta(days=1), employee_id='2')] == [earlier]
+    assert len(list(archive.records(DAY, DAY + timedelta(days=1)))) == 3
+
+
+def test_position_is_kept_across_batches(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    punches = [punch(1, DAY + timedelta(minutes=index)) for index in range(10)]
+    archive_read(archive, punches[:6])
+    read = {}
+    assert archive.append(DEVICE, punches[:4], 0, read) == []
+    assert archive.append(DEVICE, punches[4:8], 4, read) == punches[6:8]
+    assert archive.append(DEVICE, punches[8:], 8, read) == punches[8:]
+    archive.commit(DEVICE, read)
+    assert archive.state['4']['log_count'] == 10
+
+
+def test_cleared_or_rewritten_log_is_archived_again(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    archive_read(archive, [punch(1, DAY + timedelta(minutes=index)) for index in range(5)])
+
+    # Cleared on the clock: a shorter log is archived from its first record
+    cleared = [punch(2, DAY + timedelta(hours=3))]
+    read = {}
+    assert archive.append(DEVICE, cleared, 0, read, log_records=1) == cleared
+    archive.commit(DEVICE, read)
+    assert archive.state['4']['log_count'] == 1
+
+    # Cleared and refilled past the old position: the fingerprint tells it apart
+    refilled = [punch(3, DAY + timedelta(hours=4, minutes=index)) for index in range(3)]
+    read = {}
+    assert archive.append(DEVICE, refilled, 0, read, log_records=3) == refilled
+    archive.commit(DEVICE, read)
+    assert len(list(archive.query(DAY, DAY + timedelta(days=1)))) == 9
+
+
+def test_rewrite_found_in_a_later_batch_rearchives_next_pass(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    old = [punch(1, DAY + timedelta(minutes=index)) for index in range(6)]
+    archive_read(archive, old)
+
+    new = old[:4] + [punch(5, DAY + timedelta(hours=5, minutes=index)) for index in range(4)]
+    read = {}
+    assert archive.append(DEVICE, new[:4], 0, read) == []
+    assert archive.append(DEVICE, new[4:], 4, read) == new[4:]
+    archive.commit(DEVICE, read)
+    assert archive.state['4']['log_count'] == 0
+    assert archive_read(archive, new) == new
+    assert len(list(archive.query(DAY, DAY + timedelta(days=1)))) == 10
+
+
+def test_index_drops_rewritten_duplicates(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    punches = [punch(1, DAY + timedelta(minutes=index)) for index in range(5)]
+    archive.append(DEVICE, punches, 0, {})
+    # Crash before commit: the same punches are appended again next run
+    agent.PunchArchive(str(tmp_path)).append(DEVICE, punches, 0, {})
+    assert len(list(archive.query(DAY, DAY + timedelta(days=1)))) == 5
+
+
+def test_index_that_cannot_be_replaced_is_used_stale(tmp_path, monkeypatch):
+    archive = agent.PunchArchive(str(tmp_path))
+    archive_read(archive, [punch(1, DAY)])
+    assert archive.count(DAY, DAY + timedelta(days=1)) == 1
+    archive_read(archive, [punch(1, DAY), punch(2, DAY + timedelta(minutes=1))])
+
+    def mapped_elsewhere(source, target):
+        raise PermissionError(13, "The process cannot access the file", target)
+
+    monkeypatch.setattr(agent.os, 'replace', mapped_elsewhere)
+    assert archive.count(DAY, DAY + timedelta(days=1)) == 1
+    assert [name for name in (tmp_path / '4').iterdir() if name.suffix == '.tmp'] == []
+    monkeypatch.undo()
+    assert archive.count(DAY, DAY + timedelta(days=1)) == 2
+
+
+def test_punches_that_do_not_fit_are_rejected(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    good = punch(1, DAY)
+    unset_clock = punch(2, datetime(1999, 12, 31, 23, 0))
+    long_id = punch('x' * 25, DAY + timedelta(minutes=1))
+    assert archive_read(archive, [unset_clock, good, long_id]) == [good]
+    assert archive.rejected == {'4': 2}
+    assert [p for _key, p in archive.query(datetime(1999, 1, 1), DAY + timedelta(days=1))] == [good]
+
+
+def test_import_with_unfit_rows_still_uploads(tmp_path):
+    path = tmp_path / 'attlog.dat'
+    path.write_text(
+        f"1\t{DAY:%Y-%m-%d %H:%M:%S}\t1\t0\t0\t0\n"
+        "2\t1999-12-31 23:00:00\t1\t0\t0\t0\n"
+        f"{'9' * 30}\t{DAY:%Y-%m-%d %H:%M:%S}\t1\t0\t0\t0\n"
+    )
+    api = FakeAPI()
+    archive = agent.PunchArchive(str(tmp_path / 'archive'))
+    stats = agent.import_attlog(
+        api, str(path), DEVICE, agent.SyncCheckpoint(str(tmp_path / 'cp.json')), archive, log=lambda text: None
+    )
+    assert len(api.sent) == 3
+    assert stats['not_archived'] == 2
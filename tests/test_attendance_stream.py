@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import attendux_sync_agent as agent
+from conftest import encode_zk_time
+
+
+@pytest.mark.parametrize('moment', [
+    datetime(2000, 1, 1), datetime(2026, 2, 28, 23, 59, 59), datetime(2031, 12, 31, 12, 30, 5),
+])
+def test_decode_zk_time_matches_pyzk(moment):
+    conn = agent.ZK('127.0.0.1')
+    packed = encode_zk_time(moment).to_bytes(4, 'little')
+    assert agent.decode_zk_time(encode_zk_time(moment)) == conn._ZK__decode_time(packed) == moment
+
+
+@pytest.mark.parametrize('record_size', [8, 16, 40])
+@pytest.mark.parametrize('batch_size', [1, 7, 5000])
+def test_stream_matches_get_attendance(clock, record_size, batch_size):
+    clock.record_size = record_size
+    clock.punches = [(index % 9 + 1, datetime(2026, 1, 1) + timedelta(minutes=7 * index)) for index in range(250)]
+    device = clock.device()
+
+    conn = agent.ZK(device['ip'], port=device['port']).connect()
+    expected = [
+        agent.Punch(str(att.user_id), att.timestamp, att.status, att.punch) for att in conn.get_attendance()
+    ]
+    info = {}
+    streamed = [punch for batch in agent.iter_attendance_batches(conn, batch_size, info) for punch in batch]
+    conn.disconnect()
+
+    assert streamed == expected
+    assert len(streamed) == 250
+    assert info == {'records': 250, 'record_size': record_size}
+
+
+def test_stream_of_empty_log(clock):
+    device = clock.device()
+    conn = agent.ZK(device['ip'], port=device['port']).connect()
+    assert list(agent.iter_attendance_batches(conn)) == []
+    conn.disconnect()
@@ -0,0 +1,143 @@
+import threading
+from datetime import datetime, timedelta
+
+import attendux_sync_agent as agent
+from conftest import FakeAPI
+
+
+def recent_punches(hours, per_hour=20):
+    start = datetime.now().replace(second=0, microsecond=0) - timedelta(hours=hours)
+    return [(index % 7 + 1, start + timedelta(minutes=60 / per_hour * index)) for index in range(hours * per_hour)]
+
+
+class Lane:
+    """SyncWorker dependencies for the backfill split, in a temp directory"""
+
+    def __init__(self, tmp_path):
+        self.checkpoint = agent.SyncCheckpoint(str(tmp_path / 'checkpoint.json'))
+        self.archive = agent.PunchArchive(str(tmp_path / 'archive'))
+        self.queue = agent.BackfillQueue(str(tmp_path / 'backfill.json'))
+        self.health = agent.DeviceHealth(str(tmp_path / 'health.json'))
+
+    def kwargs(self):
+        return {'archive': self.archive, 'backfill': self.queue, 'health': self.health}
+
+
+def test_device_behind_splits_without_gap(clock, run_cycle, tmp_path):
+    clock.punches = recent_punches(50)
+    lane = Lane(tmp_path)
+    api = FakeAPI()
+    _result, logs = run_cycle(api, [clock.device()], lane.checkpoint, **lane.kwargs())
+
+    cutoff = datetime.now() - timedelta(hours=agent.BACKFILL_AFTER_HOURS)
+    assert api.sent and all(datetime.fromisoformat(r['timestamp']) >= cutoff - timedelta(minutes=1) for r in api.sent)
+    (_key, job), = lane.queue.pending()
+    assert job['start'] == clock.punches[0][1].isoformat()
+    assert any('go to the backfill lane' in line for line in logs)
+    assert lane.checkpoint.position(clock.device())[0] == len(clock.punches)
+
+    realtime = len(api.sent)
+    worker = agent.BackfillWorker(api, lane.queue, lane.archive, agent.SyncEventBus(), threading.Event())
+    worker.run()
+    assert lane.queue.pending() == []
+    uploaded = {(r['employee_id'], r['timestamp']) for r in api.sent}
+    assert uploaded == {(str(user_id), moment.isoformat()) for user_id, moment in clock.punches}
+    assert worker.sent == len(api.sent) - realtime
+
+
+def test_idle_device_read_cleanly_is_not_behind(clock, run_cycle, tmp_path):
+    clock.punches = recent_punches(50)
+    lane = Lane(tmp_path)
+    api = FakeAPI()
+    run_cycle(api, [clock.device()], lane.checkpoint, **lane.kwargs())
+    job = lane.queue.pending()
+
+    # A weekend without punches: nothing new, nothing re-queued, no "behind" line
+    _result, logs = run_cycle(api, [clock.device()], lane.checkpoint, **lane.kwargs())
+    assert lane.queue.pending() == job
+    assert not any('backfill' in line for line in logs)
+
+    # An old back-dated punch on a device read cleanly is uploaded now
+    clock.punches.append((9, datetime.now() - timedelta(days=5)))
+    api.sent.clear()
+    run_cycle(api, [clock.device()], lane.checkpoint, **lane.kwargs())
+    assert [r['employee_id'] for r in api.sent] == ['9']
+
+
+def test_failed_archive_uploads_everything(clock, run_cycle, tmp_path):
+    clock.punches = recent_punches(50)
+    lane = Lane(tmp_path)
+
+    def full_disk(device, punches, start, read, log_records=None):
+        raise OSError(28, "No space left on device")
+
+    lane.archive.append = full_disk
+    api = FakeAPI()
+    _result, logs = run_cycle(api, [clock.device()], lane.checkpoint, **lane.kwargs())
+    assert len(api.sent) == len(clock.punches)
+    assert lane.queue.pending() == []
+    assert any('archive disabled' in line for line in logs)
+
+
+def test_archive_days(tmp_path):
+    archive = agent.PunchArchive(str(tmp_path))
+    day = datetime(2026, 4, 10, 9, 0)
+    for device_id in (1, 2):
+        archive.append({'id': device_id, 'name': str(device_id)}, [
+            agent.Punch('1', day + timedelta(days=offset), 1, 0) for offset in range(3)
+        ], 0, {})
+    assert archive.days(day, day + timedelta(days=1), ['2']) == [('2', '2026-04-10'), ('2', '2026-04-11')]
+    assert len(archive.days(day - timedelta(days=9), day + timedelta(days=9))) == 6
+
+
+class FlakyAPI(FakeAPI):
+    """Fails the first `failures` uploads"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.attempts = 0
+
+    def send_attendance(self, records, compress=False):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            return {'success': False, 'status': 502, 'error': 'bad gateway'}
+        return super().send_attendance(records, compress)
+
+
+def run_lane(qapp, tmp_path, api):
+    """One BackfillWorker run over a queued day of punches; returns (queue, log lines)"""
+    device = {'id': 5, 'name': 'Yard'}
+    day = datetime(2026, 2, 3, 8, 0)
+    archive = agent.PunchArchive(str(tmp_path / 'archive'))
+    read = {}
+    archive.append(device, [agent.Punch(str(index), day + timedelta(minutes=index), 1, 0) for index in range(30)], 0, read)
+    archive.commit(device, read)
+    queue = agent.BackfillQueue(str(tmp_path / 'backfill.json'))
+    queue.add(device, day, day + timedelta(days=1))
+
+    events = agent.SyncEventBus()
+    logs = []
+    events.snapshot_ready.connect(lambda snapshot: logs.extend(text for text, _level in snapshot['logs']))
+    agent.BackfillWorker(api, queue, archive, events, threading.Event()).run()
+    events.flush()
+    return queue, logs
+
+
+def test_failed_chunk_is_retried(qapp, tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, 'BACKFILL_RETRY_SECONDS', (0.01, 0.01, 0.01))
+    api = FlakyAPI(failures=2)
+    queue, logs = run_lane(qapp, tmp_path, api)
+    assert len(api.sent) == 30
+    assert queue.pending() == []
+    assert sum('retrying' in line for line in logs) == 2
+
+
+def test_lane_stops_after_the_last_retry(qapp, tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, 'BACKFILL_RETRY_SECONDS', (0.01, 0.01))
+    api = FlakyAPI(failures=99)
+    queue, logs = run_lane(qapp, tmp_path, api)
+    assert api.attempts == 3
+    (_key, job), = queue.pending()
+    assert job['cursor'] == datetime(2026, 2, 3, 8, 0).isoformat()
+    assert any('Backfill stopped' in line and 'failed 3 times' in line for line in logs)
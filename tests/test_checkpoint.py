@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import attendux_sync_agent as agent
+from conftest import FakeAPI
+
+
+START = datetime(2026, 3, 1, 8, 0)
+
+
+def punches(count, start=START):
+    return [(index % 5 + 1, start + timedelta(minutes=index)) for index in range(count)]
+
+
+def test_second_cycle_sends_only_new_records(clock, run_cycle, tmp_file):
+    clock.punches = punches(30)
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    api = FakeAPI()
+    run_cycle(api, [clock.device()], checkpoint)
+    assert len(api.sent) == 30
+    assert checkpoint.position(clock.device())[0] == 30
+
+    clock.punches += punches(5, START + timedelta(hours=2))
+    api.sent.clear()
+    run_cycle(api, [clock.device()], checkpoint)
+    assert len(api.sent) == 5
+
+
+def test_back_dated_punch_is_uploaded(clock, run_cycle, tmp_file):
+    clock.punches = punches(30)
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    api = FakeAPI()
+    run_cycle(api, [clock.device()], checkpoint)
+
+    # Clock corrected backwards: the next punch is older than everything uploaded
+    clock.punches.append((9, START - timedelta(hours=1)))
+    api.sent.clear()
+    run_cycle(api, [clock.device()], checkpoint)
+    assert [record['employee_id'] for record in api.sent] == ['9']
+
+
+def test_cleared_log_is_sent_again(clock, run_cycle, tmp_file):
+    clock.punches = punches(30)
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    api = FakeAPI()
+    run_cycle(api, [clock.device()], checkpoint)
+
+    clock.punches = punches(10, START + timedelta(days=1))
+    api.sent.clear()
+    _result, logs = run_cycle(api, [clock.device()], checkpoint)
+    assert len(api.sent) == 10
+    assert any('was cleared' in line for line in logs)
+    assert checkpoint.position(clock.device())[0] == 10
+
+
+def test_rewritten_log_is_sent_in_full_next_cycle(clock, run_cycle, tmp_file):
+    clock.punches = punches(30)
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    api = FakeAPI()
+    run_cycle(api, [clock.device()], checkpoint)
+
+    # Cleared and refilled past the old length: only the fingerprint tells
+    clock.punches = punches(40, START + timedelta(days=1))
+    api.sent.clear()
+    _result, logs = run_cycle(api, [clock.device()], checkpoint)
+    assert any('was rewritten' in line for line in logs)
+    assert checkpoint.position(clock.device())[0] == 0
+
+    api.sent.clear()
+    run_cycle(api, [clock.device()], checkpoint)
+    assert len(api.sent) == 40
+    assert checkpoint.position(clock.device())[0] == 40
+
+
+def test_failed_upload_does_not_advance(clock, run_cycle, tmp_file):
+    clock.punches = punches(30)
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    api = FakeAPI()
+    api.send_attendance = lambda records, compress=False: None
+    run_cycle(api, [clock.device()], checkpoint)
+    assert checkpoint.position(clock.device()) == (0, None)
+
+
+def test_upload_positions_wait_for_earlier_records():
+    device = {'id': 1, 'name': 'Clock'}
+    positions = agent.UploadPositions()
+    positions.add(device, 3, (10, 'a'))
+    positions.add(device, 0, (20, 'b'))
+    positions.add(device, 2, (30, 'c'))
+    assert positions.uploaded(device, 0) is None
+    assert positions.uploaded(device, 2) is None
+    assert positions.uploaded(device, 2) == (20, 'b')
+    assert positions.uploaded(device, 1) == (30, 'c')
+    positions.fail(device)
+    positions.add(device, 1, (40, 'd'))
+    assert positions.uploaded(device, 1) is None
+
+
+def test_import_resumes_by_row(tmp_file):
+    path = tmp_file('attlog.dat')
+    rows = punches(20)
+    with open(path, 'w') as f:
+        f.writelines(f"{user_id}\t{moment:%Y-%m-%d %H:%M:%S}\t1\t0\t0\t0\n" for user_id, moment in rows)
+    device = {'id': 7, 'name': 'USB 7'}
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    api = FakeAPI()
+    agent.import_attlog(api, path, device, checkpoint, log=lambda text: None)
+    assert len(api.sent) == 20
+
+    with open(path, 'a') as f:
+        f.write(f"3\t{START - timedelta(days=1):%Y-%m-%d %H:%M:%S}\t1\t0\t0\t0\n")
+    api.sent.clear()
+    stats = agent.import_attlog(api, path, device, checkpoint, log=lambda text: None)
+    assert stats['already_synced'] == 20
+    assert [record['employee_id'] for record in api.sent] == ['3']
@@ -0,0 +1,89 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import attendux_sync_agent as agent
+
+
+def test_history_report(capsys):
+    assert agent.run_history_report(['agent', '--history', '3']) == 0
+    assert json.loads(capsys.readouterr().out)['days'] == 3
+
+
+@pytest.mark.parametrize('args', [['x'], ['0'], ['1', '2']])
+def test_history_rejects_bad_arguments(capsys, args):
+    with pytest.raises(SystemExit) as exit_info:
+        agent.run_history_report(['agent', '--history'] + args)
+    assert exit_info.value.code == 2
+    assert 'usage: attendux_sync_agent --history' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('args', [[], ['capture.json', '--speed', 'fast'], ['capture.json', '--speed', '-1']])
+def test_replay_rejects_bad_arguments(capsys, args):
+    with pytest.raises(SystemExit) as exit_info:
+        agent.run_replay(['agent', '--replay'] + args)
+    assert exit_info.value.code == 2
+    assert 'usage: attendux_sync_agent --replay' in capsys.readouterr().err
+
+
+def test_replay_reports_an_unreadable_capture(capsys, tmp_path):
+    if not agent.ZK_AVAILABLE:
+        pytest.skip("pyzk is not installed")
+    path = tmp_path / 'capture.json'
+    path.write_text('{"version": 0}')
+    assert agent.run_replay(['agent', '--replay', str(path), '--speed', '0']) == 1
+    assert 'Unsupported capture version' in capsys.readouterr().out
+    assert agent.run_replay(['agent', '--replay', str(tmp_path / 'missing.json')]) == 1
+
+
+@pytest.mark.parametrize('args', [
+    [], ['2026-05-01'], ['2026-13-01', '2026-05-02'], ['2026-05-01', 'tomorrow'],
+    ['2026-05-01T08:00+03:00', '2026-05-02'], ['2026-05-02', '2026-05-01'],
+])
+def test_archive_query_rejects_bad_arguments(capsys, args):
+    with pytest.raises(SystemExit) as exit_info:
+        agent.run_archive_command(['agent', '--archive-query'] + args)
+    assert exit_info.value.code == 2
+    assert 'usage: attendux_sync_agent --archive-query' in capsys.readouterr().err
+
+
+def test_archive_query_prints_punches(capsys):
+    archive = agent.PunchArchive()  # Under the test run's temporary HOME
+    read = {}
+    moment = datetime(2026, 5, 1, 8, 30)
+    archive.append({'id': 3, 'name': 'Gate'}, [agent.Punch('12', moment, 1, 0), agent.Punch('13', moment, 1, 0)], 0, read)
+    archive.commit({'id': 3, 'name': 'Gate'}, read)
+
+    assert agent.run_archive_command(['agent', '--archive-query', '2026-05-01', '2026-05-02', '13']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)['employee_id'] for line in lines] == ['13']
+
+
+@pytest.mark.parametrize('args', [['many'], ['0'], ['10', '20']])
+def test_wire_benchmark_rejects_bad_arguments(capsys, args):
+    with pytest.raises(SystemExit) as exit_info:
+        agent.run_wire_benchmark(['agent', '--wire-benchmark'] + args)
+    assert exit_info.value.code == 2
+    assert 'usage: attendux_sync_agent --wire-benchmark' in capsys.readouterr().err
+
+
+def test_wire_benchmark(capsys):
+    assert agent.run_wire_benchmark(['agent', '--wire-benchmark', '50']) == 0
+    assert capsys.readouterr().out.startswith('50 records')
+
+
+@pytest.mark.parametrize('args', [[], ['attlog.dat']])
+def test_import_requires_file_and_device(capsys, args):
+    with pytest.raises(SystemExit) as exit_info:
+        agent.run_import_command(['agent', '--import-attlog'] + args)
+    assert exit_info.value.code == 2
+    assert 'usage: attendux_sync_agent --import-attlog' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('args', [['soon'], ['0'], ['-5']])
+def test_peers_rejects_bad_arguments(capsys, args):
+    with pytest.raises(SystemExit) as exit_info:
+        agent.run_peer_status(['agent', '--peers'] + args)
+    assert exit_info.value.code == 2
+    assert 'usage: attendux_sync_agent --peers' in capsys.readouterr().err
@@ -0,0 +1,98 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import attendux_sync_agent as agent
+
+
+NOW = datetime(2026, 6, 1, 12, 0, 7).timestamp()
+INTERVAL = 15 * 60
+
+
+def api(suggested_next_sync=None, not_before=0):
+    return SimpleNamespace(suggested_next_sync=suggested_next_sync, not_before=not_before)
+
+
+@pytest.fixture
+def pacer():
+    return agent.SyncPacer('LICENSE-1')
+
+
+def test_phase_is_fixed_per_agent_and_differs_between_agents(pacer):
+    assert agent.SyncPacer('LICENSE-1').phase_fraction == pacer.phase_fraction
+    assert agent.SyncPacer('LICENSE-2').phase_fraction != pacer.phase_fraction
+    assert 0 <= pacer.phase_fraction < 1
+
+
+def test_next_sync_is_the_next_slot_on_the_agents_grid(pacer):
+    next_at = pacer.next_sync_at(INTERVAL, now=NOW)
+    phase = pacer.phase_fraction * INTERVAL
+    assert NOW < next_at <= NOW + INTERVAL
+    assert (next_at - phase) % INTERVAL == pytest.approx(0, abs=1e-6)
+
+
+def test_missed_slots_collapse_into_the_next_one(pacer):
+    # A laptop lid closed for three hours still gets a single slot, within one interval
+    next_at = pacer.next_sync_at(INTERVAL, last_started=NOW - 3 * 3600, now=NOW)
+    assert NOW < next_at <= NOW + INTERVAL
+
+
+def test_slot_right_after_a_manual_sync_is_skipped(pacer):
+    slot = pacer.next_sync_at(INTERVAL, now=NOW)
+    assert pacer.next_sync_at(INTERVAL, last_started=slot - 10, now=NOW) == pytest.approx(slot + INTERVAL)
+    assert pacer.next_sync_at(INTERVAL, last_started=slot - 2 * agent.MIN_SYNC_GAP_SECONDS, now=NOW) == slot
+
+
+def test_first_sync_lands_in_the_startup_spread(pacer):
+    first = pacer.first_sync_at(INTERVAL, now=NOW)
+    assert first == pytest.approx(NOW + pacer.phase_fraction * agent.STARTUP_SYNC_SPREAD_SECONDS)
+    # A short interval caps the spread
+    assert pacer.first_sync_at(60, now=NOW) <= NOW + 60
+
+
+def test_server_suggestion_delays_the_slot(pacer):
+    hinted = NOW + 2 * INTERVAL + 5
+    assert pacer.next_sync_at(INTERVAL, api(suggested_next_sync=hinted), now=NOW) == hinted
+    assert pacer.first_sync_at(INTERVAL, api(suggested_next_sync=hinted), now=NOW) == hinted
+    # A suggestion in the past, or earlier than the slot, changes nothing
+    slot = pacer.next_sync_at(INTERVAL, now=NOW)
+    assert pacer.next_sync_at(INTERVAL, api(suggested_next_sync=NOW - 5), now=NOW) == slot
+    assert pacer.next_sync_at(INTERVAL, api(suggested_next_sync=NOW + 1), now=NOW) == slot
+
+
+def test_retry_after_is_spread_per_agent(pacer):
+    not_before = NOW + 3 * INTERVAL
+    next_at = pacer.next_sync_at(INTERVAL, api(not_before=not_before), now=NOW)
+    assert next_at == pytest.approx(not_before + pacer.phase_fraction * agent.SERVER_HINT_SPREAD_SECONDS)
+    other = agent.SyncPacer('LICENSE-2').next_sync_at(INTERVAL, api(not_before=not_before), now=NOW)
+    assert other != next_at
+
+
+def test_record_fire_counts_skipped_slots(pacer):
+    assert pacer.record_fire(NOW, INTERVAL, now=NOW + 30) == 0
+    assert pacer.record_fire(NOW, INTERVAL, now=NOW + 2.5 * INTERVAL) == 2
+    assert pacer.record_fire(NOW, INTERVAL, now=NOW + INTERVAL) == 1
+    assert pacer.coalesced_ticks == 3
+    # Nothing scheduled, or a timer that fired early
+    assert pacer.record_fire(None, INTERVAL, now=NOW) == 0
+    assert pacer.record_fire(NOW, INTERVAL, now=NOW - 60) == 0
+    assert pacer.coalesced_ticks == 3
+
+
+def test_slot_reached_while_a_sync_runs_still_rearms_the_timer(pacer):
+    armed = []
+    started = []
+    agent_window = SimpleNamespace(
+        interval_spinbox=SimpleNamespace(value=lambda: 15),
+        sync_pacer=pacer,
+        next_sync_at=None,
+        log=lambda *args: None,
+        sync_worker_busy=lambda: True,
+        start_sync=lambda: started.append(True),
+        schedule_next_sync=lambda: armed.append(True),
+    )
+    agent.AttenduxSyncAgent.on_sync_timer(agent_window)
+    assert armed == [True]
+    assert started == []
+    assert pacer.coalesced_ticks == 1
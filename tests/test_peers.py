@@ -0,0 +1,96 @@
+import json
+import time
+
+import pytest
+
+import attendux_sync_agent as agent
+
+
+DEVICES = [{'id': index, 'name': f"Clock {index}"} for index in range(40)]
+
+
+@pytest.fixture
+def group(qapp):
+    """Three agents of one license that know each other, without sockets"""
+    def make(license_key='LICENSE-1'):
+        return agent.PeerGroup(license_key)
+    groups = [make(), make(), make()]
+    for receiver in groups:
+        for sender in groups:
+            receiver._receive(sender._datagram('heartbeat'), '10.0.0.1')
+    return groups
+
+
+def test_every_device_has_exactly_one_owner(group):
+    shares = [{agent.device_key(device) for device in g.assign(DEVICES)[0]} for g in group]
+    assert set.union(*shares) == {agent.device_key(device) for device in DEVICES}
+    assert sum(len(share) for share in shares) == len(DEVICES)
+    assert all(share for share in shares)
+
+
+def test_devices_of_a_departed_agent_move(group):
+    first, second, third = group
+    before = {agent.device_key(device) for device in second.assign(DEVICES)[0]}
+    assert first._receive(third._datagram('bye'), '10.0.0.3')
+    assert second._receive(third._datagram('bye'), '10.0.0.3')
+    after = [{agent.device_key(device) for device in g.assign(DEVICES)[0]} for g in (first, second)]
+    assert before <= after[1]
+    assert len(after[0]) + len(after[1]) == len(DEVICES)
+
+
+def test_other_license_and_forgery_are_ignored(group, qapp):
+    first = group[0]
+    stranger = agent.PeerGroup('LICENSE-2')
+    assert not first._receive(stranger._datagram('heartbeat'), '10.0.0.9')
+    envelope = json.loads(group[1]._datagram('bye'))
+    envelope['msg'] = envelope['msg'].replace('"bye"', '"heartbeat"')
+    assert not first._receive(json.dumps(envelope).encode(), '10.0.0.9')
+    assert len(first.peers) == 2
+
+
+def test_replayed_and_stale_messages_are_dropped(group, monkeypatch):
+    first, second, _third = group
+    recorded_bye = second._datagram('bye')
+    first._receive(second._datagram('heartbeat'), '10.0.0.2')
+    # The bye was captured before the latest heartbeat: a replay
+    assert not first._receive(recorded_bye, '10.0.0.2')
+    assert second.node_id in first.peers
+
+    stale = second._datagram('bye')
+    monkeypatch.setattr(agent.time, 'time', lambda real=time.time: real() + agent.PEER_MESSAGE_MAX_AGE_SECONDS + 5)
+    assert not first._receive(stale, '10.0.0.2')
+    assert second.node_id in first.peers
+
+
+def test_unreachable_device_is_left_to_peers(group):
+    first, second, third = group
+    device = first.assign(DEVICES)[0][0]
+    key = agent.device_key(device)
+    failed = [{'key': key, 'name': device['name'], 'error': 'timed out', 'read_failed': True}]
+    assert first.record_results(failed) == []
+    assert first.record_results(failed) == []
+    assert first.record_results(failed) == [key]
+    assert device not in first.assign(DEVICES)[0]
+
+    # Peers learn it from the next heartbeat and one of them takes it
+    for peer in (second, third):
+        peer._receive(first._datagram('heartbeat'), '10.0.0.1')
+    owners = [g for g in (second, third) if device in g.assign(DEVICES)[0]]
+    assert len(owners) == 1
+
+
+def test_upload_errors_do_not_drop_a_device(group):
+    first = group[0]
+    device = first.assign(DEVICES)[0][0]
+    results = [{'key': agent.device_key(device), 'name': device['name'], 'error': 'Failed to sync'}]
+    for _ in range(agent.PEER_DROP_AFTER_FAILURES + 1):
+        assert first.record_results(results) == []
+    assert device in first.assign(DEVICES)[0]
+
+
+def test_alone_an_agent_keeps_its_devices(qapp):
+    alone = agent.PeerGroup('LICENSE-1')
+    failed = [{'key': '3', 'name': 'Clock 3', 'error': 'timed out', 'read_failed': True}]
+    for _ in range(agent.PEER_DROP_AFTER_FAILURES + 1):
+        assert alone.record_results(failed) == []
+    assert len(alone.assign(DEVICES)[0]) == len(DEVICES)
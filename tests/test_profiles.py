@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+import attendux_sync_agent as agent
+from conftest import FakeAPI
+
+
+DEVICE = {'id': 7, 'name': 'Gate', 'ip': '10.0.0.7', 'port': 4370}
+
+
+class FakeConnection:
+    def get_firmware_version(self):
+        return 'Ver 6.60'
+
+    def get_serialnumber(self):
+        return 'SN-7'
+
+    def get_platform(self):
+        raise RuntimeError("not supported")  # Older firmware
+
+
+class FakeZK:
+    """pyzk ZK stand-in; connects only over the transports in working"""
+
+    def __init__(self, connects, working, options):
+        self.connects = connects
+        self.working = working
+        self.transport = 'udp' if options.get('force_udp') else 'tcp'
+        self.helper = self
+
+    def test_ping(self):
+        return False
+
+    def connect(self):
+        self.connects.append(self.transport)
+        if self.transport not in self.working:
+            raise ConnectionError(f"{self.transport} refused")
+        return FakeConnection()
+
+
+@pytest.fixture
+def zk(qapp):
+    """(worker factory, zk() calls, connect() transports); the device answers over UDP only"""
+    calls, connects = [], []
+
+    def factory(ip, port, timeout, **options):
+        calls.append(options)
+        return FakeZK(connects, {'udp'}, options)
+
+    def worker(profiles):
+        sync = agent.SyncWorker(FakeAPI(), [DEVICE], profiles=profiles)
+        sync.zk_factory = factory
+        return sync
+    return worker, calls, connects
+
+
+def test_profiles_persist_and_forget(tmp_file):
+    path = tmp_file('profiles.json')
+    profiles = agent.DeviceProfiles(path)
+    profiles.save(DEVICE, {'transport': 'udp', 'ping': False})
+    profiles.update(DEVICE, records=120, rec_cap=100000)
+    assert agent.DeviceProfiles(path).get(DEVICE) == {
+        'transport': 'udp', 'ping': False, 'records': 120, 'rec_cap': 100000
+    }
+
+    profiles.update({'id': 8, 'name': 'Unknown'}, records=5)  # No profile: nothing to refresh
+    profiles.forget(DEVICE)
+    assert agent.DeviceProfiles(path).devices == {}
+
+
+def test_damaged_profiles_file_starts_empty(tmp_file):
+    path = tmp_file('profiles.json')
+    with open(path, 'w') as f:
+        f.write('{"devices": {"7": ')
+    assert agent.DeviceProfiles(path).devices == {}
+    with open(path, 'w') as f:
+        json.dump(['not', 'an', 'object'], f)
+    assert agent.DeviceProfiles(path).devices == {}
+
+
+def test_first_connect_discovers_and_saves_the_transport(zk, tmp_file):
+    worker, _calls, connects = zk
+    profiles = agent.DeviceProfiles(tmp_file('profiles.json'))
+    worker(profiles)._connect(DEVICE)
+    assert connects == ['tcp', 'udp']
+    profile = profiles.get(DEVICE)
+    assert profile['transport'] == 'udp'
+    assert profile['ping'] is False
+    assert profile['firmware'] == 'Ver 6.60'
+    assert profile['platform'] is None
+
+
+def test_cached_profile_is_reused_without_ping_or_probing(zk, tmp_file):
+    worker, calls, connects = zk
+    profiles = agent.DeviceProfiles(tmp_file('profiles.json'))
+    profiles.save(DEVICE, {'transport': 'udp', 'ping': False})
+    worker(profiles)._connect(DEVICE)
+    assert connects == ['udp']
+    assert calls == [agent.DeviceProfiles.zk_options(DEVICE, {'transport': 'udp'})]
+    assert calls[0]['ommit_ping'] is True
+
+
+def test_failed_cached_profile_is_dropped_and_rediscovered(zk, tmp_file):
+    worker, _calls, connects = zk
+    profiles = agent.DeviceProfiles(tmp_file('profiles.json'))
+    profiles.save(DEVICE, {'transport': 'tcp', 'ping': True})
+    worker(profiles)._connect(DEVICE)
+    assert connects == ['tcp', 'tcp', 'udp']
+    assert profiles.get(DEVICE)['transport'] == 'udp'
+    assert agent.DeviceProfiles(tmp_file('profiles.json')).get(DEVICE)['transport'] == 'udp'
+
+
+def test_unreachable_device_keeps_no_profile(zk, tmp_file):
+    worker, _calls, _connects = zk
+    profiles = agent.DeviceProfiles(tmp_file('profiles.json'))
+    sync = worker(profiles)
+    sync.zk_factory = lambda ip, port, timeout, **options: FakeZK([], set(), options)
+    with pytest.raises(agent.DeviceUnreachable):
+        sync._connect(DEVICE)
+    assert profiles.get(DEVICE) is None
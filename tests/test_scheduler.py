@@ -0,0 +1,65 @@
+from datetime import datetime
+
+import pytest
+
+import attendux_sync_agent as agent
+
+
+NOW = datetime(2026, 6, 1, 12, 0).timestamp()
+
+
+def scheduler(runs, settings=None):
+    """SyncScheduler fed with (hours ago, [(key, records, error)]) runs"""
+    history = agent.SyncScheduler(settings)
+    for hours_ago, results in runs:
+        history.record({
+            'timestamp': datetime.fromtimestamp(NOW - hours_ago * 3600).isoformat(),
+            'device_results': [
+                {'name': f"Device {key}", 'key': key, 'records': records, 'error': error, 'fetch_seconds': 1.0}
+                for key, records, error in results
+            ],
+        })
+    return history
+
+
+def devices(*keys, **fields):
+    return [dict({'id': key, 'name': f"Device {key}"}, **fields) for key in keys]
+
+
+def test_busy_device_goes_first():
+    runs = [(hours, [('1', 1, None), ('2', 500, None), ('3', 20, None)]) for hours in range(24, 0, -1)]
+    plan = scheduler(runs).plan(devices('1', '2', '3'), now=NOW - 3600 + 600)
+    assert [device['id'] for device, _info in plan] == ['2', '3', '1']
+    assert not any(info['at_risk'] for _device, info in plan)
+
+
+def test_overdue_devices_run_earliest_deadline_first():
+    runs = [(hours, [('1', 500, None), ('2', 1, None)]) for hours in range(24, 1, -1)]
+    runs.append((1, [('1', 500, None), ('2', 1, 'timeout')]))  # 2 failed last hour
+    plan = scheduler(runs).plan(devices('1', '2', '3'), now=NOW)
+    # Earliest deadline first: 2 is 90 min late, 1 is 30 min late, 3 was never read (due now)
+    assert [device['id'] for device, _info in plan] == ['2', '1', '3']
+    assert [info['at_risk'] for _device, info in plan] == [True, True, True]
+
+
+def test_priority_setting_outranks_backlog():
+    runs = [(hours, [('1', 100, None), ('2', 10, None)]) for hours in range(24, 0, -1)]
+    plan = scheduler(runs, {'device_priority': {'2': 50}}).plan(devices('1', '2'), now=NOW - 3000)
+    assert [device['id'] for device, _info in plan] == ['2', '1']
+
+
+@pytest.mark.parametrize('freshness', ['soon', None, 0, -5, float('nan'), [1], '0.01'])
+def test_unusable_settings_do_not_break_the_plan(freshness):
+    runs = [(hours, [('1', 10, None)]) for hours in range(3, 0, -1)]
+    settings = {'device_freshness_minutes': {'1': freshness}, 'device_priority': {'1': 'high'}}
+    (device, info), = scheduler(runs, settings).plan(devices('1'), now=NOW)
+    assert info['priority'] == agent.DEVICE_PRIORITY_DEFAULT
+    # Deadline is the last clean read plus at least a minute
+    assert info['deadline'] - (NOW - 3600) >= agent.DEVICE_FRESHNESS_MIN_SECONDS
+
+
+def test_device_fields_are_used_when_no_override():
+    runs = [(hours, [('1', 10, None)]) for hours in range(3, 0, -1)]
+    (_device, info), = scheduler(runs).plan(devices('1', freshness_minutes='45', priority=2), now=NOW)
+    assert info['deadline'] == NOW - 3600 + 45 * 60
+    assert info['priority'] == 2.0
@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+
+import attendux_sync_agent as agent
+from conftest import FakeAPI
+
+
+DEVICE = {'id': 3, 'name': 'Gate'}
+
+
+class StuckWorker:
+    """SyncWorker stand-in that never finishes"""
+
+    def __init__(self, running_for):
+        self.started_at = time.monotonic() - running_for
+        self.stopped = False
+        self.sync_complete_signal = SimpleNamespace(disconnect=lambda: None)
+
+    def isRunning(self):
+        return True
+
+    def stop(self):
+        self.stopped = True
+
+
+def window(worker):
+    return SimpleNamespace(
+        sync_worker=worker, abandoned_workers=[], abandoned_worker_count=0,
+        realtime_busy=agent.threading.Event(), log=lambda *args: None,
+        sync_now_btn=SimpleNamespace(setEnabled=lambda enabled: None),
+    )
+
+
+def test_running_worker_keeps_the_agent_busy():
+    state = window(StuckWorker(running_for=60))
+    assert agent.AttenduxSyncAgent.sync_worker_busy(state) is True
+    assert state.abandoned_workers == []
+
+
+def test_stuck_worker_is_abandoned_and_kept_referenced():
+    worker = StuckWorker(running_for=agent.WORKER_ABANDON_SECONDS + 1)
+    state = window(worker)
+    assert agent.AttenduxSyncAgent.sync_worker_busy(state) is False
+    assert worker.stopped
+    assert state.abandoned_workers == [worker]
+    assert state.sync_worker is None
+    assert state.abandoned_worker_count == 1
+
+
+def test_late_progress_from_an_abandoned_worker_does_not_move_the_checkpoint_back(tmp_file):
+    # Both workers share the agent's checkpoint; the replacement got further first
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    checkpoint.advance(DEVICE, 30, '1|2026-05-01T09:00:00')
+    checkpoint.advance(DEVICE, 10, '1|2026-05-01T08:00:00')
+    assert checkpoint.position(DEVICE) == (30, '1|2026-05-01T09:00:00')
+    assert agent.SyncCheckpoint(tmp_file('checkpoint.json')).position(DEVICE)[0] == 30
+
+
+def test_quarantined_device_is_skipped_without_a_read(run_cycle, tmp_file):
+    health = agent.DeviceHealth(tmp_file('health.json'))
+    for _ in range(agent.QUARANTINE_AFTER_STALLS):
+        health.record_stall(DEVICE)
+    checkpoint = agent.SyncCheckpoint(tmp_file('checkpoint.json'))
+    result, logs = run_cycle(FakeAPI(), [DEVICE], checkpoint, health=health)
+    assert result['quarantined'] == ['Gate']
+    assert any('quarantined for' in line for line in logs)
+    assert checkpoint.position(DEVICE) == (0, None)
@@ -0,0 +1,136 @@
+import struct
+from datetime import datetime, timedelta
+
+import pytest
+
+import attendux_sync_agent as agent
+
+
+def unpack(data, offset=0):
+    """Reference MessagePack decoder for the types the agent sends; returns (value, offset)"""
+    marker = data[offset]
+    offset += 1
+    if marker < 0x80:
+        return marker, offset
+    if marker >= 0xe0:
+        return marker - 0x100, offset
+    if 0xa0 <= marker <= 0xbf:
+        size = marker & 0x1f
+        return data[offset:offset + size].decode('utf-8'), offset + size
+    if 0x90 <= marker <= 0x9f:
+        return unpack_items(data, offset, marker & 0x0f)
+    if 0x80 <= marker <= 0x8f:
+        return unpack_map(data, offset, marker & 0x0f)
+    if marker in (0xc0, 0xc2, 0xc3):
+        return {0xc0: None, 0xc2: False, 0xc3: True}[marker], offset
+    fixed = {
+        0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q', 0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q', 0xcb: '>d'
+    }
+    if marker in fixed:
+        return struct.unpack_from(fixed[marker], data, offset)[0], offset + struct.calcsize(fixed[marker])
+    sized = {0xd9: ('>B', 'str'), 0xda: ('>H', 'str'), 0xdb: ('>I', 'str'), 0xc4: ('>B', 'bin'),
+             0xc5: ('>H', 'bin'), 0xc6: ('>I', 'bin'), 0xdc: ('>H', 'array'), 0xdd: ('>I', 'array'),
+             0xde: ('>H', 'map'), 0xdf: ('>I', 'map')}
+    fmt, kind = sized[marker]
+    size = struct.unpack_from(fmt, data, offset)[0]
+    offset += struct.calcsize(fmt)
+    if kind == 'array':
+        return unpack_items(data, offset, size)
+    if kind == 'map':
+        return unpack_map(data, offset, size)
+    value = data[offset:offset + size]
+    return (value.decode('utf-8') if kind == 'str' else bytes(value)), offset + size
+
+
+def unpack_items(data, offset, size):
+    items = []
+    for _ in range(size):
+        item, offset = unpack(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def unpack_map(data, offset, size):
+    items, offset = unpack_items(data, offset, size * 2)
+    return dict(zip(items[::2], items[1::2])), offset
+
+
+def loads(data):
+    value, offset = unpack(data)
+    assert offset == len(data)
+    return value
+
+
+def expand(batch):
+    """Upload records back from compact_attendance_batch()'s columnar form"""
+    records = []
+    for group in batch['groups']:
+        seconds = 0
+        for index, delta in enumerate(group['ts']):
+            seconds = delta if index == 0 else seconds + delta
+            records.append({
+                'employee_id': str(group['employee_id'][index]),
+                'timestamp': (datetime(1970, 1, 1) + timedelta(seconds=seconds)).isoformat(),
+                'device_id': group['device_id'],
+                'type': group['type'],
+                'status': group['status'][index],
+            })
+    return records
+
+
+def sample_records():
+    start = datetime(2026, 3, 29, 1, 59, 30)
+    employee_ids = ['7', '0042', '1001', '٣', '18446744073709551616', '9223372036854775807', 'A-17', '']
+    return [
+        {
+            'employee_id': employee_ids[index % len(employee_ids)],
+            'timestamp': (start + timedelta(seconds=37 * index)).isoformat(),
+            'device_id': index % 3 + 1,
+            'type': 'auto',
+            'status': index % 5,
+        }
+        for index in range(200)
+    ]
+
+
+@pytest.mark.parametrize('value', [
+    None, True, False, 0, 127, 128, 255, 65535, 65536, 2 ** 32, 2 ** 64 - 1, -1, -32, -33, -129, -2 ** 63,
+    1.5, '', 'x' * 31, 'é' * 40, 'y' * 70000, b'\0' * 300, list(range(20)), {'k': [1, {'n': None}]},
+    {str(index): index for index in range(20)},
+])
+def test_msgpack_round_trip(value):
+    assert loads(agent.msgpack_dumps(value)) == value
+
+
+def test_attendance_batch_round_trip():
+    records = sample_records()
+    body, content_type = agent.encode_attendance(records, agent.WIRE_FORMAT_MSGPACK)
+    assert content_type == agent.MSGPACK_CONTENT_TYPE
+    by_device = sorted(records, key=lambda record: record['device_id'])
+    assert expand(loads(body)) == by_device
+
+
+@pytest.mark.parametrize('employee_id, sent', [
+    ('7', 7), ('1001', 1001), ('9223372036854775807', 9223372036854775807),
+    ('0042', '0042'), ('٣', '٣'), ('9223372036854775808', '9223372036854775808'),
+    ('18446744073709551616', '18446744073709551616'), ('A-17', 'A-17'), ('', ''),
+    (1001, 1001), (2 ** 64, '18446744073709551616'),  # Aggregator edges may send integers
+])
+def test_employee_ids_become_integers_only_when_exact(employee_id, sent):
+    record = {'employee_id': employee_id, 'timestamp': '2026-01-01T08:00:00', 'device_id': 1, 'status': 0}
+    batch = agent.compact_attendance_batch([record])
+    employee = batch['groups'][0]['employee_id'][0]
+    assert employee == sent and type(employee) is type(sent)
+    assert loads(agent.msgpack_dumps(batch)) == batch
+
+
+@pytest.mark.parametrize('preference, formats, chosen', [
+    (None, ['json', 'msgpack'], agent.WIRE_FORMAT_MSGPACK),
+    (agent.WIRE_FORMAT_MSGPACK, ['json', 'msgpack'], agent.WIRE_FORMAT_MSGPACK),
+    (agent.WIRE_FORMAT_JSON, ['json', 'msgpack'], agent.WIRE_FORMAT_JSON),
+    (None, ['json'], agent.WIRE_FORMAT_JSON),
+])
+def test_verify_negotiates_the_wire_format(preference, formats, chosen):
+    api = agent.AttenduxAPI('KEY', wire_format=preference)
+    api._record_wire_formats({'valid': True, 'upload_formats': formats})
+    assert api.wire_format == chosen